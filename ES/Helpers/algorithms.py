@@ -4,18 +4,393 @@ import matplotlib.pyplot as plt
 import stumpy
 import os
 import math
+import time
+
+import warnings
 
 import numpy as np
 import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
 from scipy.signal import find_peaks
+from scipy.ndimage import maximum_filter1d, minimum_filter1d
 from sklearn.preprocessing import MinMaxScaler
 import stumpy
+from numba import njit
+
+from metrics import disabled_metrics
+from matching import default_engine, fast_fft_length, find_matches, z_normalize, PreparedSeries
+from column_access import column_values, ColumnSegments
+
+
+def shape_distance(a, b):
+    """
+    Length-normalized z-normalized Euclidean distance between two templates.
+    The longer template is resampled to the length of the shorter one, so templates
+    of slightly different duration can be compared. 0 means identical shape, 2 is the maximum.
+    """
+    length = min(len(a), len(b))
+    a = np.interp(np.linspace(0, len(a) - 1, length), np.arange(len(a)), a)
+    b = np.interp(np.linspace(0, len(b) - 1, length), np.arange(len(b)), b)
+    return np.linalg.norm(z_normalize(a) - z_normalize(b)) / np.sqrt(length)
+
+
+@njit(cache=True)
+def _dtw_scan(series, query, upper, lower, series_upper, series_lower, mu, sigma, r, threshold):
+    # Band-constrained DTW of the z-normalized query against every z-normalized window of the series,
+    # pruned by the LB_Kim and LB_Keogh lower bounds and abandoned early once the threshold is exceeded.
+    # Returns the squared DTW distances (inf for pruned windows) and the pruning counters
+    # [LB_Kim pruned, LB_Keogh pruned, reversed LB_Keogh pruned, DTW abandoned, DTW completed].
+    m = len(query)
+    n_windows = len(series) - m + 1
+    bound = threshold * threshold
+    distances = np.full(n_windows, np.inf)
+    counters = np.zeros(5, dtype=np.int64)
+    previous = np.empty(m)
+    current = np.empty(m)
+    window = np.empty(m)
+    contribution = np.empty(m)
+    reversed_contribution = np.empty(m)
+    remaining = np.zeros(m + 1)
+
+    for i in range(n_windows):
+        if sigma[i] <= 0:
+            continue
+
+        # LB_Kim: the first and last points are always aligned with each other
+        first = (series[i] - mu[i]) / sigma[i]
+        last = (series[i + m - 1] - mu[i]) / sigma[i]
+        lb = (first - query[0]) ** 2 + (last - query[m - 1]) ** 2
+        if lb > bound:
+            counters[0] += 1
+            continue
+
+        # LB_Keogh: distance of the window to the warping envelope of the query
+        lb = 0.0
+        for j in range(m):
+            value = (series[i + j] - mu[i]) / sigma[i]
+            window[j] = value
+            contribution[j] = 0.0
+            if value > upper[j]:
+                contribution[j] = (value - upper[j]) ** 2
+            elif value < lower[j]:
+                contribution[j] = (value - lower[j]) ** 2
+            lb += contribution[j]
+            if lb > bound:
+                break
+        if lb > bound:
+            counters[1] += 1
+            continue
+
+        # Reversed LB_Keogh: distance of the query to the warping envelope of the window. The envelope of the
+        # series, z-normalized with the window statistics, is at least as wide as that of the window alone.
+        reversed_lb = 0.0
+        for j in range(m):
+            reversed_contribution[j] = 0.0
+            high = (series_upper[i + j] - mu[i]) / sigma[i]
+            low = (series_lower[i + j] - mu[i]) / sigma[i]
+            if query[j] > high:
+                reversed_contribution[j] = (query[j] - high) ** 2
+            elif query[j] < low:
+                reversed_contribution[j] = (query[j] - low) ** 2
+            reversed_lb += reversed_contribution[j]
+            if reversed_lb > bound:
+                break
+        if reversed_lb > bound:
+            counters[2] += 1
+            continue
+
+        # Lower bound of the positions not yet reached by a DTW row, for early abandoning. After row j, the
+        # window positions from j + r + 1 on (LB_Keogh) and the query positions from j + 1 on (reversed LB_Keogh)
+        # are unreached; the tighter of the two bounds is used.
+        use_reversed = reversed_lb > lb
+        for j in range(m - 1, -1, -1):
+            remaining[j] = remaining[j + 1] + (reversed_contribution[j] if use_reversed else contribution[j])
+
+        # Full DTW within the band, abandoned as soon as the best partial path plus the lower bound
+        # of the unreached positions exceeds the threshold
+        # Only the band of each row is written; the cells just outside it are set to inf
+        abandoned = False
+        for j in range(m):
+            lo = max(0, j - r)
+            hi = min(m, j + r + 1)
+            if lo > 0:
+                current[lo - 1] = np.inf
+            row_min = np.inf
+            for k in range(lo, hi):
+                cost = (query[j] - window[k]) ** 2
+                if j == 0:
+                    best = 0.0 if k == 0 else current[k - 1]
+                else:
+                    best = previous[k]
+                    if k > 0:
+                        if previous[k - 1] < best:
+                            best = previous[k - 1]
+                        if current[k - 1] < best:
+                            best = current[k - 1]
+                current[k] = cost + best
+                if current[k] < row_min:
+                    row_min = current[k]
+            if hi < m:
+                current[hi] = np.inf
+            if row_min + remaining[j + 1 if use_reversed else hi] > bound:
+                abandoned = True
+                break
+            previous, current = current, previous
+        if abandoned:
+            counters[3] += 1
+            continue
+        counters[4] += 1
+        if previous[m - 1] <= bound:
+            distances[i] = previous[m - 1]
+    return distances, counters
+
+
+@njit(cache=True)
+def _dtw_warp(query, windows, r):
+    # Warps every window onto the time axis of the z-normalized query along its band-constrained DTW path:
+    # sample j of a warped window is the mean of the window samples aligned with query sample j.
+    # The path is computed on the z-normalized window; constant windows are returned unchanged.
+    n_windows, m = windows.shape
+    warped = windows.copy()
+    width = 2 * r + 1
+    cost = np.empty((m, width))  # cost[j, k - j + r] = accumulated cost of aligning query j with window k
+    for w in range(n_windows):
+        window = windows[w]
+        mean = window.mean()
+        std = window.std()
+        if std <= 0:
+            continue
+        for j in range(m):
+            for d in range(width):
+                k = j + d - r
+                if k < 0 or k >= m:
+                    cost[j, d] = np.inf
+                    continue
+                best = 0.0 if j == 0 and k == 0 else np.inf
+                if j > 0:
+                    if d + 1 < width and cost[j - 1, d + 1] < best:
+                        best = cost[j - 1, d + 1]  # (j - 1, k)
+                    if cost[j - 1, d] < best:
+                        best = cost[j - 1, d]  # (j - 1, k - 1)
+                if d > 0 and cost[j, d - 1] < best:
+                    best = cost[j, d - 1]  # (j, k - 1)
+                cost[j, d] = (query[j] - (window[k] - mean) / std) ** 2 + best
+
+        # Backtrack from (m - 1, m - 1) to (0, 0), averaging the window samples per query sample
+        sums = np.zeros(m)
+        counts = np.zeros(m)
+        j = m - 1
+        k = m - 1
+        while True:
+            sums[j] += window[k]
+            counts[j] += 1
+            if j == 0 and k == 0:
+                break
+            d = k - j + r
+            best = np.inf
+            step = 0
+            if j > 0 and k > 0 and cost[j - 1, d] < best:
+                best = cost[j - 1, d]
+                step = 0
+            if j > 0 and d + 1 < width and cost[j - 1, d + 1] < best:
+                best = cost[j - 1, d + 1]
+                step = 1
+            if k > 0 and d > 0 and cost[j, d - 1] < best:
+                step = 2
+            if step == 0:
+                j -= 1
+                k -= 1
+            elif step == 1:
+                j -= 1
+            else:
+                k -= 1
+        warped[w] = sums / counts
+    return warped
+
+
+def _warping_band(warping_window, m):
+    # Sakoe-Chiba band radius in samples, from a fraction of the pattern length (< 1) or a number of samples
+    return int(round(warping_window * m)) if warping_window < 1 else int(warping_window)
+
+
+def dtw_match(pattern, series, warping_window=0.1, max_distance=None, statistics=None):
+    """
+    Finds all non-trivial matches of a pattern in a series under z-normalized, band-constrained DTW.
+
+    :param pattern: Template as 1D array.
+    :param series: Series to search as 1D array.
+    :param warping_window: Width of the Sakoe-Chiba band, as a fraction of the pattern length (< 1) or in samples.
+    :param max_distance: Optional. Maximum DTW distance of a match. Defaults to the cutoff stumpy.match uses
+                         for the Euclidean distance profile, max(mean - 2 std, min), which DTW never exceeds.
+    :param statistics: Optional. Dictionary that is updated with the number of windows pruned by each stage
+                       (LB_Kim, LB_Keogh, reversed LB_Keogh, early abandoned DTW) and the number of full DTWs.
+    :return: Array of [distance, index] rows sorted by distance, in the format of stumpy.match.
+    """
+    pattern = np.asarray(pattern, dtype=float)
+    series = np.asarray(series, dtype=float)
+    m = len(pattern)
+    r = _warping_band(warping_window, m)
+
+    if max_distance is None:
+        euclidean = stumpy.mass(pattern, series)
+        euclidean = euclidean[np.isfinite(euclidean)]
+        max_distance = max(euclidean.mean() - 2 * euclidean.std(), euclidean.min())
+
+    # Warping envelope of the z-normalized query
+    query = z_normalize(pattern)
+    padded = np.pad(query, r, mode='edge')
+    windows = np.lib.stride_tricks.sliding_window_view(padded, 2 * r + 1)
+    upper = windows.max(axis=1)
+    lower = windows.min(axis=1)
+
+    # Mean and standard deviation of every window for the z-normalization
+    cumsum = np.concatenate(([0.0], np.cumsum(series)))
+    cumsum_sq = np.concatenate(([0.0], np.cumsum(np.square(series))))
+    mu = (cumsum[m:] - cumsum[:-m]) / m
+    sigma = np.sqrt(np.maximum((cumsum_sq[m:] - cumsum_sq[:-m]) / m - np.square(mu), 0))
+    sigma[sigma < 1e-8 * max(1.0, np.abs(series).max())] = 0
+
+    # Warping envelope of the raw series for the reversed LB_Keogh
+    series_upper = maximum_filter1d(series, 2 * r + 1, mode='nearest')
+    series_lower = minimum_filter1d(series, 2 * r + 1, mode='nearest')
+
+    distances, counters = _dtw_scan(series, query, upper, lower, series_upper, series_lower, mu, sigma, r,
+                                    max_distance)
+
+    if statistics is not None:
+        for key, count in zip(['windows', 'lb_kim_pruned', 'lb_keogh_pruned', 'lb_keogh_reversed_pruned',
+                               'dtw_abandoned', 'dtw_computed'], [len(distances), *counters.tolist()]):
+            statistics[key] = statistics.get(key, 0) + count
+
+    # Greedily keep the best matches outside each other's exclusion zone, like stumpy.match. Windows shifted by up
+    # to the band width against a cycle still align with it, so the zone is widened by the band width; otherwise
+    # a window straddling two neighbouring cycles is kept as well and can displace them in resolve_overlaps.
+    exclusion_zone = int(np.ceil(m / 4)) + r
+    candidates = np.flatnonzero(np.isfinite(distances))
+    candidates = candidates[np.argsort(distances[candidates], kind='stable')]
+    excluded = np.zeros(len(distances), dtype=bool)
+    matches = []
+    for i in candidates:
+        if excluded[i]:
+            continue
+        matches.append((np.sqrt(distances[i]), i))
+        excluded[max(0, i - exclusion_zone):i + exclusion_zone + 1] = True
+    return np.array(matches, dtype=object).reshape(-1, 2)
+
+
+class Template:
+    def __init__(self, column, job, threshold, samples, fft_length=None):
+        """
+        A job template with the statistics find_motifs compares candidates against.
+
+        :param column: Column (machine) the template belongs to.
+        :param job: Job description, e.g. "OP 40".
+        :param threshold: Relative tolerance of the mean/std checks.
+        :param samples: Template samples as 1D array.
+        :param fft_length: Optional. Length of the series the template will be matched against. If given,
+                           the FFT of the reversed z-normalized template zero-padded to the FFT length the
+                           MASS matching backend uses for such a series is precomputed.
+        """
+        self.column = column
+        self.job = job
+        self.threshold = float(threshold)
+        self.samples = np.asarray(samples, dtype=float)
+
+        # Same statistics as computed on the pattern Series in find_motifs (pandas, ddof=1)
+        pattern = pd.Series(self.samples)
+        self.quarter_index = int(len(pattern) / 4)
+        pre_check_segment = pattern[:self.quarter_index]
+        self.mean = pattern.mean()
+        self.std = pattern.std()
+        self.pre_check_mean = pre_check_segment.mean()
+        self.pre_check_std = pre_check_segment.std()
+
+        self.fft = None
+        if fft_length is not None:
+            self.fft = np.fft.rfft(z_normalize(self.samples)[::-1], n=fast_fft_length(fft_length))
+
+    @classmethod
+    def _from_stored(cls, column, job, threshold, samples, statistics, fft):
+        template = cls.__new__(cls)
+        template.column = column
+        template.job = job
+        template.threshold = float(threshold)
+        template.samples = samples
+        template.quarter_index = int(statistics[0])
+        template.mean, template.std, template.pre_check_mean, template.pre_check_std = statistics[1:]
+        template.fft = fft
+        return template
+
+
+class TemplateLibrary:
+    # Order of the precomputed statistics in the stored statistics matrix
+    STATISTICS = ['quarter_index', 'mean', 'std', 'pre_check_mean', 'pre_check_std']
+
+    def __init__(self, templates=None):
+        """
+        Collection of job templates that can be stored in and loaded from a single .npz file.
+
+        :param templates: Optional. List of Template objects.
+        """
+        self.templates = list(templates or [])
+
+    def add(self, template):
+        self.templates.append(template)
+
+    def __iter__(self):
+        return iter(self.templates)
+
+    def __len__(self):
+        return len(self.templates)
+
+    def save(self, path):
+        """
+        Saves all templates, their samples and their precomputed statistics to one .npz file.
+        """
+        lengths = np.array([len(t.samples) for t in self.templates], dtype=np.int64)
+        fft_lengths = np.array([0 if t.fft is None else len(t.fft) for t in self.templates], dtype=np.int64)
+        np.savez(
+            path,
+            columns=np.array([t.column for t in self.templates], dtype=str),
+            jobs=np.array([t.job for t in self.templates], dtype=str),
+            thresholds=np.array([t.threshold for t in self.templates], dtype=float),
+            statistics=np.array([[t.quarter_index, t.mean, t.std, t.pre_check_mean, t.pre_check_std]
+                                 for t in self.templates], dtype=float).reshape(-1, len(self.STATISTICS)),
+            lengths=lengths,
+            samples=np.concatenate([t.samples for t in self.templates]) if self.templates else np.empty(0),
+            fft_lengths=fft_lengths,
+            ffts=np.concatenate([t.fft for t in self.templates if t.fft is not None]
+                                or [np.empty(0, dtype=complex)]),
+        )
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads a library saved with save, without any preprocessing of the templates.
+        """
+        with np.load(path) as stored:
+            arrays = {key: stored[key] for key in stored.files}
+
+        samples = np.split(arrays['samples'], np.cumsum(arrays['lengths'])[:-1])
+        ffts = np.split(arrays['ffts'], np.cumsum(arrays['fft_lengths'])[:-1])
+        templates = [
+            Template._from_stored(str(column), str(job), threshold, template_samples, statistics,
+                                  fft if fft_length else None)
+            for column, job, threshold, template_samples, statistics, fft, fft_length in zip(
+                arrays['columns'], arrays['jobs'], arrays['thresholds'], samples, arrays['statistics'],
+                ffts, arrays['fft_lengths'])
+        ]
+        return cls(templates)
+
 
 class MotifFinder:
-    def __init__(self, df):
+    def __init__(self, df, metrics=None, engine=None):
         self.df = df
         self.patterns = {}
+        self.templates = {}  # Templates from a TemplateLibrary, independent of self.df
         self.color_map = {}  # Dictionary to manage colors based on job strings
+        self.metrics = metrics or disabled_metrics  # Stage timings and match funnel counters
+        self.engine = engine or default_engine  # Matching backend selection (stumpy, NumPy MASS or naive)
 
     def add_pattern(self, column, input_start, input_end, input_threshold, job):
         if column not in self.patterns:
@@ -27,76 +402,433 @@ class MotifFinder:
     def get_patterns(self):
         return self.patterns
 
-    def find_motifs(self):
-        motif_results = {}
-        for column, patterns in self.patterns.items():
-            if column not in motif_results:
-                motif_results[column] = []
-            df_column = self.df[column].dropna().astype(float)
+    def build_template_library(self, fft_length=None):
+        """
+        Extracts the registered patterns with their precomputed statistics into a TemplateLibrary,
+        so that they can be matched on new data without loading the reference recording.
 
+        :param fft_length: Optional. Precompute the template FFTs for this series length.
+        :return: TemplateLibrary with one template per registered pattern.
+        """
+        library = TemplateLibrary()
+        for column, patterns in self.patterns.items():
+            values = column_values(self.df, column)
             for input_start, input_end, input_threshold, job in patterns:
-                pattern = df_column[input_start:input_end]
+                library.add(Template(column, job, input_threshold,
+                                     self._pattern_samples(column, values, input_start, input_end).copy(),
+                                     fft_length))
+        for templates in self.templates.values():
+            for template in templates:
+                library.add(template)
+        return library
 
-                # Define the pre-check segment (first quarter of the pattern)
-                quarter_index = int(len(pattern) / 4)
-                pre_check_segment = pattern[:quarter_index]
+    def add_templates(self, library):
+        """
+        Registers all templates of a TemplateLibrary (or a path to a saved library) for matching.
+        """
+        if isinstance(library, (str, os.PathLike)):
+            library = TemplateLibrary.load(library)
+        for template in library:
+            if template.column not in self.templates:
+                self.templates[template.column] = []
+            if template.job not in self.color_map:
+                self.color_map[template.job] = len(self.color_map)
+            self.templates[template.column].append(template)
 
-                pattern_mean = pattern.mean()
-                pattern_std = pattern.std()
-                pre_check_mean = pre_check_segment.mean()
-                pre_check_std = pre_check_segment.std()
+    def _pattern_samples(self, column, values, input_start, input_end):
+        samples = values[input_start:input_end]
+        if not np.isfinite(samples).all():
+            raise ValueError(f"The pattern {input_start}:{input_end} of '{column}' contains missing values.")
+        return samples
 
-                profile = stumpy.match(np.asarray(pattern).flatten(), np.asarray(df_column).flatten())
-                indices = profile[:, 1]
+    def _column_templates(self, column, values):
+        # Templates of the registered index ranges, followed by the library templates
+        for input_start, input_end, input_threshold, job in self.patterns.get(column, []):
+            yield Template(column, job, input_threshold, self._pattern_samples(column, values, input_start, input_end))
+        yield from self.templates.get(column, [])
 
-                for i in indices:
-                    motif_end = i + len(pattern)
-                    if motif_end > len(df_column):
-                        continue
-                    motif = df_column[i:motif_end]
+    def _match_column(self, column_data, template, method, warping_window, labels):
+        # Start positions of the matches of one template in all segments of a column, best match first
+        pattern = template.samples
+        if column_data.longest_segment() < len(pattern):
+            return []
+        if method == 'dtw':
+            statistics = {}
+            with self.metrics.stage('match', backend='dtw', **labels):
+                matches = []
+                for start, series in column_data.series:
+                    if len(series) >= len(pattern):
+                        matches.extend((distance, start + index) for distance, index in
+                                       dtw_match(pattern, series.values, warping_window=warping_window,
+                                                 statistics=statistics))
+                matches.sort(key=lambda match: match[0])
+            if self.metrics.enabled:
+                # Pruning funnel of the DTW scan: windows -> lower bounds -> early abandoned -> full DTW
+                for key, count in statistics.items():
+                    self.metrics.count(f"dtw_{key}", count, **labels)
+            return [int(index) for _, index in matches]
+
+        backend = self.engine.select(len(pattern), column_data.longest_segment())
+        with self.metrics.stage('match', backend=backend.name, **labels):
+            profile = column_data.distance_profile(pattern, backend, template)
+            return [int(index) for index in find_matches(profile, len(pattern))[:, 1]]
+
+    @staticmethod
+    def _candidate_statistics(values, indices, template, chunk_elements=1 << 22, return_pre_check=False,
+                              warping_window=None):
+        # Smallest threshold accepting each candidate in the filter of find_motifs, and the candidate energies;
+        # optionally also the smallest threshold passing the pre-check alone. With a warping window (DTW matches)
+        # the checks run on the candidates warped onto the time axis of the template along their DTW paths, so
+        # that the pre-check compares the part of the candidate aligned with the first quarter of the template.
+        m = len(template.samples)
+        quarter_index = template.quarter_index
+        indices = np.asarray(indices, dtype=np.int64)
+        critical = np.empty(len(indices))
+        energies = np.empty(len(indices))
+        pre_checks = np.empty(len(indices))
+        if not len(indices):
+            return (critical, energies, pre_checks) if return_pre_check else (critical, energies)
+        windows = sliding_window_view(values, m)
+        step = max(1, chunk_elements // m)  # Candidates per chunk, bounds the memory of the copied windows
+        if warping_window is not None:
+            query = z_normalize(template.samples)
+            r = _warping_band(warping_window, m)
+        with np.errstate(divide='ignore', invalid='ignore'), warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)  # Empty pre-check segments, as in find_motifs
+            for chunk_start in range(0, len(indices), step):
+                motifs = windows[indices[chunk_start:chunk_start + step]]
+                aligned = motifs if warping_window is None else _dtw_warp(query, motifs, r)
+                pre_check_segments = aligned[:, :quarter_index]
+                pre_check_mean_diff = (np.abs(pre_check_segments.mean(axis=1) - template.pre_check_mean)
+                                       / template.pre_check_mean)
+                pre_check_std_diff = (np.abs(pre_check_segments.std(axis=1, ddof=1) - template.pre_check_std)
+                                      / template.pre_check_std)
+                mean_diff = np.abs(aligned.mean(axis=1) - template.mean) / template.mean
+                std_diff = np.abs(aligned.std(axis=1, ddof=1) - template.std) / template.std
+                motif_means = motifs.mean(axis=1)
+
+                # The pre-check only rejects deviations above the threshold (NaN passes), while the full
+                # check only accepts deviations within the threshold (NaN fails)
+                pre_check = np.fmax(pre_check_mean_diff, pre_check_std_diff)
+                pre_check[np.isnan(pre_check)] = -np.inf
+                full_check = np.maximum(mean_diff, std_diff)
+                full_check[np.isnan(full_check)] = np.inf
+                critical[chunk_start:chunk_start + step] = np.maximum(pre_check, full_check)
+                pre_checks[chunk_start:chunk_start + step] = pre_check
+                energies[chunk_start:chunk_start + step] = np.square(motifs - motif_means[:, None]).sum(axis=1)
+        return (critical, energies, pre_checks) if return_pre_check else (critical, energies)
+
+    def match_candidates(self, method='euclidean', warping_window=0.1, columns=None):
+        """
+        Matches all registered patterns once and keeps every candidate with the smallest threshold
+        at which the mean/std filter of find_motifs would accept it. Thresholds can then be varied
+        without matching again, see threshold_sweep.ThresholdSweep.
+
+        :param method: 'euclidean' or 'dtw', see find_motifs.
+        :param warping_window: Only for 'dtw'. Width of the warping band as a fraction of the pattern length.
+        :param columns: Optional. Only match the patterns of these columns.
+        :return: List with one dictionary per pattern, in the order find_motifs processes them, holding
+                 'column', 'job', 'pattern' (index within the column), 'threshold' (registered threshold),
+                 'length', and the arrays 'starts', 'critical' and 'energies' in candidate order.
+        """
+        if method not in ('euclidean', 'dtw'):
+            raise ValueError("method must be 'euclidean' or 'dtw'.")
+        candidates = []
+        for column in dict.fromkeys([*self.patterns, *self.templates]):
+            if columns is not None and column not in columns:
+                continue
+            with self.metrics.stage('load', column=column):
+                column_data = ColumnSegments(self.df, column)
+            for pattern_index, template in enumerate(self._column_templates(column, column_data.values)):
+                labels = {'column': column, 'job': template.job, 'pattern': pattern_index}
+                starts = np.array(self._match_column(column_data, template, method, warping_window, labels),
+                                  dtype=np.int64)
+                with self.metrics.stage('filter', **labels):
+                    critical, energies = self._candidate_statistics(
+                        column_data.values, starts, template,
+                        warping_window=warping_window if method == 'dtw' else None)
+                candidates.append({**labels, 'threshold': template.threshold, 'length': len(template.samples),
+                                   'starts': starts, 'critical': critical, 'energies': energies})
+        self.metrics.flush()
+        return candidates
+
+    # Seconds per sample and window length of the O(n * m) parts of an approximate discovery (scrump setup and
+    # motif extraction), used until discover_patterns has measured it on the current machine
+    DISCOVERY_SECONDS_PER_ELEMENT = 6e-8
+    # Shortest subsampled window length discover_patterns falls back to
+    MIN_SUBSAMPLED_LENGTH = 8
+
+    def _matrix_profile(self, series, m, approximate, percentage, deadline):
+        # Exact matrix profile, or the anytime approximation refined until the deadline, and the seconds spent
+        # before the first refinement. preSCRIMP cannot be interrupted (minutes for 1e5-1e6 samples), so with a
+        # deadline it is skipped and the refinement steps are made small enough (about 2^22 distances each)
+        # to check the deadline often.
+        started = time.perf_counter()
+        if not approximate:
+            profile = stumpy.stump(series, m)
+            return profile[:, 0].astype(float), profile[:, 1].astype(np.int64), time.perf_counter() - started
+
+        if deadline is not None:
+            percentage = min(percentage, max((1 << 22) / (len(series) ** 2 / 2), 1e-6))
+        approx = stumpy.scrump(series, m, percentage=percentage, pre_scrump=deadline is None)
+        setup_seconds = time.perf_counter() - started
+        for step in range(int(np.ceil(1 / percentage))):
+            # At least one refinement step, the profile is empty before
+            if step and deadline is not None and time.perf_counter() >= deadline:
+                break
+            approx.update()
+        return approx.P_.astype(float), approx.I_.astype(np.int64), setup_seconds
 
-                    # Extract the corresponding pre-check segment
-                    motif_pre_check_segment = motif[:quarter_index]
+    @staticmethod
+    def _block_means(series, factor):
+        # Means of consecutive blocks of factor samples; blocks with a missing sample are missing
+        n_blocks = len(series) // factor
+        return series[:n_blocks * factor].reshape(n_blocks, factor).mean(axis=1)
 
-                    # Compare the pre-check segment
-                    motif_pre_check_mean = motif_pre_check_segment.mean()
-                    motif_pre_check_std = motif_pre_check_segment.std()
-                    pre_check_mean_diff = abs(motif_pre_check_mean - pre_check_mean) / pre_check_mean
-                    pre_check_std_diff = abs(motif_pre_check_std - pre_check_std) / pre_check_std
+    def discover_patterns(self, column, window_lengths, k=3, max_matches=10, dedup_distance=0.5,
+                          time_budget=None, approximate=None, exact_max_length=100000, percentage=0.01,
+                          min_std=None, max_overlap=0.5):
+        """
+        Proposes recurring motifs of a column as candidate patterns using its matrix profile.
 
-                    # If the pre-check segment does not match, skip the motif
-                    if pre_check_mean_diff > input_threshold or pre_check_std_diff > input_threshold:
+        :param column: Column (machine) to search.
+        :param window_lengths: Candidate pattern lengths in samples, e.g. [60, 300, 800].
+        :param k: Number of motifs proposed per window length.
+        :param max_matches: Maximum number of occurrences reported per motif.
+        :param dedup_distance: Candidates whose shape_distance to a better candidate or to an already
+                               registered pattern of the column is below this value are dropped.
+        :param time_budget: Optional. Total time in seconds for the discovery. When set, the approximate anytime
+                            algorithm (stumpy.scrump, without preSCRIMP) is used and the budget is shared evenly
+                            between the window lengths. The scrump setup and the motif extraction cost O(n * m)
+                            and cannot be interrupted, so their time is estimated (from the previous window
+                            length, or DISCOVERY_SECONDS_PER_ELEMENT) and the profile is computed on block means
+                            of the series (subsampled by an integer factor) when they would not fit into half of
+                            the share. The positions of such candidates are then only accurate to the factor.
+                            Window lengths that would have to be subsampled below MIN_SUBSAMPLED_LENGTH, or that
+                            are left when the budget is used up, are skipped with a warning. The budget can be
+                            exceeded by one refinement step (about 2^22 distances), by a wrong estimate and
+                            by the one-time numba compilation of the stumpy kernels in a new process; the exact
+                            matrix profile (approximate=False) ignores it.
+        :param approximate: Optional. Force (True) or disable (False) the approximate algorithm. By default it is
+                            used for series longer than exact_max_length or when a time budget is given.
+        :param exact_max_length: Series length up to which the exact matrix profile (stumpy.stump) is used.
+        :param percentage: Fraction of the distance matrix computed per scrump refinement step.
+        :param min_std: Optional. Windows with a standard deviation up to this value (idle periods) are never
+                        proposed. Defaults to 5 % of the standard deviation of the column.
+        :param max_overlap: Candidates whose window overlaps an occurrence of a better candidate, or of which more
+                            than this fraction of the occurrences overlap such occurrences, are dropped, e.g. the
+                            same repeated region proposed at shifted start positions or with another window length.
+        :return: List of candidate dictionaries with input_start, input_end, length, distance
+                 (matrix profile distance normalized by the square root of the length), occurrences and
+                 subsampling (the factor the profile was computed with, 1 for full resolution), ordered by
+                 distance. input_start/input_end can be passed directly to add_pattern.
+        """
+        # Original positions; windows containing missing samples get an infinite matrix profile distance
+        series = column_values(self.df, column)
+        if min_std is None:
+            min_std = 0.05 * np.nanstd(series)
+        if approximate is None:
+            approximate = time_budget is not None or len(series) > exact_max_length
+        window_lengths = [m for m in window_lengths if 3 <= m <= len(series) // 2]
+
+        candidates = []
+        started = time.perf_counter()
+        seconds_per_element = self.DISCOVERY_SECONDS_PER_ELEMENT
+        for n, m in enumerate(window_lengths):
+            # Share the remaining budget evenly between the remaining window lengths
+            deadline = None
+            factor = 1
+            if time_budget is not None:
+                remaining = time_budget - (time.perf_counter() - started)
+                if remaining <= 0:
+                    warnings.warn(f"Time budget used up, window lengths {window_lengths[n:]} were not searched.")
+                    break
+                share = remaining / (len(window_lengths) - n)
+                if approximate:
+                    # Subsample until the setup and motif extraction fit into half of the share
+                    estimate = seconds_per_element * len(series) * m
+                    factor = max(1, int(np.ceil(np.sqrt(estimate / (share / 2)))))
+                    if m // factor < self.MIN_SUBSAMPLED_LENGTH or len(series) // factor < 2 * (m // factor):
+                        warnings.warn(f"Window length {m} does not fit into the time budget and was not searched.")
                         continue
+                deadline = time.perf_counter() + share
+
+            profile_series = series if factor == 1 else self._block_means(series, factor)
+            profile_m = m // factor
+            P, _, setup_seconds = self._matrix_profile(profile_series, profile_m, approximate, percentage,
+                                                       deadline)
+
+            # Idle periods are near-constant and trivially similar to each other, exclude them
+            motifs_started = time.perf_counter()
+            P[self._rolling_std(profile_series, profile_m) <= min_std] = np.inf
+            finite = P[np.isfinite(P)]
+            if len(finite):
+                cutoff = max(finite.mean() - 2 * finite.std(), finite.min())
+                motif_distances, motif_indices = stumpy.motifs(profile_series, P, max_motifs=k,
+                                                               max_matches=max_matches, cutoff=cutoff)
+            else:
+                motif_distances, motif_indices = [], []
+            if approximate:
+                # Measured cost of the uninterruptible parts, for the estimate of the next window length
+                seconds_per_element = (setup_seconds + time.perf_counter() - motifs_started) / \
+                    (len(profile_series) * profile_m)
+
+            for distances, indices in zip(motif_distances, motif_indices):
+                occurrences = sorted(int(i) * factor for i in indices if i >= 0)
+                if not occurrences:
+                    continue
+                start = int(indices[0]) * factor
+                candidates.append({
+                    'column': column,
+                    'input_start': start,
+                    'input_end': start + m,
+                    'length': m,
+                    # Distance of the motif pair (the first entry is the motif itself)
+                    'distance': float(distances[1] if len(occurrences) > 1 else distances[0]) /
+                                float(np.sqrt(profile_m)),
+                    'occurrences': occurrences,
+                    'subsampling': factor,
+                })
 
-                    # Proceed to compare the full pattern if the pre-check passes
-                    motif_mean = motif.mean()
-                    motif_std = motif.std()
-                    motif_energy = np.sum(np.square(motif - motif_mean))
+        # Deduplicate, keeping the best (lowest distance) candidate: near-identical shapes, and candidates
+        # that mostly cover the same samples as a kept candidate
+        templates = [series[input_start:input_end] for input_start, input_end, _, _ in self.patterns.get(column, [])]
+        covered = np.zeros(len(series), dtype=bool)
+        proposed = []
+        for candidate in sorted(candidates, key=lambda c: c['distance']):
+            m = candidate['length']
+            template = series[candidate['input_start']:candidate['input_end']]
+            if any(self._is_duplicate(template, other, dedup_distance) for other in templates):
+                continue
+            # The window of the candidate itself must not overlap, and at most max_overlap of its occurrences
+            overlapping = sum(covered[start:start + m].any() for start in candidate['occurrences'])
+            if covered[candidate['input_start']:candidate['input_end']].any() or \
+                    overlapping > max_overlap * len(candidate['occurrences']):
+                continue
+            templates.append(template)
+            for start in candidate['occurrences']:
+                covered[start:start + m] = True
+            proposed.append(candidate)
+        return proposed
 
-                    mean_diff = abs(motif_mean - pattern_mean) / pattern_mean
-                    std_diff = abs(motif_std - pattern_std) / pattern_std
+    @staticmethod
+    def _rolling_std(series, m):
+        # Standard deviation of every window of length m, with the blockwise centered sums of PreparedSeries that
+        # stay accurate for large offsets (power in W)
+        series = np.where(np.isfinite(series), series, 0.0)  # Windows with missing samples are excluded anyway
+        return PreparedSeries(series).mean_std(m)[1]
+
+    @staticmethod
+    def _is_duplicate(template, other, max_distance, max_length_ratio=1.2):
+        longer, shorter = max(len(template), len(other)), min(len(template), len(other))
+        if shorter == 0 or longer / shorter > max_length_ratio:
+            return False
+        return shape_distance(template, other) <= max_distance
+
+    def deduplicate_patterns(self, max_distance=0.5):
+        """
+        Removes registered patterns that repeat the shape of an earlier pattern of the same column and job,
+        e.g. the same range registered twice. The kept pattern takes the larger threshold of the two.
+
+        :param max_distance: Maximum shape_distance for two templates to be considered identical.
+        :return: Number of removed patterns.
+        """
+        removed = 0
+        for column, patterns in self.patterns.items():
+            series = column_values(self.df, column)
+            kept = []
+            for input_start, input_end, input_threshold, job in patterns:
+                template = series[input_start:input_end]
+                for n, (kept_start, kept_end, kept_threshold, kept_job) in enumerate(kept):
+                    if kept_job == job and self._is_duplicate(template, series[kept_start:kept_end], max_distance):
+                        kept[n] = (kept_start, kept_end, max(kept_threshold, input_threshold), kept_job)
+                        removed += 1
+                        break
+                else:
+                    kept.append((input_start, input_end, input_threshold, job))
+            self.patterns[column] = kept
+        return removed
 
-                    if mean_diff <= input_threshold and std_diff <= input_threshold:
-                        motif_results[column].append((i, len(pattern), self.color_map[job], job, motif_energy))
+    def find_motifs(self, method='euclidean', warping_window=0.1):
+        """
+        Finds all occurrences of the registered patterns and resolves overlaps.
+
+        :param method: 'euclidean' for fixed-length z-normalized Euclidean matching with the backend self.engine
+                       selects for the pattern and column length (stumpy, NumPy MASS or naive), or 'dtw'
+                       for matching under band-constrained dynamic time warping, which tolerates slightly
+                       stretched cycles so that one template per job covers its variants. DTW matches are
+                       warped onto the pattern along their DTW path before the pre-check and the mean/std
+                       check, so a stretched cycle is compared with the aligned part of the pattern.
+        :param warping_window: Only for 'dtw'. Width of the warping band as a fraction of the pattern length.
+        :return: Dictionary mapping each column to a list of (start, length, color index, job) tuples.
+        """
+        if method not in ('euclidean', 'dtw'):
+            raise ValueError("method must be 'euclidean' or 'dtw'.")
+        metrics = self.metrics
+        motif_results = {}
+        columns = list(dict.fromkeys([*self.patterns, *self.templates]))
+        for column in columns:
+            if column not in motif_results:
+                motif_results[column] = []
+            with metrics.stage('load', column=column):
+                # One float64 view of the column, matched per NaN-free segment in original positions
+                column_data = ColumnSegments(self.df, column)
+                values = column_data.values
+
+            for pattern_index, template in enumerate(self._column_templates(column, values)):
+                job = template.job
+                labels = {'column': column, 'job': job, 'pattern': pattern_index}
+                indices = np.array(self._match_column(column_data, template, method, warping_window, labels),
+                                   dtype=np.int64)
+
+                # Pre-check of the first quarter, then mean/std check of the whole window, both relative to
+                # the pattern (DTW matches warped onto the pattern); the same statistics as match_candidates
+                with metrics.stage('filter', **labels):
+                    critical, energies, pre_check = self._candidate_statistics(
+                        values, indices, template, return_pre_check=True,
+                        warping_window=warping_window if method == 'dtw' else None)
+                    accepted = critical <= template.threshold
+                    motif_results[column].extend(
+                        (start, len(template.samples), self.color_map[job], job, energy) for start, energy in
+                        zip(indices[accepted].tolist(), energies[accepted].tolist()))
+
+                if metrics.enabled:
+                    # Match funnel: candidates -> pre-check -> mean/std check -> accepted
+                    rejected_pre_check = int((pre_check > template.threshold).sum())
+                    metrics.count('motif_candidates', len(indices), **labels)
+                    metrics.count('motif_rejected_pre_check', rejected_pre_check, **labels)
+                    metrics.count('motif_rejected_mean_std', len(indices) - rejected_pre_check - int(accepted.sum()),
+                                  **labels)
+                    metrics.count('motif_accepted', int(accepted.sum()), **labels)
 
         # Process results to resolve overlaps
-        final_results = self.resolve_overlaps(motif_results)
+        with metrics.stage('overlap_resolution'):
+            final_results = self.resolve_overlaps(motif_results)
+
+        if metrics.enabled:
+            # Overlaps are resolved across all patterns of a column, so the drops are counted per column
+            for column, motifs in final_results.items():
+                metrics.count('motif_dropped_overlap', len(motif_results[column]) - len(motifs), column=column)
+            metrics.flush()
         return final_results
 
         
-    def create_jobs_dataframe(self):
+    def create_jobs_dataframe(self, motif_results=None, **find_motifs_kwargs):
+        # Reuse the results of an earlier find_motifs call if given, instead of matching again
+        if motif_results is None:
+            motif_results = self.find_motifs(**find_motifs_kwargs)
         job_dfs = {}
-        for column, motifs in self.find_motifs().items():
-            # Create a copy to prevent modifying the original data
-            col_data = self.df[column].copy()
-            jobs = pd.Series([None] * len(col_data), index=col_data.index)
-
+        for column, motifs in motif_results.items():
+            col_data = self.df[column]
+            # Motif positions are positions in the original column, including missing samples
+            jobs = np.full(len(col_data), None, dtype=object)
             for start, length, _, job in motifs:
-                jobs.iloc[start:start + length] = job
+                jobs[start:start + length] = job
 
+            # The DataFrame constructor copies the column, so the original data is never modified
             job_df = pd.DataFrame({
                 column: col_data,  # Use the column name directly
-                'Job': jobs
+                'Job': pd.Series(jobs, index=col_data.index)
             })
             job_dfs[column] = job_df
             # Optionally, export to CSV or any other format
@@ -107,11 +839,12 @@ class MotifFinder:
         final_results = {}
         for column, results in motif_results.items():
             sorted_results = sorted(results, key=lambda x: x[4], reverse=True)  # Sort by energy
-            used_indices = set()
+            # Samples already covered by a kept motif
+            used = np.zeros(max((start + length for start, length, *_ in results), default=0), dtype=bool)
             final_results[column] = []
             for start, length, color_index, job, energy in sorted_results:
-                if any(i in used_indices for i in range(start, start + length)):
+                if used[start:start + length].any():
                     continue
                 final_results[column].append((start, length, color_index, job))
-                used_indices.update(range(start, start + length))
+                used[start:start + length] = True
         return final_results
\ No newline at end of file
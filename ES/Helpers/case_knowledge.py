@@ -0,0 +1,248 @@
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+
+# Default locations of the case knowledge next to the other knowledge base files
+current_path = os.path.dirname(os.path.abspath(__file__))
+case_knowledge_path = os.path.join(current_path, '..', 'Knowledge_Base', 'Case_Knowledge')
+default_case_knowledge_csv = os.path.join(case_knowledge_path, 'case-knowledge.csv')
+default_case_knowledge_store = os.path.join(case_knowledge_path, 'case-knowledge.sqlite')
+
+# Timestamps are stored as sortable, fixed-width ISO strings with microseconds so that range queries can use
+# the index
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+# Clustered on (Variable, Timestamp): a variable's history is one contiguous index range. Numeric values are
+# stored in value, all others (e.g. recommendations) in text.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS case_knowledge (
+    variable TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    value REAL,
+    unit TEXT,
+    text TEXT,
+    PRIMARY KEY (variable, timestamp)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS case_knowledge_timestamp ON case_knowledge (timestamp);
+"""
+
+COLUMNS = "(variable, timestamp, value, unit, text)"
+
+
+def _format_timestamp(timestamp):
+    timestamp = pd.Timestamp(timestamp)
+    if timestamp.nanosecond:
+        raise ValueError(f"Timestamps are stored with microsecond precision, {timestamp} is finer.")
+    return timestamp.strftime(TIMESTAMP_FORMAT)
+
+
+def _split_value(value):
+    # (numeric value, text) of a case value; missing values are stored as NULL in both columns
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None, None
+    try:
+        return float(value), None
+    except (TypeError, ValueError):
+        return None, str(value)
+
+
+class CaseKnowledgeStore:
+    def __init__(self, path=default_case_knowledge_store):
+        """
+        Opens (and if necessary creates) the indexed case knowledge store.
+
+        :param path: Path of the SQLite database file.
+        """
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+        self._migrate()
+
+        # Similarity index over case vectors, built by build_similarity_index
+        self._tree = None
+        self._case_variables = None
+        self._case_timestamps = None
+        self._case_offset = None
+        self._case_scale = None
+
+    def _migrate(self):
+        # Stores created before text values and microsecond timestamps were supported
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(case_knowledge)")]
+        with self.connection:
+            if 'text' not in columns:
+                self.connection.execute("ALTER TABLE case_knowledge ADD COLUMN text TEXT")
+            self.connection.execute(
+                "UPDATE case_knowledge SET timestamp = timestamp || '.000000' WHERE length(timestamp) = 19")
+
+    def _insert(self, rows, replace):
+        # Rows with an existing (Variable, Timestamp) key raise unless replace is True
+        try:
+            with self.connection:
+                self.connection.executemany(
+                    f"INSERT {'OR REPLACE ' if replace else ''}INTO case_knowledge {COLUMNS} VALUES (?, ?, ?, ?, ?)",
+                    rows)
+        except sqlite3.IntegrityError as error:
+            raise ValueError(f"A case with the same variable and timestamp is already stored ({error}); "
+                             f"pass replace=True to overwrite it.") from None
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def ingest_csv(self, csv_path=default_case_knowledge_csv, chunksize=500000, replace=False):
+        """
+        Ingests a long-format case knowledge file (Timestamp,Variable,Value,Unit) in chunks.
+        Numeric values are stored as numbers, all other values as text.
+
+        :param csv_path: Path of the CSV file.
+        :param chunksize: Number of rows read and inserted per chunk.
+        :param replace: If True, rows with an existing (Variable, Timestamp) key replace the stored case.
+                        Otherwise such rows raise a ValueError and the chunk is not ingested.
+        :return: Number of ingested rows.
+        """
+        n_rows = 0
+        for chunk in pd.read_csv(csv_path, chunksize=chunksize, dtype={'Value': str}):
+            # ISO 8601 with any precision, e.g. whole minutes and fractional seconds in one file
+            chunk['Timestamp'] = pd.to_datetime(chunk['Timestamp'], format='ISO8601')
+            if chunk['Timestamp'].dt.nanosecond.any():
+                raise ValueError("Timestamps are stored with microsecond precision, the file has finer ones.")
+            numbers = pd.to_numeric(chunk['Value'], errors='coerce')
+            texts = chunk['Value'].where(numbers.isna() & chunk['Value'].notna())
+            rows = zip(chunk['Variable'].astype(str),
+                       chunk['Timestamp'].dt.strftime(TIMESTAMP_FORMAT),
+                       numbers.astype(object).where(numbers.notna(), None),
+                       chunk['Unit'].astype(object).where(chunk['Unit'].notna(), None),
+                       texts.astype(object).where(texts.notna(), None))
+            self._insert(rows, replace)
+            n_rows += len(chunk)
+        return n_rows
+
+    def add_case(self, timestamp, values, units=None, replace=False):
+        """
+        Adds one case, i.e. the values of several variables at one timestamp.
+
+        :param timestamp: Time of the case, stored with microsecond precision.
+        :param values: Dictionary mapping variable names to values. Numbers are stored as numbers, all other
+                       values (e.g. a recommendation) as text.
+        :param units: Optional. Dictionary mapping variable names to units.
+        :param replace: If True, values of variables already stored at this timestamp are replaced.
+                        Otherwise they raise a ValueError and nothing of the case is stored.
+        """
+        timestamp = _format_timestamp(timestamp)
+        units = units or {}
+        rows = []
+        for variable, value in values.items():
+            number, text = _split_value(value)
+            rows.append((variable, timestamp, number, units.get(variable), text))
+        self._insert(rows, replace)
+
+    def variables(self):
+        return [row[0] for row in self.connection.execute("SELECT DISTINCT variable FROM case_knowledge")]
+
+    def query(self, variables=None, start=None, end=None):
+        """
+        Reads cases by variable and time range using the (Variable, Timestamp) index.
+
+        :param variables: Optional. Variable name or list of variable names, defaults to all variables.
+        :param start: Optional. Earliest timestamp (inclusive).
+        :param end: Optional. Latest timestamp (inclusive).
+        :return: Long-format DataFrame with the columns Timestamp, Variable, Value and Unit. Value holds
+                 the numbers and the text values.
+        """
+        conditions, params = [], []
+        if variables is not None:
+            if isinstance(variables, str):
+                variables = [variables]
+            conditions.append(f"variable IN ({', '.join('?' * len(variables))})")
+            params += list(variables)
+        if start is not None:
+            conditions.append("timestamp >= ?")
+            params.append(_format_timestamp(start))
+        if end is not None:
+            conditions.append("timestamp <= ?")
+            params.append(_format_timestamp(end))
+
+        query = "SELECT timestamp AS Timestamp, variable AS Variable, COALESCE(value, text) AS Value, unit AS Unit " \
+                "FROM case_knowledge"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        cases = pd.read_sql_query(query + " ORDER BY variable, timestamp", self.connection, params=params)
+        cases['Timestamp'] = pd.to_datetime(cases['Timestamp'])
+        return cases
+
+    def query_wide(self, variables=None, start=None, end=None):
+        """
+        Same as query, but with one row per timestamp and one column per variable.
+        """
+        cases = self.query(variables, start, end)
+        return cases.pivot(index='Timestamp', columns='Variable', values='Value')
+
+    def build_similarity_index(self, variables, normalize=True):
+        """
+        Builds a KD-tree over all cases that have a value for every given variable.
+
+        :param variables: List of variables forming the case vector, e.g. EnPI names.
+        :param normalize: If True, each variable is scaled to [0, 1] over the stored cases.
+        :return: Number of indexed cases.
+        """
+        cases = self.query_wide(variables).reindex(columns=variables).apply(pd.to_numeric, errors='coerce').dropna()
+        matrix = cases.to_numpy(dtype=float)
+
+        offset = np.zeros(len(variables))
+        scale = np.ones(len(variables))
+        if normalize and len(matrix):
+            offset = matrix.min(axis=0)
+            span = matrix.max(axis=0) - offset
+            scale = np.where(span > 0, span, 1.0)
+
+        self._case_variables = list(variables)
+        self._case_timestamps = cases.index
+        self._case_offset = offset
+        self._case_scale = scale
+        self._tree = cKDTree((matrix - offset) / scale) if len(matrix) else None
+        return len(matrix)
+
+    def similar_cases(self, vector, k=5):
+        """
+        Retrieves the k most similar historical cases.
+
+        :param vector: Dictionary mapping the indexed variables to values, or a sequence in their order.
+        :param k: Number of cases to return.
+        :return: DataFrame with the timestamp, distance and all stored variables of each similar case,
+                 ordered by increasing distance.
+        """
+        if self._case_variables is None:
+            raise RuntimeError("Call build_similarity_index before querying similar cases.")
+        if self._tree is None:
+            return pd.DataFrame(columns=['Timestamp', 'Distance'])
+
+        if isinstance(vector, dict):
+            vector = [vector[variable] for variable in self._case_variables]
+        point = (np.asarray(vector, dtype=float) - self._case_offset) / self._case_scale
+
+        k = min(k, self._tree.n)
+        distances, positions = self._tree.query(point, k=k)
+        distances, positions = np.atleast_1d(distances), np.atleast_1d(positions)
+        timestamps = self._case_timestamps[positions]
+
+        # Attach every stored variable of the retrieved cases, e.g. the recommendations given back then
+        keys = [_format_timestamp(timestamp) for timestamp in timestamps]
+        details = pd.read_sql_query(
+            f"SELECT timestamp, variable, COALESCE(value, text) AS value FROM case_knowledge "
+            f"WHERE timestamp IN ({', '.join('?' * len(keys))})",
+            self.connection, params=keys)
+        details = details.pivot(index='timestamp', columns='variable', values='value').reindex(keys)
+        details.columns.name = 'Variable'
+        similar = details.reset_index(drop=True)
+        similar.insert(0, 'Timestamp', timestamps)
+        similar.insert(1, 'Distance', distances)
+        return similar
@@ -0,0 +1,68 @@
+import numpy as np
+
+from matching import PreparedSeries
+
+
+def column_values(df, column):
+    """
+    Values of a DataFrame column as a contiguous float64 array. For float64 columns this is a view
+    of the DataFrame data, not a copy.
+
+    :param df: DataFrame with the recordings.
+    :param column: Column (machine) name.
+    :return: 1D float64 array aligned with the rows of df, NaN where a sample is missing.
+    """
+    return np.ascontiguousarray(df[column].to_numpy(dtype=np.float64, copy=False))
+
+
+def nan_free_segments(values, min_length=1):
+    """
+    Start and end positions of the runs of finite values, e.g. the parts of a recording between sensor dropouts.
+
+    :param values: 1D array.
+    :param min_length: Shorter runs are left out.
+    :return: List of (start, end) tuples, end exclusive.
+    """
+    finite = np.concatenate(([False], np.isfinite(values), [False])).astype(np.int8)
+    edges = np.flatnonzero(np.diff(finite))
+    starts, ends = edges[::2], edges[1::2]
+    keep = ends - starts >= min_length
+    return list(zip(starts[keep].tolist(), ends[keep].tolist()))
+
+
+class ColumnSegments:
+    def __init__(self, df, column):
+        """
+        One column read once and split into NaN-free segments. All positions (matches, motifs) are
+        positions in the original column, so gaps never shift the results.
+
+        :param df: DataFrame with the recordings.
+        :param column: Column (machine) name.
+        """
+        self.column = column
+        self.values = column_values(df, column)
+        self.segments = nan_free_segments(self.values)
+        # Segment views with their cached sliding statistics, shared by all patterns of the column
+        self.series = [(start, PreparedSeries(self.values[start:end])) for start, end in self.segments]
+
+    def __len__(self):
+        return len(self.values)
+
+    def longest_segment(self):
+        return max((end - start for start, end in self.segments), default=0)
+
+    def distance_profile(self, pattern, backend, template=None):
+        """
+        Distance profile of the pattern over the whole column. Windows containing a missing sample are inf.
+
+        :param pattern: Pattern as 1D array.
+        :param backend: MatchingBackend computing the distances within each segment.
+        :param template: Optional. Template of the pattern with precomputed data.
+        :return: 1D array of length len(self) - len(pattern) + 1.
+        """
+        m = len(pattern)
+        profile = np.full(max(len(self.values) - m + 1, 0), np.inf)
+        for start, series in self.series:
+            if len(series) >= m:
+                profile[start:start + len(series) - m + 1] = backend.distance_profile(pattern, series, template)
+        return profile
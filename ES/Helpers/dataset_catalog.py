@@ -0,0 +1,304 @@
+import os
+import sqlite3
+import argparse
+
+import numpy as np
+import pandas as pd
+
+
+# Default location of the measurement catalog next to the other knowledge base files
+current_path = os.path.dirname(os.path.abspath(__file__))
+default_catalog_path = os.path.join(current_path, '..', 'Knowledge_Base', 'Measurements')
+
+# Canonical machine names (as in sample_data.csv) and the other headers used for the same machines
+COLUMN_ALIASES = {
+    'EMAG VLC100 Y': ['EMAG Y'],
+    'MAFAC JAVA': ['Java'],
+    'IVA RH 655': ['IVA RH65'],
+    'EMAG VLC100 GT': ['EMAG GT'],
+    'MAFAC KEA': ['Kea'],
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS settings (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS partitions (
+    machine TEXT NOT NULL,
+    day TEXT NOT NULL,
+    first_sample INTEGER NOT NULL,
+    n_samples INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    PRIMARY KEY (machine, day)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS partitions_day ON partitions (day);
+"""
+
+
+def _alias_key(name):
+    # Aliases match regardless of case and repeated whitespace
+    return ' '.join(str(name).split()).casefold()
+
+
+def alias_map(aliases=None):
+    """
+    Lookup from normalized names to canonical machine names.
+
+    :param aliases: Optional. Dictionary mapping canonical names to lists of aliases, added to COLUMN_ALIASES.
+    :return: Dictionary mapping every canonical name and alias (case-folded) to its canonical name.
+    """
+    lookup = {}
+    for source in (COLUMN_ALIASES, aliases or {}):
+        for canonical, names in source.items():
+            for name in [canonical, *names]:
+                lookup[_alias_key(name)] = canonical
+    return lookup
+
+
+def canonical_column(name, aliases=None):
+    """
+    Canonical machine name of a column header, e.g. "Kea" or "KEA" -> "MAFAC KEA". Unknown names are returned
+    unchanged.
+    """
+    return alias_map(aliases).get(_alias_key(name), name)
+
+
+def read_recording(path, canonical=True):
+    """
+    Reads a recording in the format of the sample and offline measurement data (';' separated, decimal comma,
+    one column per machine, 1 Hz).
+
+    :param path: Path of the CSV file.
+    :param canonical: If True, the columns are renamed to the canonical machine names.
+    :return: DataFrame with one float64 column per machine.
+    """
+    df = pd.read_csv(path, sep=';', header=0, decimal=",", encoding='utf-8-sig')
+    df = df.apply(pd.to_numeric, errors='coerce').astype(np.float64)
+    if canonical:
+        lookup = alias_map()
+        df.columns = [lookup.get(_alias_key(column), column) for column in df.columns]
+    return df
+
+
+class DatasetCatalog:
+    def __init__(self, path=default_catalog_path, sample_rate=1.0, aliases=None):
+        """
+        Opens (and if necessary creates) a catalog of measurements partitioned by machine and day. Every partition
+        is one .npy file with the samples of one machine on one day; an SQLite index holds the machine, day and
+        covered samples of each partition, so that queries only open the partitions they need and read only the
+        requested samples from them (memory mapped).
+
+        :param path: Directory of the catalog.
+        :param sample_rate: Sample rate in Hz of new catalogs. Existing catalogs keep their sample rate.
+        :param aliases: Optional. Dictionary mapping canonical machine names to further aliases.
+        """
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.connection = sqlite3.connect(os.path.join(path, 'catalog.sqlite'))
+        self.connection.executescript(SCHEMA)
+        with self.connection:
+            self.connection.execute("INSERT OR IGNORE INTO settings VALUES ('sample_rate', ?)", (repr(sample_rate),))
+        self.sample_rate = float(self.connection.execute(
+            "SELECT value FROM settings WHERE key = 'sample_rate'").fetchone()[0])
+        # Samples are addressed by their index on a grid starting at the Unix epoch
+        self.period_ns = int(round(1e9 / self.sample_rate))
+        self.samples_per_day = 86400 * 10 ** 9 // self.period_ns
+        self.aliases = alias_map(aliases)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def canonical(self, name):
+        return self.aliases.get(_alias_key(name), name)
+
+    def _sample_index(self, timestamp):
+        return int(round(pd.Timestamp(timestamp).value / self.period_ns))
+
+    def _timestamp(self, sample_index):
+        return pd.Timestamp(sample_index * self.period_ns)
+
+    def _partition_path(self, machine, day):
+        # Relative to the catalog directory, so that the catalog can be moved
+        return os.path.join(machine.replace(os.sep, '_'), f"{day}.npy")
+
+    def _write_partition(self, machine, day, first_sample, values):
+        # Merge with the stored samples of the day; new finite values replace stored ones
+        row = self.connection.execute("SELECT first_sample, n_samples, path FROM partitions "
+                                      "WHERE machine = ? AND day = ?", (machine, day)).fetchone()
+        if row is not None:
+            stored_first, stored_n, path = row
+            merged_first = min(first_sample, stored_first)
+            merged = np.full(max(first_sample + len(values), stored_first + stored_n) - merged_first, np.nan)
+            merged[stored_first - merged_first:stored_first - merged_first + stored_n] = \
+                np.load(os.path.join(self.path, path))
+            target = merged[first_sample - merged_first:first_sample - merged_first + len(values)]
+            np.copyto(target, values, where=~np.isnan(values))
+            first_sample, values = merged_first, merged
+
+        relative_path = self._partition_path(machine, day)
+        path = os.path.join(self.path, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file first so that readers never open a half written partition
+        temporary_path = path + '.tmp.npy'
+        np.save(temporary_path, np.ascontiguousarray(values, dtype=np.float64))
+        os.replace(temporary_path, path)
+        with self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO partitions VALUES (?, ?, ?, ?, ?)",
+                                    (machine, day, int(first_sample), len(values), relative_path))
+
+    def ingest(self, df, start):
+        """
+        Stores a recording without timestamps, e.g. sample_data.csv, given the time of its first row.
+
+        :param df: DataFrame with one column per machine and one row per sample. Column headers are mapped to the
+                   canonical machine names.
+        :param start: Time of the first row.
+        :return: List of the (machine, day) partitions written.
+        """
+        first_sample = self._sample_index(start)
+        # Split the rows at the day boundaries of the sample grid
+        first_day = first_sample // self.samples_per_day
+        last_day = (first_sample + len(df) - 1) // self.samples_per_day
+        boundaries = [max(day * self.samples_per_day, first_sample) for day in range(first_day, last_day + 2)]
+        boundaries[-1] = first_sample + len(df)
+
+        written = []
+        for column in df.columns:
+            machine = self.canonical(column)
+            values = df[column].to_numpy(dtype=np.float64)
+            for day_index, (day_start, day_end) in enumerate(zip(boundaries[:-1], boundaries[1:])):
+                segment = values[day_start - first_sample:day_end - first_sample]
+                if np.isnan(segment).all():
+                    continue
+                day = (first_day + day_index) * self.samples_per_day
+                self._write_partition(machine, self._timestamp(day).strftime('%Y-%m-%d'), day_start - day, segment)
+                written.append((machine, self._timestamp(day).strftime('%Y-%m-%d')))
+        return written
+
+    def ingest_csv(self, path, start):
+        """
+        Stores a CSV recording (see read_recording) given the time of its first row.
+        """
+        return self.ingest(read_recording(path, canonical=False), start)
+
+    def machines(self):
+        return [row[0] for row in self.connection.execute("SELECT DISTINCT machine FROM partitions ORDER BY machine")]
+
+    def _machines_of(self, machines):
+        if machines is None:
+            return self.machines()
+        if isinstance(machines, str):
+            machines = [machines]
+        return list(dict.fromkeys(self.canonical(machine) for machine in machines))
+
+    def partitions(self, machines=None, start=None, end=None):
+        """
+        Partitions matching a machine and time range predicate, read from the index only.
+
+        :param machines: Optional. Machine name or list of names (canonical names or aliases).
+        :param start: Optional. Earliest time (inclusive).
+        :param end: Optional. Latest time (exclusive).
+        :return: DataFrame with machine, day, first_sample, n_samples, path, start and end of every partition.
+        """
+        machines = self._machines_of(machines)
+        conditions = [f"machine IN ({', '.join('?' * len(machines))})"]
+        params = list(machines)
+        if start is not None:
+            conditions.append("day >= ?")
+            params.append(pd.Timestamp(start).strftime('%Y-%m-%d'))
+        if end is not None:
+            conditions.append("day <= ?")
+            params.append(pd.Timestamp(end).strftime('%Y-%m-%d'))
+        partitions = pd.read_sql_query(
+            f"SELECT machine, day, first_sample, n_samples, path FROM partitions WHERE {' AND '.join(conditions)} "
+            "ORDER BY day, machine", self.connection, params=params)
+        partitions['path'] = [os.path.join(self.path, path) for path in partitions['path']]
+        day_starts = pd.to_datetime(partitions['day'])
+        partitions['start'] = day_starts + pd.to_timedelta(partitions['first_sample'] * self.period_ns, unit='ns')
+        partitions['end'] = partitions['start'] + pd.to_timedelta(partitions['n_samples'] * self.period_ns, unit='ns')
+        # Partitions of the last day may end before the start of the range
+        if start is not None:
+            partitions = partitions[partitions['end'] > pd.Timestamp(start)]
+        if end is not None:
+            partitions = partitions[partitions['start'] < pd.Timestamp(end)]
+        return partitions.reset_index(drop=True)
+
+    def time_range(self, machines=None):
+        """
+        Start (inclusive) and end (exclusive) of the stored samples of the machines.
+        """
+        partitions = self.partitions(machines)
+        if partitions.empty:
+            return None, None
+        return partitions['start'].min(), partitions['end'].max()
+
+    def read(self, machines=None, start=None, end=None, last=None, time_index=False):
+        """
+        Reads the samples of some machines in a time range, e.g. catalog.read('KEA', last='7D'). Only the matching
+        partitions are opened, and only the requested samples are read from them.
+
+        :param machines: Optional. Machine name or list of names (canonical names or aliases), defaults to all.
+        :param start: Optional. Earliest time (inclusive), defaults to the first stored sample.
+        :param end: Optional. Latest time (exclusive), defaults to the end of the stored samples.
+        :param last: Optional. Length of the range ending at end, e.g. '7D' or pd.Timedelta(hours=12).
+        :param time_index: If True, the rows are indexed by their timestamps. By default the rows keep a
+                           RangeIndex, as MotifFinder, calculate_EnPIs and the plotters expect; the time of the
+                           first row is in df.attrs['start'].
+        :return: DataFrame with one column per canonical machine name, NaN where no sample is stored.
+        """
+        machines = self._machines_of(machines)
+        if end is None or (start is None and last is None):
+            stored_start, stored_end = self.time_range(machines)
+            if stored_start is None:
+                return pd.DataFrame(columns=machines, dtype=np.float64)
+            end = stored_end if end is None else end
+            start = stored_start if start is None and last is None else start
+        if last is not None:
+            start = pd.Timestamp(end) - pd.Timedelta(last)
+
+        first_sample = self._sample_index(start)
+        end_sample = max(self._sample_index(end), first_sample)
+        values = np.full((end_sample - first_sample, len(machines)), np.nan)
+        columns = {machine: position for position, machine in enumerate(machines)}
+        for partition in self.partitions(machines, start, end).itertuples():
+            partition_first = self._sample_index(partition.day) + partition.first_sample
+            begin = max(partition_first, first_sample)
+            stop = min(partition_first + partition.n_samples, end_sample)
+            if begin >= stop:
+                continue
+            stored = np.load(partition.path, mmap_mode='r')
+            values[begin - first_sample:stop - first_sample, columns[partition.machine]] = \
+                stored[begin - partition_first:stop - partition_first]
+
+        df = pd.DataFrame(values, columns=machines)
+        timestamps = self._timestamp(first_sample)
+        if time_index:
+            df.index = pd.date_range(timestamps, periods=len(df), freq=pd.Timedelta(self.period_ns, unit='ns'))
+        df.attrs['start'] = timestamps
+        df.attrs['sample_rate'] = self.sample_rate
+        return df
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measurement dataset catalog partitioned by machine and day.")
+    parser.add_argument('--catalog', default=default_catalog_path, help="Directory of the catalog.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    ingest_parser = subparsers.add_parser('ingest', help="Store a CSV recording.")
+    ingest_parser.add_argument('csv', help="Recording, one column per machine, ';' separated with decimal comma.")
+    ingest_parser.add_argument('--start', required=True, help="Time of the first row, e.g. '2024-04-23 06:00'.")
+    subparsers.add_parser('list', help="List the stored partitions.")
+    args = parser.parse_args()
+
+    with DatasetCatalog(args.catalog) as catalog:
+        if args.command == 'ingest':
+            written = catalog.ingest_csv(args.csv, args.start)
+            print(f"Stored {len(written)} partitions.")
+        else:
+            print(catalog.partitions()[['machine', 'day', 'start', 'end', 'n_samples']].to_string(index=False))
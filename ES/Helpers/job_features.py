@@ -0,0 +1,154 @@
+import os
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from column_access import column_values
+
+
+# Default location of the example model
+current_path = os.path.dirname(os.path.abspath(__file__))
+example_model_path = os.path.join(current_path, 'MLModels', 'Example_ML_Regression_Model.pmml')
+
+# Features of every job window; duration in hours, energy in kWh, the power statistics in W
+FEATURES = ['duration', 'energy', 'mean', 'std', 'peak', 'pre_check_mean', 'pre_check_std']
+
+
+def job_window_features(df, motif_results, chunk_elements=1 << 22):
+    """
+    Feature matrix of all detected job windows. The energy is read from a cumulative sum, the power statistics
+    are computed for all windows of the same length at once on a sliding window view, so no window is sliced
+    from the DataFrame. The statistics equal the ones find_motifs compares (std with ddof=1, pre-check segment
+    is the first quarter of the window).
+
+    :param df: DataFrame with the recordings.
+    :param motif_results: Dictionary mapping each column to its motifs as returned by find_motifs.
+    :param chunk_elements: Maximum number of samples copied at once, bounds the memory for many windows.
+    :return: DataFrame with one row per window: column, job, start, length and the FEATURES.
+    """
+    tables = []
+    for column, motifs in motif_results.items():
+        if not motifs:
+            continue
+        values = column_values(df, column)
+        starts = np.fromiter((motif[0] for motif in motifs), dtype=np.int64, count=len(motifs))
+        lengths = np.fromiter((motif[1] for motif in motifs), dtype=np.int64, count=len(motifs))
+
+        # Energy of every window with two lookups, as in calculate_EnPIs
+        cumulative_energy = np.concatenate(([0.0], np.nancumsum(values)))
+        features = {
+            'duration': lengths / 3600,
+            'energy': (cumulative_energy[starts + lengths] - cumulative_energy[starts]) / (3600 * 1000),
+        }
+        for name in FEATURES[2:]:
+            features[name] = np.empty(len(motifs))
+
+        # Windows of one template share their length, so each length is one vectorized pass
+        unique_lengths, inverse = np.unique(lengths, return_inverse=True)
+        for group, m in enumerate(unique_lengths.tolist()):
+            rows = np.flatnonzero(inverse == group)
+            windows = sliding_window_view(values, m)
+            quarter_index = int(m / 4)
+            step = max(1, chunk_elements // m)
+            for chunk_start in range(0, len(rows), step):
+                chunk = rows[chunk_start:chunk_start + step]
+                block = windows[starts[chunk]]
+                features['mean'][chunk] = block.mean(axis=1)
+                features['std'][chunk] = block.std(axis=1, ddof=1) if m > 1 else np.nan
+                features['peak'][chunk] = block.max(axis=1)
+                pre_check = block[:, :quarter_index]
+                features['pre_check_mean'][chunk] = pre_check.mean(axis=1) if quarter_index else np.nan
+                features['pre_check_std'][chunk] = pre_check.std(axis=1, ddof=1) if quarter_index > 1 else np.nan
+
+        tables.append(pd.DataFrame({
+            'column': column,
+            'job': [motif[3] for motif in motifs],
+            'start': starts,
+            'length': lengths,
+            **features,
+        }))
+    if not tables:
+        return pd.DataFrame(columns=['column', 'job', 'start', 'length', *FEATURES])
+    return pd.concat(tables, ignore_index=True)
+
+
+def load_model(path=example_model_path):
+    """
+    Loads a PMML model with pypmml, the evaluator of the MLModels, so that every model is scored with the full
+    PMML semantics (preprocessing, targets, all model types).
+
+    :param path: Path of the PMML file.
+    :return: pypmml Model, whose predict method scores a whole DataFrame in one call.
+    """
+    from pypmml import Model
+    return Model.fromFile(path)
+
+
+def score_windows(features, model, inputs=None):
+    """
+    Scores all job windows with a model in one batch call.
+
+    :param features: Feature matrix as returned by job_window_features.
+    :param model: Model with inputNames and a predict method taking a DataFrame, e.g. from load_model.
+    :param inputs: Optional. Dictionary mapping the model input fields to feature columns, for models whose
+                   inputs are named differently than the features.
+    :return: 1D array with the first output of the model for every window.
+    """
+    records = features.rename(columns={feature: field for field, feature in (inputs or {}).items()})
+    # Only the model inputs are handed to the evaluator (for pypmml, to the JVM)
+    predictions = model.predict(records[list(model.inputNames)])
+    return np.asarray(predictions.iloc[:, 0], dtype=float)
+
+
+def flag_deviations(features, expected_energy=None, z_threshold=3.5, tolerance=None):
+    """
+    Flags job windows whose energy deviates from the expected energy.
+
+    :param features: Feature matrix as returned by job_window_features.
+    :param expected_energy: Optional. Expected energy of every window in kWh, e.g. from score_windows.
+                            Defaults to the median energy of the job.
+    :param z_threshold: Windows whose robust z-score (median and median absolute deviation of the residuals of
+                        the job) exceeds this value are flagged.
+    :param tolerance: Optional. Flag by relative deviation from the expected energy instead, e.g. 0.2.
+    :return: Copy of features with the columns expected_energy, deviation (relative), deviation_score
+             (robust z-score) and flagged.
+    """
+    features = features.copy()
+    if expected_energy is None:
+        expected_energy = features.groupby('job')['energy'].transform('median').to_numpy()
+    features['expected_energy'] = expected_energy
+    residuals = features['energy'] - features['expected_energy']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        features['deviation'] = residuals / features['expected_energy']
+
+        # Robust z-score per job; 0.6745 scales the median absolute deviation to the standard deviation
+        centered = residuals - residuals.groupby(features['job']).transform('median')
+        mad = centered.abs().groupby(features['job']).transform('median')
+        features['deviation_score'] = np.where(mad > 0, 0.6745 * centered / mad, 0.0)
+
+    if tolerance is not None:
+        features['flagged'] = features['deviation'].abs() > tolerance
+    else:
+        features['flagged'] = np.abs(features['deviation_score']) > z_threshold
+    return features
+
+
+def score_job_windows(df, motif_results, model=None, inputs=None, z_threshold=3.5, tolerance=None):
+    """
+    Features, expected energy and deviation flags of all detected job windows in one call.
+
+    :param df: DataFrame with the recordings.
+    :param motif_results: Dictionary mapping each column to its motifs as returned by find_motifs.
+    :param model: Optional. Model predicting the energy of a window in kWh from its features, or the path of
+                  a PMML file. Without a model the expected energy is the median energy of the job.
+    :param inputs: Optional. Dictionary mapping the model input fields to feature columns.
+    :param z_threshold: See flag_deviations.
+    :param tolerance: See flag_deviations.
+    :return: DataFrame with one row per window, see job_window_features and flag_deviations.
+    """
+    features = job_window_features(df, motif_results)
+    if isinstance(model, (str, os.PathLike)):
+        model = load_model(model)
+    expected_energy = score_windows(features, model, inputs) if model is not None and len(features) else None
+    return flag_deviations(features, expected_energy, z_threshold, tolerance)
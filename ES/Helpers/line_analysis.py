@@ -0,0 +1,270 @@
+import numpy as np
+import pandas as pd
+
+
+# Stations of the ETA Factory line in the order the parts pass them
+ETA_FACTORY_LINE = ['EMAG VLC100 Y', 'MAFAC JAVA', 'IVA RH 655', 'EMAG VLC100 GT', 'MAFAC KEA']
+
+# Intervals are pairs (starts, ends) of sorted int64 arrays with half-open, disjoint and non-adjacent
+# intervals [start, end) in samples. All operations below sweep over the sorted interval endpoints,
+# so their cost depends on the number of intervals and not on the length of the recording.
+EMPTY = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+
+
+def _sweep(interval_sets, weights):
+    # Step function of the summed weights of all sets: the level levels[k] holds on [positions[k], positions[k + 1]).
+    # A weight is a number for all intervals of its set or an array with one weight per interval.
+    if not len(interval_sets):
+        return EMPTY
+    positions = np.concatenate([part for starts, ends in interval_sets for part in (starts, ends)])
+    deltas = np.concatenate([part for (starts, ends), weight in zip(interval_sets, weights)
+                             for part in (np.broadcast_to(weight, len(starts)), -np.broadcast_to(weight, len(ends)))])
+    if not len(positions):
+        return positions, deltas
+    order = np.argsort(positions, kind='stable')
+    positions = positions[order]
+    levels = np.cumsum(deltas[order])
+    # Several endpoints at the same position: only the level after the last one is in effect
+    last = np.concatenate((positions[1:] != positions[:-1], [True]))
+    return positions[last], levels[last]
+
+
+def _run_indices(mask):
+    # First and one past the last step of every run of steps where mask is True. The last step is the level
+    # after all intervals ended and never part of a run.
+    edges = np.diff(np.concatenate(([0], mask[:-1].astype(np.int8), [0])))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def _runs(positions, mask):
+    # Merged intervals of the steps where mask is True
+    run_starts, run_ends = _run_indices(mask)
+    return positions[run_starts], positions[run_ends]
+
+
+def _motif_intervals(motifs):
+    # Start and end of every motif, not merged
+    starts = np.fromiter((motif[0] for motif in motifs), dtype=np.int64, count=len(motifs))
+    lengths = np.fromiter((motif[1] for motif in motifs), dtype=np.int64, count=len(motifs))
+    return starts, starts + lengths
+
+
+def from_motifs(motifs):
+    """
+    Busy intervals of one machine.
+
+    :param motifs: List of motif tuples whose first two entries are start and length, as returned by find_motifs.
+    :return: Intervals, overlapping and touching motifs merged.
+    """
+    return union(_motif_intervals(motifs))
+
+
+def union(*interval_sets):
+    """
+    Union of any intervals, also overlapping or unsorted ones. The other operations expect intervals as returned
+    by union or the other operations.
+    """
+    positions, levels = _sweep(interval_sets, [1] * len(interval_sets))
+    return _runs(positions, levels > 0) if len(positions) else EMPTY
+
+
+def intersection(*interval_sets):
+    positions, levels = _sweep(interval_sets, [1] * len(interval_sets))
+    return _runs(positions, levels == len(interval_sets)) if len(positions) else EMPTY
+
+
+def difference(intervals, other):
+    # Weights 1 and 2 tell the covered steps apart: level 1 is covered by intervals only
+    positions, levels = _sweep([intervals, other], [1, 2])
+    return _runs(positions, levels == 1) if len(positions) else EMPTY
+
+
+def complement(intervals, start, end):
+    """
+    Parts of [start, end) not covered by intervals, e.g. the idle periods of a machine.
+    """
+    span = (np.array([start], dtype=np.int64), np.array([end], dtype=np.int64))
+    return difference(span, intervals)
+
+
+def total_length(intervals):
+    starts, ends = intervals
+    return int((ends - starts).sum())
+
+
+def to_frame(intervals):
+    """
+    Intervals as DataFrame with the columns start, end and duration (in samples).
+    """
+    starts, ends = intervals
+    return pd.DataFrame({'start': starts, 'end': ends, 'duration': ends - starts})
+
+
+class LineAnalysis:
+    def __init__(self, motif_results, stations=None, n_samples=None, df=None):
+        """
+        Line-wide indicators of a chain of machines from the motif results of all machines, e.g. periods
+        in which the whole line is idle, blocked and starved time per station and concurrent power peaks.
+
+        :param motif_results: Dictionary mapping each column to its motifs as returned by find_motifs.
+        :param stations: Optional. Columns in the order the parts pass them, e.g. ETA_FACTORY_LINE.
+                         Defaults to the order of motif_results.
+        :param n_samples: Optional. Length of the recording in samples. Defaults to len(df), or to the end of
+                          the last motif.
+        :param df: Optional. DataFrame with the recordings, needed for the power based indicators.
+        """
+        self.stations = list(stations or motif_results)
+        self.df = df
+        # Motifs as given, for the concurrent load, and merged to busy periods
+        self.motif_intervals = {station: _motif_intervals(motif_results.get(station, []))
+                                for station in self.stations}
+        self.busy = {station: union(self.motif_intervals[station]) for station in self.stations}
+        if n_samples is None:
+            n_samples = len(df) if df is not None else max(
+                (int(ends[-1]) for _, ends in self.busy.values() if len(ends)), default=0)
+        self.n_samples = n_samples
+        self._idle = {}
+
+    def idle(self, station):
+        if station not in self._idle:
+            self._idle[station] = complement(self.busy[station], 0, self.n_samples)
+        return self._idle[station]
+
+    def all_idle(self):
+        """
+        Periods in which no station of the line runs a job.
+        """
+        return complement(union(*self.busy.values()), 0, self.n_samples)
+
+    def all_busy(self):
+        """
+        Periods in which every station of the line runs a job.
+        """
+        return intersection(*self.busy.values())
+
+    def starved(self, station):
+        """
+        Idle periods of the station while the upstream station runs a job, i.e. the station waits for the part
+        that is machined upstream. The first station is never starved.
+        """
+        position = self.stations.index(station)
+        if position == 0:
+            return EMPTY
+        return intersection(self.idle(station), self.busy[self.stations[position - 1]])
+
+    def blocked(self, station):
+        """
+        Idle periods of the station while the downstream station runs a job and the upstream station does not,
+        i.e. the finished part cannot be passed on. Periods already counted as starved are left out, and the
+        last station is never blocked.
+
+        Both indicators are derived from the power recordings only; buffers between the stations are not known.
+        """
+        position = self.stations.index(station)
+        if position == len(self.stations) - 1:
+            return EMPTY
+        blocked = intersection(self.idle(station), self.busy[self.stations[position + 1]])
+        if position > 0:
+            blocked = difference(blocked, self.busy[self.stations[position - 1]])
+        return blocked
+
+    def station_table(self):
+        """
+        Busy, idle, starved and blocked time of every station.
+
+        :return: DataFrame indexed by station with the times in hours (1 Hz samples) and their shares of the
+                 recording.
+        """
+        rows = {}
+        for station in self.stations:
+            busy = total_length(self.busy[station])
+            starved = total_length(self.starved(station))
+            blocked = total_length(self.blocked(station))
+            rows[station] = {
+                'busy_time': busy / 3600,
+                'idle_time': (self.n_samples - busy) / 3600,
+                'starved_time': starved / 3600,
+                'blocked_time': blocked / 3600,
+                'other_idle_time': (self.n_samples - busy - starved - blocked) / 3600,
+                'busy_share': busy / self.n_samples if self.n_samples else np.nan,
+                'starved_share': starved / self.n_samples if self.n_samples else np.nan,
+                'blocked_share': blocked / self.n_samples if self.n_samples else np.nan,
+            }
+        table = pd.DataFrame.from_dict(rows, orient='index')
+        table.index.name = 'Station'
+        return table
+
+    def line_table(self):
+        """
+        Line-wide indicators: time in which all stations are idle or busy, and the longest all-idle period.
+
+        :return: Dictionary with the times in hours.
+        """
+        all_idle = self.all_idle()
+        return {
+            'total_time': self.n_samples / 3600,
+            'all_idle_time': total_length(all_idle) / 3600,
+            'all_busy_time': total_length(self.all_busy()) / 3600,
+            'longest_all_idle_period': int((all_idle[1] - all_idle[0]).max(initial=0)) / 3600,
+            'all_idle_periods': len(all_idle[0]),
+        }
+
+    def _motif_power(self, station):
+        # Average power of every motif of the station, read from a cumulative sum with two lookups per motif
+        starts, ends = self.motif_intervals[station]
+        cumulative = np.concatenate(([0.0], np.nancumsum(self.df[station].to_numpy(dtype=float))))
+        return (cumulative[ends] - cumulative[starts]) / np.maximum(ends - starts, 1)
+
+    def concurrent_load(self):
+        """
+        Number of stations running a job and, if the recordings are available, the line power estimated from the
+        average power of the running jobs, as step functions over the recording. The motifs of one station must
+        not overlap, as after find_motifs.
+
+        :return: Tuple (positions, stations, power): the values stations[k] and power[k] hold from positions[k]
+                 up to positions[k + 1]. power is None without recordings.
+        """
+        intervals = list(self.motif_intervals.values())
+        positions, stations = _sweep(intervals, [1] * len(intervals))
+        if self.df is None:
+            return positions, stations, None
+        # Same endpoints in the same order, so both step functions share their positions
+        _, power = _sweep(intervals, [self._motif_power(station) for station in self.stations])
+        return positions, stations, np.where(stations > 0, power, 0.0)  # No rounding residue when all idle
+
+    def concurrent_peaks(self, min_stations=2, min_power=None, top=None):
+        """
+        Periods in which at least min_stations stations run jobs at the same time, and optionally the estimated
+        line power is at least min_power.
+
+        :param min_stations: Minimum number of simultaneously running stations.
+        :param min_power: Optional. Minimum estimated line power in W, needs the recordings.
+        :param top: Optional. Only return the top periods, by peak power if available, else by duration.
+        :return: DataFrame with start, end, duration, the maximum number of running stations and, with
+                 recordings, the peak estimated power of every period.
+        """
+        positions, stations, power = self.concurrent_load()
+        if not len(positions):
+            return pd.DataFrame(columns=['start', 'end', 'duration', 'stations'])
+        mask = stations >= min_stations
+        if min_power is not None:
+            if power is None:
+                raise ValueError("min_power needs the recordings, pass df to LineAnalysis.")
+            mask &= power >= min_power
+
+        run_starts, run_ends = _run_indices(mask)
+        # Maximum within every run: reduceat over the run boundaries, every second entry spans a run
+        boundaries = np.column_stack((run_starts, run_ends)).ravel()
+        peaks = pd.DataFrame({
+            'start': positions[run_starts],
+            'end': positions[run_ends],
+            'duration': positions[run_ends] - positions[run_starts],
+            'stations': np.maximum.reduceat(stations, boundaries)[::2] if len(run_starts) else stations[:0],
+        })
+        sort_by = 'duration'
+        if power is not None:
+            peaks['power'] = np.maximum.reduceat(power, boundaries)[::2] if len(run_starts) else power[:0]
+            sort_by = 'power'
+        if top is not None:
+            peaks = peaks.nlargest(top, sort_by).reset_index(drop=True)
+        return peaks
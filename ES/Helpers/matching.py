@@ -0,0 +1,374 @@
+import json
+import time
+import threading
+
+import numpy as np
+import stumpy
+
+
+# Floor of the correlation denominator, as in stumpy
+DENOM_THRESHOLD = 1e-14
+
+
+def z_normalize(values):
+    values = np.asarray(values, dtype=float)
+    std = values.std()
+    return (values - values.mean()) / std if std > 0 else values - values.mean()
+
+
+def fast_fft_length(n):
+    """
+    Smallest even length >= n without prime factors other than 2, 3 and 5, for which the FFT is fast.
+    """
+    n = max(int(n), 2)
+    best = 1 << (n - 1).bit_length()
+    power_5 = 1
+    while power_5 < best:
+        odd = power_5
+        while odd < best:
+            quotient = -(-n // odd)
+            best = min(best, odd << max(1, (quotient - 1).bit_length()))
+            odd *= 3
+        power_5 *= 5
+    return best
+
+
+def find_matches(distance_profile, m, max_distance=None, max_matches=None, atol=1e-8):
+    """
+    Turns a distance profile into matches like stumpy.match: the best windows are taken greedily,
+    each one excluding its neighbours within m/4 samples, until max_distance is exceeded.
+    Unlike stumpy.match, which searches the whole profile again after every match, the candidates
+    are sorted once, so that series with thousands of job cycles stay fast.
+
+    :param distance_profile: Z-normalized Euclidean distance of the pattern to every window of the series.
+    :param m: Pattern length.
+    :param max_distance: Optional. Float or function of the distance profile. Defaults to
+                         max(mean - 2 std, min) of the finite distances, as in stumpy.match.
+    :param max_matches: Optional. Maximum number of matches.
+    :param atol: Absolute tolerance added to max_distance.
+    :return: Array of [distance, index] rows sorted by distance, in the format of stumpy.match.
+    """
+    distances = np.asarray(distance_profile, dtype=float)
+    finite = np.isfinite(distances)
+    if not finite.any():
+        return np.empty((0, 2), dtype=object)
+    if max_distance is None:
+        max_distance = max(distances[finite].mean() - 2 * distances[finite].std(), distances[finite].min())
+    elif callable(max_distance):
+        max_distance = max_distance(distances)
+
+    candidates = np.flatnonzero(finite & (distances <= max_distance + atol))
+    candidates = candidates[np.argsort(distances[candidates], kind='stable')]
+
+    exclusion_zone = int(np.ceil(m / 4))
+    excluded = np.zeros(len(distances), dtype=bool)
+    matches = []
+    for i in candidates:
+        if excluded[i]:
+            continue
+        if max_matches is not None and len(matches) >= max_matches:
+            break
+        matches.append([distances[i], i])
+        excluded[max(0, i - exclusion_zone):i + exclusion_zone + 1] = True
+    return np.array(matches, dtype=object).reshape(-1, 2)
+
+
+def _distance_from_correlation(m, correlation, pattern_constant, window_constant):
+    # Z-normalized Euclidean distance from the Pearson correlation, with the constant window convention of stumpy
+    if pattern_constant:
+        return np.where(window_constant, 0.0, np.sqrt(m))
+    squared = np.abs(2 * m * (1 - np.minimum(correlation, 1.0)))
+    squared[window_constant] = m
+    return np.sqrt(squared)
+
+
+class PreparedSeries:
+    def __init__(self, series):
+        """
+        A finite 1D series with cached sliding statistics and FFTs, shared by all patterns matched
+        against it, e.g. all templates of one column in find_motifs.
+
+        :param series: Series as 1D array without NaN values.
+        """
+        self.values = np.ascontiguousarray(np.asarray(series, dtype=float).ravel())
+        self._cache = {}
+
+    def __len__(self):
+        return len(self.values)
+
+    def cached(self, key, function):
+        """
+        Returns the cached result of function() under key, computing it on the first call.
+        """
+        if key not in self._cache:
+            self._cache[key] = function()
+        return self._cache[key]
+
+    def mean_std(self, m):
+        """
+        Sliding mean and (population) standard deviation of all windows of length m.
+        """
+        return self.cached(('mean_std', m), lambda: self._sliding_mean_std(m))
+
+    def isconstant(self, m):
+        """
+        Boolean array marking the windows of length m whose values are all equal.
+        """
+        def isconstant():
+            changes = np.concatenate(([0], np.cumsum(np.diff(self.values) != 0)))
+            return changes[m - 1:] == changes[:len(changes) - m + 1]
+        return self.cached(('isconstant', m), isconstant)
+
+    def fft(self, length):
+        """
+        Real FFT of the series zero-padded to length.
+        """
+        return self.cached(('fft', length), lambda: np.fft.rfft(self.values, length))
+
+    def _sliding_mean_std(self, m, block=1 << 16):
+        # Cumulative sums per block around the block mean, so the cancellation error stays small
+        # even for near-constant idle windows next to high power job cycles
+        n_windows = len(self.values) - m + 1
+        mean = np.empty(n_windows)
+        std = np.empty(n_windows)
+        step = max(block, m)
+        for start in range(0, n_windows, step):
+            end = min(start + step, n_windows)
+            segment = self.values[start:end + m - 1]
+            offset = segment.mean()
+            deviation = segment - offset
+            cumsum = np.concatenate(([0.0], np.cumsum(deviation)))
+            cumsum_sq = np.concatenate(([0.0], np.cumsum(np.square(deviation))))
+            window_mean = (cumsum[m:] - cumsum[:-m]) / m
+            mean[start:end] = offset + window_mean
+            std[start:end] = np.sqrt(np.maximum((cumsum_sq[m:] - cumsum_sq[:-m]) / m - np.square(window_mean), 0))
+        return mean, std
+
+
+class MatchingBackend:
+    # Name used by MatchingEngine and in the calibration table
+    name = None
+
+    def distance_profile(self, pattern, series, template=None):
+        """
+        Z-normalized Euclidean distance of the pattern to every window of the series.
+
+        :param pattern: Pattern as 1D array.
+        :param series: PreparedSeries to search.
+        :param template: Optional. Template of the pattern with precomputed data, e.g. its FFT.
+        :return: 1D array of length len(series) - len(pattern) + 1.
+        """
+        raise NotImplementedError
+
+    def match(self, pattern, series, max_distance=None, max_matches=None, template=None):
+        """
+        Finds all non-trivial matches of the pattern in the series, see find_matches.
+        """
+        profile = self.distance_profile(pattern, series, template)
+        return find_matches(profile, len(pattern), max_distance, max_matches)
+
+
+class StumpyBackend(MatchingBackend):
+    name = 'stumpy'
+
+    def distance_profile(self, pattern, series, template=None):
+        # Sliding statistics as stumpy computes them, so that the matches equal those of stumpy.match
+        m = len(pattern)
+        mean, std = series.cached(('stumpy', m), lambda: stumpy.core.compute_mean_std(series.values, m))
+        return stumpy.mass(np.asarray(pattern, dtype=float), series.values, M_T=mean, Σ_T=std,
+                           T_subseq_isconstant=series.isconstant(m))
+
+
+class MassBackend(MatchingBackend):
+    name = 'mass'
+
+    def distance_profile(self, pattern, series, template=None):
+        # Sliding dot products of the z-normalized pattern with one FFT convolution (MASS)
+        pattern = np.asarray(pattern, dtype=float)
+        m = len(pattern)
+        n = len(series)
+        window_constant = series.isconstant(m)
+        if np.ptp(pattern) == 0:
+            return _distance_from_correlation(m, None, True, window_constant)
+
+        length = fast_fft_length(n)
+        if template is not None and template.fft is not None and 2 * (len(template.fft) - 1) == length:
+            pattern_fft = template.fft
+        else:
+            pattern_fft = np.fft.rfft(z_normalize(pattern)[::-1], length)
+        products = np.fft.irfft(series.fft(length) * pattern_fft, length)[m - 1:n]
+
+        _, std = series.mean_std(m)
+        correlation = products / np.maximum(m * std, DENOM_THRESHOLD)
+        return _distance_from_correlation(m, correlation, False, window_constant)
+
+
+class NaiveBackend(MatchingBackend):
+    name = 'naive'
+
+    def __init__(self, chunk_size=2 ** 22):
+        """
+        Reference backend computing every window distance directly, in O(n m).
+
+        :param chunk_size: Approximate number of samples z-normalized at once, to bound the memory.
+        """
+        self.chunk_size = chunk_size
+
+    def distance_profile(self, pattern, series, template=None):
+        pattern = np.asarray(pattern, dtype=float)
+        m = len(pattern)
+        window_constant = series.isconstant(m)
+        if np.ptp(pattern) == 0:
+            return _distance_from_correlation(m, None, True, window_constant)
+
+        query = z_normalize(pattern)
+        windows = np.lib.stride_tricks.sliding_window_view(series.values, m)
+        distances = np.empty(len(windows))
+        step = max(1, self.chunk_size // m)
+        for start in range(0, len(windows), step):
+            chunk = windows[start:start + step]
+            std = chunk.std(axis=1, keepdims=True)
+            normalized = (chunk - chunk.mean(axis=1, keepdims=True)) / np.where(std > 0, std, 1)
+            distances[start:start + step] = np.sqrt(np.square(normalized - query).sum(axis=1))
+        distances[window_constant] = np.sqrt(m)
+        return distances
+
+
+class MatchingEngine:
+    def __init__(self, backend='auto', backends=None, candidates=('mass', 'stumpy'), calibration=None,
+                 repeats=3, max_calibration_length=1 << 17):
+        """
+        Matches patterns in series with one of several interchangeable backends.
+
+        :param backend: Name of the backend to use, or 'auto' to use the fastest backend for each
+                        (pattern length, series length) combination according to the calibration.
+        :param backends: Optional. List of MatchingBackend objects, defaults to stumpy, NumPy MASS and naive.
+        :param candidates: Backends considered by 'auto'. The naive backend is only a reference.
+        :param calibration: Optional. Path of a calibration saved with save_calibration.
+        :param repeats: Number of timed runs per backend when calibrating.
+        :param max_calibration_length: Longest series timed when calibrating on the fly. The costs of all
+                                       backends grow about linearly with the series length.
+
+        The engine can be shared between threads; calibrating and selecting hold a lock. Set on_the_fly to
+        False after calibrating upfront to always use the nearest calibrated combination instead.
+        """
+        backends = backends or [StumpyBackend(), MassBackend(), NaiveBackend()]
+        self.backends = {b.name: b for b in backends}
+        if backend != 'auto' and backend not in self.backends:
+            raise ValueError(f"Unknown matching backend '{backend}', choose from {list(self.backends)}.")
+        self.backend = backend
+        self.candidates = [name for name in candidates if name in self.backends]
+        self.repeats = repeats
+        self.max_calibration_length = max_calibration_length
+        self.calibration = {}  # (log2 pattern length, log2 series length) -> backend name
+        self.timings = {}  # (pattern length, series length) -> {backend name: seconds}
+        self.on_the_fly = True
+        self._lock = threading.RLock()
+        if calibration is not None:
+            self.load_calibration(calibration)
+
+    @staticmethod
+    def _bucket(m, n):
+        return int(round(np.log2(m))), int(round(np.log2(n)))
+
+    def calibrate(self, pattern_lengths, series_lengths, seed=0, max_length=None):
+        """
+        Times the candidate backends on random walks of every (pattern length, series length) combination
+        and records the fastest one. Combinations that were not calibrated use the nearest calibrated one.
+
+        :param pattern_lengths: Pattern lengths, e.g. (70, 160, 800, 3600) for the ETA Factory jobs.
+        :param series_lengths: Series lengths, e.g. (1e4, 1e5, 1e6).
+        :param seed: Random seed of the generated series.
+        :param max_length: Optional. Time on at most this many samples, but record the result for the
+                           full series length.
+        :return: Dictionary mapping (pattern length, series length) to {backend name: seconds}.
+        """
+        with self._lock:
+            return self._calibrate(pattern_lengths, series_lengths, seed, max_length)
+
+    def _calibrate(self, pattern_lengths, series_lengths, seed, max_length):
+        rng = np.random.default_rng(seed)
+        timings = {}
+        for n in series_lengths:
+            n = int(n)
+            values = np.cumsum(rng.standard_normal(min(n, max_length or n)))
+            for m in pattern_lengths:
+                m = int(m)
+                if m > len(values):
+                    continue
+                start = int(rng.integers(len(values) - m + 1))
+                pattern = values[start:start + m].copy()
+                timings[(m, n)] = {}
+                for name in self.candidates:
+                    backend = self.backends[name]
+                    backend.match(pattern, PreparedSeries(values[:2 * m]))  # Warm up the JIT compilation
+                    best = np.inf
+                    for _ in range(self.repeats):
+                        # A fresh series per run, so the sliding statistics of the pattern length are included
+                        start_time = time.perf_counter()
+                        backend.match(pattern, PreparedSeries(values))
+                        best = min(best, time.perf_counter() - start_time)
+                        if best > 2 * min(timings[(m, n)].values(), default=np.inf):
+                            break  # Clearly slower than the best backend so far
+                    timings[(m, n)][name] = best
+                self.calibration[self._bucket(m, n)] = min(timings[(m, n)], key=timings[(m, n)].get)
+        self.timings.update(timings)
+        return timings
+
+    def select(self, m, n):
+        """
+        Returns the backend used for a pattern of length m in a series of length n. With 'auto', a
+        combination far from every calibrated one is calibrated on the fly, unless on_the_fly is False.
+        """
+        if self.backend != 'auto':
+            return self.backends[self.backend]
+        if len(self.candidates) == 1:
+            return self.backends[self.candidates[0]]
+
+        bucket = self._bucket(m, n)
+        with self._lock:
+            if bucket not in self.calibration:
+                nearest = min(self.calibration, default=None,
+                              key=lambda calibrated: abs(calibrated[0] - bucket[0]) + abs(calibrated[1] - bucket[1]))
+                close = nearest is not None and abs(nearest[0] - bucket[0]) <= 1 and abs(nearest[1] - bucket[1]) <= 1
+                if close or (nearest is not None and not self.on_the_fly):
+                    bucket = nearest
+                else:
+                    self._calibrate([m], [n], 0, max(self.max_calibration_length, 2 * m))
+            return self.backends[self.calibration[bucket]]
+
+    def match(self, pattern, series, max_distance=None, max_matches=None, template=None, backend=None):
+        """
+        Finds all non-trivial matches of a pattern in a series, in the format of stumpy.match.
+
+        :param pattern: Pattern as 1D array.
+        :param series: 1D array or PreparedSeries. Prepare a series once when matching several patterns.
+        :param max_distance: Optional. Maximum distance of a match, see find_matches.
+        :param max_matches: Optional. Maximum number of matches.
+        :param template: Optional. Template of the pattern with precomputed data.
+        :param backend: Optional. Name of a backend overriding the selection.
+        :return: Array of [distance, index] rows sorted by distance.
+        """
+        if not isinstance(series, PreparedSeries):
+            series = PreparedSeries(series)
+        chosen = self.backends[backend] if backend else self.select(len(pattern), len(series))
+        return chosen.match(pattern, series, max_distance, max_matches, template)
+
+    def save_calibration(self, path):
+        """
+        Saves the calibration as JSON, so that it can be reused on the same machine.
+        """
+        with self._lock:
+            calibration = sorted(self.calibration.items())
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump([[m, n, name] for (m, n), name in calibration], file, indent=1)
+
+    def load_calibration(self, path):
+        with open(path, 'r', encoding='utf-8') as file:
+            calibration = {(m, n): name for m, n, name in json.load(file)}
+        with self._lock:
+            self.calibration.update(calibration)
+
+
+# Shared engine, calibrated on the fly for the pattern and series lengths it is used with
+default_engine = MatchingEngine()
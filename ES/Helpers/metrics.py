@@ -0,0 +1,198 @@
+import os
+import json
+import time
+import tracemalloc
+from contextlib import nullcontext
+
+
+class InMemorySink:
+    def __init__(self):
+        """
+        Keeps all metric records in a list, e.g. for inspection in a notebook.
+        """
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class JsonLinesSink:
+    def __init__(self, path):
+        """
+        Appends every metric record as one JSON object per line.
+
+        :param path: Path of the JSON lines file.
+        """
+        self.path = path
+        self.file = open(path, 'a', encoding='utf-8')
+
+    def emit(self, record):
+        self.file.write(json.dumps(record) + '\n')
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+class PrometheusTextSink:
+    def __init__(self, path, prefix='es4ee'):
+        """
+        Aggregates the metric records and writes them in the Prometheus text exposition format,
+        e.g. for the textfile collector of the node exporter. The file is rewritten on flush.
+
+        :param path: Path of the .prom file.
+        :param prefix: Prefix of all metric names.
+        """
+        self.path = path
+        self.prefix = prefix
+        self.samples = {}  # (metric name, sorted labels) -> value
+
+    @staticmethod
+    def _labels(labels):
+        return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def _add(self, name, labels, value, aggregate=sum):
+        key = (f"{self.prefix}_{name}", self._labels(labels))
+        self.samples[key] = aggregate((self.samples[key], value)) if key in self.samples else value
+
+    def emit(self, record):
+        labels = dict(record['labels'])
+        if record['type'] == 'stage':
+            labels['stage'] = record['name']
+            self._add('stage_seconds_total', labels, record['seconds'])
+            self._add('stage_calls_total', labels, 1)
+            if record.get('peak_memory_bytes') is not None:
+                self._add('stage_peak_memory_bytes', labels, record['peak_memory_bytes'], aggregate=max)
+        else:
+            self._add(f"{record['name']}_total", labels, record['value'])
+
+    def flush(self):
+        lines = []
+        for (name, labels), value in sorted(self.samples.items()):
+            label_text = ','.join('{}="{}"'.format(key, value.replace('\\', '\\\\').replace('"', '\\"'))
+                                  for key, value in labels)
+            lines.append(f"{name}{{{label_text}}} {value}")
+        # Write to a temporary file first so that scrapers never read a half written file
+        temporary_path = self.path + '.tmp'
+        with open(temporary_path, 'w', encoding='utf-8') as file:
+            file.write('\n'.join(lines) + '\n')
+        os.replace(temporary_path, self.path)
+
+    def close(self):
+        self.flush()
+
+
+class _Stage:
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+        self.peak = 0
+
+    def __enter__(self):
+        if self.metrics.memory:
+            stack = self.metrics._stack
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:
+                # Keep the peak of the enclosing stage before the peak is reset for this stage
+                stack[-1].peak = max(stack[-1].peak, peak)
+            tracemalloc.reset_peak()
+            self.start_memory = current
+            stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        seconds = time.perf_counter() - self.start
+        peak_memory = None
+        if self.metrics.memory:
+            self.metrics._stack.pop()
+            self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+            if self.metrics._stack:
+                parent = self.metrics._stack[-1]
+                parent.peak = max(parent.peak, self.peak)
+            peak_memory = max(self.peak - self.start_memory, 0)
+        self.metrics.sink.emit({
+            'type': 'stage',
+            'name': self.name,
+            'labels': self.labels,
+            'seconds': seconds,
+            'peak_memory_bytes': peak_memory,
+            'timestamp': time.time(),
+        })
+        return False
+
+
+class Metrics:
+    def __init__(self, sink=None, memory=False):
+        """
+        Collects stage timings, peak memory and counters and passes them to a sink.
+        Without a sink all calls return immediately, so instrumented code runs at full speed.
+
+        :param sink: Optional. InMemorySink, JsonLinesSink, PrometheusTextSink or any object with emit/flush.
+        :param memory: If True, the peak memory allocated during each stage is traced with tracemalloc.
+        """
+        self.sink = sink
+        self.memory = memory and sink is not None
+        self._stack = []
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @property
+    def enabled(self):
+        return self.sink is not None
+
+    def stage(self, name, **labels):
+        """
+        Context manager timing one stage, e.g. with metrics.stage('match', column=column): ...
+        """
+        if self.sink is None:
+            return nullcontext()
+        return _Stage(self, name, labels)
+
+    def count(self, name, value=1, **labels):
+        """
+        Adds value to the counter name, e.g. metrics.count('candidates', 12, column=column, job=job).
+        """
+        if self.sink is None:
+            return
+        self.sink.emit({'type': 'counter', 'name': name, 'labels': labels, 'value': value,
+                        'timestamp': time.time()})
+
+    def flush(self):
+        if self.sink is not None:
+            self.sink.flush()
+
+    def close(self):
+        """
+        Flushes and closes the sink, e.g. the file of a JsonLinesSink. Sinks without close are only flushed.
+        """
+        if self.sink is not None:
+            getattr(self.sink, 'close', self.sink.flush)()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+# Shared disabled instance used when no metrics are requested
+disabled_metrics = Metrics()
@@ -0,0 +1,423 @@
+import os
+import time
+import queue
+import argparse
+import threading
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from algorithms import MotifFinder, Template, TemplateLibrary
+from matching import MatchingEngine
+from metrics import Metrics, JsonLinesSink, PrometheusTextSink, disabled_metrics
+from dataset_catalog import read_recording
+import data_point_addresses
+
+
+# Default recording next to this script
+current_path = os.path.dirname(os.path.abspath(__file__))
+default_recording = os.path.join(current_path, 'offline_measurement_data.csv')
+
+
+def replay_node_ids(columns, machines=1, configured=None):
+    """
+    NodeIDs under which the replayed columns are served. The NodeIDs configured in data_point_addresses.py are
+    used first, in the order machine 1 column 1, machine 1 column 2, ...; the remaining nodes get string
+    NodeIDs in the namespace of the first configured NodeID, e.g. "ns=4;s=Replay.Machine2.EMAG Y".
+
+    :param columns: Column names of the recording.
+    :param machines: Number of replayed machines.
+    :param configured: Optional. NodeIDs to use first, defaults to data_point_addresses.node_ids.
+    :return: List of lists, node_ids[machine][column].
+    """
+    configured = list(data_point_addresses.node_ids if configured is None else configured)
+    namespace = configured[0].split(';')[0] if configured and configured[0].startswith('ns=') else 'ns=1'
+    node_ids = []
+    for machine in range(machines):
+        machine_node_ids = []
+        for column in columns:
+            position = machine * len(columns) + len(machine_node_ids)
+            machine_node_ids.append(configured[position] if position < len(configured)
+                                    else f"{namespace};s=Replay.Machine{machine + 1}.{column}")
+        node_ids.append(machine_node_ids)
+    return node_ids
+
+
+class Subscription:
+    def __init__(self, node_ids, node_indices, queue_size):
+        """
+        Data change subscription on a set of nodes. Notifications wait in a bounded queue until the client
+        collects them; when the queue is full the oldest samples are discarded, as for OPC UA monitored items
+        with discardOldest.
+
+        :param node_ids: Subscribed NodeIDs.
+        :param node_indices: Positions of the nodes in the address space of the server.
+        :param queue_size: Maximum number of queued samples per monitored item.
+        """
+        self.node_ids = list(node_ids)
+        self.node_indices = np.asarray(node_indices)
+        self.queue_size = queue_size
+        self.dropped = 0  # Samples discarded per monitored item
+        self._messages = deque()  # (first sample index, values (samples x nodes), publish time)
+        self._pending = 0
+        self._condition = threading.Condition()
+        self.closed = False
+
+    def _push(self, first_index, values, publish_time):
+        with self._condition:
+            self._messages.append((first_index, values[:, self.node_indices], publish_time))
+            self._pending += len(values)
+            # Discard the oldest samples until the queue fits again
+            while self._pending > self.queue_size:
+                first, oldest, oldest_time = self._messages[0]
+                excess = min(self._pending - self.queue_size, len(oldest))
+                if excess == len(oldest):
+                    self._messages.popleft()
+                else:
+                    self._messages[0] = (first + excess, oldest[excess:], oldest_time)
+                self._pending -= excess
+                self.dropped += excess
+            self._condition.notify()
+
+    def _close(self):
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+
+    def collect(self, timeout=None):
+        """
+        Waits for notifications and returns all queued ones.
+
+        :param timeout: Optional. Maximum time to wait in seconds.
+        :return: List of (first sample index, values (samples x nodes), publish time). Empty after a timeout or
+                 when the subscription was closed and all notifications were collected.
+        """
+        with self._condition:
+            if not self._messages and not self.closed:
+                self._condition.wait(timeout)
+            messages = list(self._messages)
+            self._messages.clear()
+            self._pending = 0
+        return messages
+
+
+class ReplayServer:
+    def __init__(self, df, machines=1, speedup=1.0, node_ids=None, publishing_interval=0.05, sample_rate=1.0):
+        """
+        In-process stand-in for the OPC UA server of the line: plays a recording back under the configured NodeIDs
+        and publishes data changes to its subscriptions. Further machines replay the same recording shifted by
+        len(df) / machines samples each, so their cycles do not coincide.
+
+        :param df: Recording with one column per data point.
+        :param machines: Number of replayed machines.
+        :param speedup: Replay speed relative to real time, e.g. 1000 for 1000 samples per second at 1 Hz.
+        :param node_ids: Optional. node_ids[machine][column], defaults to replay_node_ids.
+        :param publishing_interval: Wall time in seconds between two publish cycles.
+        :param sample_rate: Sample rate of the recording in Hz.
+        """
+        self.columns = list(df.columns)
+        self.values = df.to_numpy(dtype=np.float64)
+        self.machines = machines
+        self.speedup = speedup
+        self.publishing_interval = publishing_interval
+        self.sample_rate = sample_rate
+        self.node_ids = node_ids or replay_node_ids(self.columns, machines)
+        self.address_space = {node_id: index for index, node_id in
+                              enumerate(node_id for machine in self.node_ids for node_id in machine)}
+        # Row of the recording each machine starts with
+        self.offsets = np.arange(machines) * (len(self.values) // machines)
+
+        self.published = 0  # Number of published samples per node
+        self.started = None
+        self._current = np.full(len(self.address_space), np.nan)
+        self._subscriptions = []
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def browse(self):
+        return list(self.address_space)
+
+    def read(self, node_id):
+        """
+        Current value of a node, NaN before the first publish cycle.
+        """
+        with self._lock:
+            return float(self._current[self.address_space[node_id]])
+
+    def subscribe(self, node_ids, queue_size=10000):
+        """
+        Creates a data change subscription.
+
+        :param node_ids: NodeIDs to monitor.
+        :param queue_size: Maximum number of queued samples per monitored item.
+        :return: Subscription.
+        """
+        subscription = Subscription(node_ids, [self.address_space[node_id] for node_id in node_ids], queue_size)
+        with self._lock:
+            self._subscriptions.append(subscription)
+        return subscription
+
+    def _rows(self, first_index, last_index):
+        # Values of all nodes for the samples first_index ... last_index - 1, machine after machine
+        rows = (np.arange(first_index, last_index)[:, None] + self.offsets[None, :]) % len(self.values)
+        return self.values[rows].reshape(last_index - first_index, -1)
+
+    def _run(self, n_samples):
+        interval = self.publishing_interval
+        next_publish = self.started
+        while not self._stop.is_set() and self.published < n_samples:
+            next_publish += interval
+            self._stop.wait(max(next_publish - time.perf_counter(), 0))
+            now = time.perf_counter()
+            due = min(n_samples, int((now - self.started) * self.speedup * self.sample_rate))
+            if due <= self.published:
+                continue
+            values = self._rows(self.published, due)
+            with self._lock:
+                self._current = values[-1]
+                subscriptions = list(self._subscriptions)
+            for subscription in subscriptions:
+                subscription._push(self.published, values, now)
+            self.published = due
+        for subscription in self._subscriptions:
+            subscription._close()
+
+    def start(self, n_samples=None):
+        """
+        Starts the playback in a background thread.
+
+        :param n_samples: Optional. Number of samples to play per node, defaults to the length of the recording.
+        """
+        n_samples = len(self.values) if n_samples is None else n_samples
+        self.started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, args=(n_samples,), daemon=True)
+        self._thread.start()
+
+    def join(self, timeout=None):
+        self._thread.join(timeout)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+class ReplayHarness:
+    def __init__(self, df, templates, machines=1, speedup=100.0, window_length=3600, analysis_step=300,
+                 queue_size=10000, publishing_interval=0.05, engine=None, metrics=None):
+        """
+        Load test of acquisition and analysis: one client per machine ingests the replayed data points of its
+        machine and a detection thread matches the templates on the latest window whenever enough new samples
+        have arrived.
+
+        :param df: Recording with one column per data point.
+        :param templates: TemplateLibrary whose template columns are column names of df.
+        :param machines: Number of replayed machines.
+        :param speedup: Replay speed relative to real time.
+        :param window_length: Samples per detection window.
+        :param analysis_step: New samples of a machine after which its window is analyzed again.
+        :param queue_size: Queue size per monitored item in samples.
+        :param publishing_interval: Wall time in seconds between two publish cycles.
+        :param engine: Optional. MatchingEngine of the detection.
+        :param metrics: Optional. Metrics for the detection stages and the ingest counters.
+        """
+        self.df = df
+        # Templates of other recordings (other column names) cannot be matched here
+        self.templates = TemplateLibrary([template for template in templates if template.column in df.columns])
+        self.window_length = window_length
+        self.analysis_step = analysis_step
+        self.engine = engine or MatchingEngine()
+        # Select the matching backends before the replay, so that the calibration is not measured as latency
+        pattern_lengths = sorted({len(template.samples) for template in self.templates})
+        if pattern_lengths and self.engine.backend == 'auto':
+            self.engine.calibrate(pattern_lengths, [window_length])
+        self.metrics = metrics or disabled_metrics
+        self.server = ReplayServer(df, machines, speedup, publishing_interval=publishing_interval)
+        self.subscriptions = [self.server.subscribe(node_ids, queue_size) for node_ids in self.server.node_ids]
+
+        n_samples = len(df)
+        columns = self.server.columns
+        # Received samples of every machine at their sample index, NaN where a sample never arrived
+        self.buffers = [np.full((n_samples, len(columns)), np.nan) for _ in range(machines)]
+        self.received = [np.zeros(n_samples, dtype=bool) for _ in range(machines)]
+        self.publish_times = [np.full(n_samples, np.nan) for _ in range(machines)]
+        self.ingested = [0] * machines
+        self.detections = []  # (machine, column, start, length, job, latency in s)
+        self._jobs = queue.Queue()
+
+    def _ingest(self, machine):
+        subscription = self.subscriptions[machine]
+        buffer = self.buffers[machine]
+        received = self.received[machine]
+        publish_times = self.publish_times[machine]
+        analyzed = 0
+        while True:
+            messages = subscription.collect(timeout=1.0)
+            if not messages:
+                if subscription.closed:
+                    break
+                continue
+            for first_index, values, publish_time in messages:
+                last_index = first_index + len(values)
+                buffer[first_index:last_index] = values
+                received[first_index:last_index] = True
+                publish_times[first_index:last_index] = publish_time
+                self.ingested[machine] += len(values)
+                end = last_index
+            if end - analyzed >= self.analysis_step:
+                self._jobs.put((machine, end))
+                analyzed = end
+        self._jobs.put((machine, None))  # Final window with the tail of the recording
+
+    def _detect(self, machine, end, seen):
+        start = max(end - self.window_length, 0)
+        window = pd.DataFrame(self.buffers[machine][start:end], columns=self.server.columns)
+        finder = MotifFinder(window, engine=self.engine)
+        finder.add_templates(self.templates)
+        with self.metrics.stage('detect', machine=machine):
+            motif_results = finder.find_motifs()
+        detected_at = time.perf_counter()
+        for column, motifs in motif_results.items():
+            for motif_start, length, _, job in motifs:
+                key = (column, start + motif_start)
+                if key in seen:
+                    continue
+                seen.add(key)
+                # Latency from the publish cycle of the last received sample of the cycle to its detection;
+                # dropped samples have no publish time
+                publish_times = self.publish_times[machine][start + motif_start:start + motif_start + length]
+                received = np.flatnonzero(np.isfinite(publish_times))
+                latency = detected_at - publish_times[received[-1]] if len(received) else np.nan
+                self.detections.append((machine, column, start + motif_start, length, job, latency))
+
+    def _analyze(self, n_clients):
+        seen = [set() for _ in self.buffers]
+        finished = 0
+        while finished < n_clients:
+            machine, end = self._jobs.get()
+            if end is None:
+                finished += 1
+                end = int(np.flatnonzero(self.received[machine])[-1]) + 1 if self.received[machine].any() else 0
+            if end > 0:
+                self._detect(machine, end, seen[machine])
+
+    def run(self, n_samples=None):
+        """
+        Replays the recording and waits until all samples are ingested and analyzed.
+
+        :param n_samples: Optional. Number of samples to play per machine, defaults to the length of the recording.
+        :return: Dictionary with the ingest throughput, the dropped samples and the detection latencies. A cycle's
+                 latency is measured from its last received sample; cycles without any received sample are left
+                 out of the latency statistics and counted in excluded_latencies.
+        """
+        n_samples = len(self.df) if n_samples is None else min(n_samples, len(self.df))
+        clients = [threading.Thread(target=self._ingest, args=(machine,), daemon=True)
+                   for machine in range(len(self.subscriptions))]
+        analysis = threading.Thread(target=self._analyze, args=(len(clients),), daemon=True)
+        for thread in clients:
+            thread.start()
+        analysis.start()
+        self.server.start(n_samples)
+        self.server.join()
+        for thread in clients:
+            thread.join()
+        ingest_seconds = time.perf_counter() - self.server.started
+        analysis.join()
+        total_seconds = time.perf_counter() - self.server.started
+
+        n_nodes = len(self.server.columns)
+        published = self.server.published * len(self.subscriptions) * n_nodes
+        ingested = sum(self.ingested) * n_nodes
+        dropped = sum(subscription.dropped for subscription in self.subscriptions) * n_nodes
+        latencies = np.array([detection[-1] for detection in self.detections], dtype=float)
+        excluded = int(np.isnan(latencies).sum())  # Cycles without any received sample
+        latencies = latencies[~np.isnan(latencies)]
+        results = {
+            'machines': len(self.subscriptions),
+            'data_points': len(self.server.address_space),
+            'speedup': self.server.speedup,
+            'published_samples': published,
+            'ingested_samples': ingested,
+            'dropped_samples': dropped,
+            'ingest_seconds': ingest_seconds,
+            'total_seconds': total_seconds,
+            'throughput': ingested / ingest_seconds if ingest_seconds > 0 else np.nan,  # Samples per second
+            'effective_speedup': self.server.published / self.server.sample_rate / ingest_seconds,
+            'detected_cycles': len(self.detections),
+            'excluded_latencies': excluded,
+            'latency_p50': float(np.percentile(latencies, 50)) if len(latencies) else np.nan,
+            'latency_p95': float(np.percentile(latencies, 95)) if len(latencies) else np.nan,
+            'latency_max': float(latencies.max()) if len(latencies) else np.nan,
+        }
+        if self.metrics.enabled:
+            for name in ('published_samples', 'ingested_samples', 'dropped_samples', 'detected_cycles',
+                         'excluded_latencies'):
+                self.metrics.count(f"replay_{name}", results[name], speedup=self.server.speedup,
+                                   machines=len(self.subscriptions))
+            self.metrics.flush()
+        return results
+
+
+def discover_templates(df, window_lengths=(300,), threshold=0.5):
+    """
+    Templates for a recording without registered patterns: the best recurring motif of every column,
+    found with MotifFinder.discover_patterns.
+
+    :param df: Recording with one column per machine.
+    :param window_lengths: Candidate pattern lengths in samples.
+    :param threshold: Threshold of the templates.
+    :return: TemplateLibrary with at most one template per column.
+    """
+    finder = MotifFinder(df)
+    library = TemplateLibrary()
+    for column in df.columns:
+        candidates = finder.discover_patterns(column, list(window_lengths), k=1)
+        if candidates:
+            candidate = candidates[0]
+            samples = df[column].to_numpy(dtype=float)[candidate['input_start']:candidate['input_end']]
+            library.add(Template(column, f"{column} cycle", threshold, samples))
+    return library
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replays a recording through an in-process OPC UA stand-in and "
+                                                 "measures ingest throughput, dropped samples and detection latency.")
+    parser.add_argument('--recording', default=default_recording, help="CSV recording, one column per machine.")
+    parser.add_argument('--templates', help="Template library (.npz), e.g. built from sample_data.csv; the recording columns are "
+                                            "mapped to the canonical machine names. By default one template per "
+                                            "column is discovered in the recording.")
+    parser.add_argument('--speedups', type=float, nargs='+', default=[100, 1000],
+                        help="Replay speeds relative to real time, e.g. 1 10 100 1000.")
+    parser.add_argument('--machines', type=int, nargs='+', default=[1], help="Numbers of replayed machines.")
+    parser.add_argument('--samples', type=int, help="Samples replayed per machine, defaults to the whole recording.")
+    parser.add_argument('--window-length', type=int, default=3600, help="Samples per detection window.")
+    parser.add_argument('--analysis-step', type=int, default=300, help="New samples between two detections.")
+    parser.add_argument('--queue-size', type=int, default=10000, help="Queue size per monitored item.")
+    parser.add_argument('--publishing-interval', type=float, default=0.05, help="Seconds between publish cycles.")
+    parser.add_argument('--metrics', help="Write the detection timings and ingest counters to this JSON lines "
+                                          "file, or to a Prometheus text file if the name ends with .prom.")
+    args = parser.parse_args()
+
+    recording = read_recording(args.recording)
+    library = TemplateLibrary.load(args.templates) if args.templates else discover_templates(recording)
+    metrics = disabled_metrics
+    if args.metrics:
+        metrics = Metrics(PrometheusTextSink(args.metrics) if args.metrics.endswith('.prom')
+                          else JsonLinesSink(args.metrics))
+    engine = MatchingEngine()
+
+    print(f"{'machines':>8s} {'speedup':>8s} {'samples/s':>11s} {'dropped':>8s} {'cycles':>7s} "
+          f"{'p50 ms':>8s} {'p95 ms':>8s} {'max ms':>8s} {'excluded':>8s}")
+    with metrics:
+        for machines in args.machines:
+            for speedup in args.speedups:
+                harness = ReplayHarness(recording, library, machines, speedup, args.window_length,
+                                        args.analysis_step, args.queue_size, args.publishing_interval, engine,
+                                        metrics)
+                results = harness.run(args.samples)
+                print(f"{machines:8d} {speedup:8g} {results['throughput']:11.0f} {results['dropped_samples']:8d} "
+                      f"{results['detected_cycles']:7d} {results['latency_p50'] * 1000:8.1f} "
+                      f"{results['latency_p95'] * 1000:8.1f} {results['latency_max'] * 1000:8.1f} "
+                      f"{results['excluded_latencies']:8d}")
@@ -0,0 +1,282 @@
+import sys
+import os
+import json
+import sqlite3
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# Add the Inference_Engine directory to the system path
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Inference_Engine'))
+
+from EnPIs import EnPIResults, MACHINE_METRICS, JOB_METRICS
+
+
+# Default location of the results store next to the other knowledge base files
+current_path = os.path.dirname(os.path.abspath(__file__))
+default_results_store_path = os.path.join(current_path, '..', 'Knowledge_Base', 'results.sqlite')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at TEXT NOT NULL,
+    metadata TEXT
+);
+CREATE TABLE IF NOT EXISTS machine_enpis (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    machine TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    value REAL
+);
+CREATE TABLE IF NOT EXISTS job_enpis (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    job TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    value REAL
+);
+CREATE TABLE IF NOT EXISTS job_energies (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    job TEXT NOT NULL,
+    cycle INTEGER NOT NULL,
+    energy REAL
+);
+CREATE TABLE IF NOT EXISTS motifs (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    machine TEXT NOT NULL,
+    job TEXT NOT NULL,
+    start INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    color_index INTEGER
+);
+CREATE TABLE IF NOT EXISTS priorities (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    subject TEXT NOT NULL,
+    priority TEXT NOT NULL,
+    value REAL
+);
+CREATE INDEX IF NOT EXISTS runs_created_at ON runs (created_at);
+CREATE INDEX IF NOT EXISTS machine_enpis_machine ON machine_enpis (machine, run_id);
+CREATE INDEX IF NOT EXISTS machine_enpis_run ON machine_enpis (run_id);
+CREATE INDEX IF NOT EXISTS job_enpis_job ON job_enpis (job, run_id);
+CREATE INDEX IF NOT EXISTS job_enpis_run ON job_enpis (run_id);
+CREATE INDEX IF NOT EXISTS job_energies_run ON job_energies (run_id, job);
+CREATE INDEX IF NOT EXISTS motifs_machine ON motifs (machine, run_id, start);
+CREATE INDEX IF NOT EXISTS motifs_job ON motifs (job, run_id);
+CREATE INDEX IF NOT EXISTS priorities_run ON priorities (run_id, subject);
+"""
+
+
+class ResultsStore:
+    def __init__(self, path=default_results_store_path):
+        """
+        Opens (and if necessary creates) an append-only SQLite store for expert system runs.
+
+        :param path: Path of the SQLite database file.
+        """
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @staticmethod
+    def _long_rows(run_id, table):
+        # (run_id, name, metric, value) rows of a wide EnPI table, undefined EnPIs are left out
+        stacked = table.stack().dropna()
+        return [(run_id, name, metric, float(value)) for (name, metric), value in stacked.items()]
+
+    def write_run(self, results, motif_results=None, priorities=None, metadata=None):
+        """
+        Appends one run of the expert system to the store.
+
+        :param results: EnPIResults returned by calculate_EnPI_results.
+        :param motif_results: Optional. Dictionary of motif results as returned by MotifFinder.find_motifs.
+        :param priorities: Optional. Dictionary mapping a machine or job to {priority name: value}.
+        :param metadata: Optional. JSON serializable dictionary describing the run (data source, patterns, ...).
+        :return: Identifier of the new run.
+        """
+        with self.connection:
+            cursor = self.connection.execute(
+                "INSERT INTO runs (created_at, metadata) VALUES (?, ?)",
+                (datetime.now().isoformat(timespec='seconds'), json.dumps(metadata or {})))
+            run_id = cursor.lastrowid
+
+            self.connection.executemany("INSERT INTO machine_enpis VALUES (?, ?, ?, ?)",
+                                        self._long_rows(run_id, results.machines))
+            self.connection.executemany("INSERT INTO job_enpis VALUES (?, ?, ?, ?)",
+                                        self._long_rows(run_id, results.jobs))
+            self.connection.executemany(
+                "INSERT INTO job_energies VALUES (?, ?, ?, ?)",
+                [(run_id, job, cycle, float(energy))
+                 for job, energies in results.job_energies.items()
+                 for cycle, energy in enumerate(energies)])
+
+            if motif_results:
+                self.connection.executemany(
+                    "INSERT INTO motifs VALUES (?, ?, ?, ?, ?, ?)",
+                    [(run_id, machine, job, int(start), int(length), int(color_index))
+                     for machine, motifs in motif_results.items()
+                     for start, length, color_index, job in motifs])
+
+            if priorities:
+                self.connection.executemany(
+                    "INSERT INTO priorities VALUES (?, ?, ?, ?)",
+                    [(run_id, subject, priority, float(value))
+                     for subject, values in priorities.items()
+                     for priority, value in values.items()])
+        return run_id
+
+    def runs(self, since=None, until=None):
+        """
+        Lists the stored runs, optionally restricted to a time range.
+
+        :param since: Optional. Earliest creation time (datetime or ISO string).
+        :param until: Optional. Latest creation time (datetime or ISO string).
+        :return: DataFrame indexed by run_id with creation time and metadata.
+        """
+        query, params = self._time_filter("SELECT run_id, created_at, metadata FROM runs", since, until)
+        runs = pd.read_sql_query(query + " ORDER BY run_id", self.connection, params=params, index_col='run_id')
+        runs['metadata'] = runs['metadata'].map(json.loads)
+        return runs
+
+    def latest_run_id(self):
+        row = self.connection.execute("SELECT MAX(run_id) FROM runs").fetchone()
+        return row[0]
+
+    def load_run(self, run_id=None):
+        """
+        Reloads a stored run without recomputing it.
+
+        :param run_id: Optional. Run to load, defaults to the latest run.
+        :return: Dictionary with the keys 'run_id', 'created_at', 'metadata', 'results' (EnPIResults),
+                 'motif_results' and 'priorities', or None if the store is empty.
+        """
+        if run_id is None:
+            run_id = self.latest_run_id()
+            if run_id is None:
+                return None
+
+        created_at, metadata = self.connection.execute(
+            "SELECT created_at, metadata FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+
+        machines = self._wide_table("machine_enpis", "machine", run_id, MACHINE_METRICS)
+        machines.index.name = 'Machine'
+        jobs = self._wide_table("job_enpis", "job", run_id, JOB_METRICS)
+        jobs['count'] = jobs['count'].fillna(0).astype(np.int64)
+        jobs.index.name = 'Job'
+
+        job_energies = {}
+        for job, energy in self.connection.execute(
+                "SELECT job, energy FROM job_energies WHERE run_id = ? ORDER BY rowid", (run_id,)):
+            job_energies.setdefault(job, []).append(energy)
+
+        motif_results = {}
+        for machine, start, length, color_index, job in self.connection.execute(
+                "SELECT machine, start, length, color_index, job FROM motifs WHERE run_id = ? ORDER BY rowid",
+                (run_id,)):
+            motif_results.setdefault(machine, []).append((start, length, color_index, job))
+
+        priorities = {}
+        for subject, priority, value in self.connection.execute(
+                "SELECT subject, priority, value FROM priorities WHERE run_id = ? ORDER BY rowid", (run_id,)):
+            priorities.setdefault(subject, {})[priority] = value
+
+        return {
+            'run_id': run_id,
+            'created_at': created_at,
+            'metadata': json.loads(metadata),
+            'results': EnPIResults(machines, jobs, job_energies),
+            'motif_results': motif_results,
+            'priorities': priorities,
+        }
+
+    def query_machine(self, machine, metrics=None, since=None, until=None):
+        """
+        EnPIs of one machine over all runs in a time range.
+
+        :param machine: Machine (column) name.
+        :param metrics: Optional. List of metrics to return, defaults to all.
+        :param since: Optional. Earliest run creation time.
+        :param until: Optional. Latest run creation time.
+        :return: DataFrame indexed by (run_id, created_at) with one column per metric.
+        """
+        return self._query_subject("machine_enpis", "machine", machine, metrics, since, until)
+
+    def query_job(self, job, metrics=None, since=None, until=None):
+        """
+        EnPIs of one job over all runs in a time range.
+
+        :param job: Job description, e.g. "OP 40".
+        :param metrics: Optional. List of metrics to return, defaults to all.
+        :param since: Optional. Earliest run creation time.
+        :param until: Optional. Latest run creation time.
+        :return: DataFrame indexed by (run_id, created_at) with one column per metric.
+        """
+        return self._query_subject("job_enpis", "job", job, metrics, since, until)
+
+    def query_motifs(self, machine=None, job=None, run_id=None, start=None, end=None):
+        """
+        Detected job intervals, filtered by machine, job, run and sample range.
+
+        :param machine: Optional. Machine (column) name.
+        :param job: Optional. Job description.
+        :param run_id: Optional. Run to query, defaults to all runs.
+        :param start: Optional. Only intervals ending after this sample.
+        :param end: Optional. Only intervals starting before this sample.
+        :return: DataFrame with one row per detected job interval.
+        """
+        conditions, params = [], []
+        for column, value in (("machine", machine), ("job", job), ("run_id", run_id)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        if start is not None:
+            conditions.append("start + length > ?")
+            params.append(int(start))
+        if end is not None:
+            conditions.append("start < ?")
+            params.append(int(end))
+        query = "SELECT run_id, machine, job, start, length, color_index FROM motifs"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        return pd.read_sql_query(query + " ORDER BY run_id, machine, start", self.connection, params=params)
+
+    @staticmethod
+    def _time_filter(query, since, until, column='created_at'):
+        conditions, params = [], []
+        if since is not None:
+            conditions.append(f"{column} >= ?")
+            params.append(pd.Timestamp(since).isoformat())
+        if until is not None:
+            conditions.append(f"{column} <= ?")
+            params.append(pd.Timestamp(until).isoformat())
+        if conditions:
+            query += (" AND " if " WHERE " in query else " WHERE ") + " AND ".join(conditions)
+        return query, params
+
+    def _wide_table(self, table, key, run_id, metrics):
+        long = pd.read_sql_query(f"SELECT {key}, metric, value FROM {table} WHERE run_id = ? ORDER BY rowid",
+                                 self.connection, params=(run_id,))
+        names = list(dict.fromkeys(long[key]))  # Keep the order of the stored run
+        wide = long.pivot(index=key, columns='metric', values='value')
+        wide.columns.name = None  # Same layout as the tables of calculate_EnPI_results
+        return wide.reindex(index=names, columns=metrics).astype(float)
+
+    def _query_subject(self, table, key, name, metrics, since, until):
+        query = (f"SELECT e.run_id, r.created_at, e.metric, e.value FROM {table} e "
+                 f"JOIN runs r ON r.run_id = e.run_id WHERE e.{key} = ?")
+        params = [name]
+        if metrics:
+            query += f" AND e.metric IN ({', '.join('?' * len(metrics))})"
+            params += list(metrics)
+        query, time_params = self._time_filter(query, since, until, column='r.created_at')
+        long = pd.read_sql_query(query, self.connection, params=params + time_params)
+        return long.pivot_table(index=['run_id', 'created_at'], columns='metric', values='value', sort=True)
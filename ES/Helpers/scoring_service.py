@@ -0,0 +1,354 @@
+import sys
+import os
+import json
+import time
+import queue
+import argparse
+import importlib
+import threading
+import warnings
+import socketserver
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import numpy as np
+import pandas as pd
+
+# Add the Inference_Engine directory to the system path
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Inference_Engine'))
+
+from algorithms import MotifFinder, TemplateLibrary, dtw_match
+from matching import MatchingEngine
+from EnPIs import calculate_EnPI_results
+from FIS import FuzzyControlSystem, FuzzyCombinedSystem
+from job_features import load_model
+
+
+# Default location of the PMML models
+current_path = os.path.dirname(os.path.abspath(__file__))
+default_models_path = os.path.join(current_path, 'MLModels')
+
+
+def enable_jit_cache():
+    """
+    Enables the persistent numba cache for all stumpy kernels, so that a restarted service loads the
+    compiled kernels from disk instead of compiling them again. The DTW kernel is always cached.
+
+    :return: True if caching could be enabled.
+    """
+    try:
+        from stumpy import cache
+        for module_name, function_name in cache.get_njit_funcs():
+            module = importlib.import_module(f"stumpy.{module_name}")
+            getattr(module, function_name).enable_caching()
+    except (ImportError, AttributeError, OSError) as error:
+        warnings.warn(f"Could not enable the numba cache of stumpy: {error}")
+        return False
+    return True
+
+
+def load_pmml_models(path=default_models_path):
+    """
+    Loads all .pmml files of a directory with job_features.load_model (pypmml, one JVM for all models), so the
+    service scores them exactly like score_job_windows does.
+
+    :param path: Directory with the PMML files.
+    :return: Dictionary mapping the file names without extension to the loaded models, empty if pypmml
+             is not installed.
+    """
+    try:
+        return {os.path.splitext(name)[0]: load_model(os.path.join(path, name))
+                for name in sorted(os.listdir(path)) if name.endswith('.pmml')}
+    except ImportError:
+        warnings.warn("pypmml is not installed, the PMML models are not available.")
+        return {}
+
+
+def _table_records(table):
+    # Table rows as JSON compatible dictionaries, undefined EnPIs become null
+    return {str(name): {metric: (None if pd.isna(value) else float(value)) for metric, value in row.items()}
+            for name, row in table.iterrows()}
+
+
+class ScoringService:
+    def __init__(self, templates=None, models_path=default_models_path, workers=4, engine=None):
+        """
+        Keeps everything the expert system needs resident in memory: the template library, the matching
+        engine with its calibration, a pool of fuzzy inference systems and the PMML models.
+
+        :param templates: Optional. TemplateLibrary or path of a library saved with TemplateLibrary.save.
+        :param models_path: Optional. Directory with PMML models, None to load no models.
+        :param workers: Number of fuzzy inference system pairs, i.e. concurrent scoring requests.
+        :param engine: Optional. MatchingEngine, defaults to a new engine with automatic backend selection.
+        """
+        if isinstance(templates, (str, os.PathLike)):
+            templates = TemplateLibrary.load(templates)
+        self.library = templates or TemplateLibrary()
+        self.templates = {}
+        for template in self.library:
+            self.templates.setdefault(template.column, []).append(template)
+
+        self.engine = engine or MatchingEngine()
+        self.models = load_pmml_models(models_path) if models_path else {}
+        self._model_locks = {name: threading.Lock() for name in self.models}
+
+        # skfuzzy simulations keep their inputs as state, so every concurrent request gets its own pair
+        self._fuzzy_systems = queue.Queue()
+        for _ in range(workers):
+            self._fuzzy_systems.put((FuzzyControlSystem(), FuzzyCombinedSystem()))
+        self.workers = workers
+        self.warm = False
+        self.started = time.time()
+
+    def warm_up(self, series_length=86400, seed=0):
+        """
+        Compiles the matching kernels, calibrates the matching engine for all template lengths and
+        evaluates every fuzzy system and model once, so that the first request is as fast as the others.
+
+        The engine is calibrated for every series length bucket (powers of two) from the shortest template up
+        to twice series_length and then pinned to this calibration: windows of any length use the nearest
+        calibrated bucket and never calibrate inside a request.
+
+        :param series_length: Typical number of samples of an analyzed window (default one day at 1 Hz).
+        :return: Seconds spent.
+        """
+        started = time.perf_counter()
+        rng = np.random.default_rng(seed)
+        lengths = sorted({len(template.samples) for template in self.library})
+        if lengths:
+            first_bucket = int(round(np.log2(lengths[0])))
+            last_bucket = max(int(round(np.log2(max(series_length, 2)))) + 1, first_bucket)
+            self.engine.calibrate(lengths, [1 << bucket for bucket in range(first_bucket, last_bucket + 1)],
+                                  seed=seed, max_length=self.engine.max_calibration_length)
+        self.engine.on_the_fly = False
+
+        series = np.cumsum(rng.standard_normal(4 * max(lengths, default=1)))
+        for m in lengths:
+            dtw_match(series[:m], series[:4 * m])
+        if len(self.library):
+            # The mean/std filter of DTW matches warps them onto the template with its own kernel
+            MotifFinder._candidate_statistics(series, [0], next(iter(self.library)), warping_window=0.1)
+
+        for _ in range(self.workers):
+            with self._fuzzy() as (fuzzy_system, combined_system):
+                p_e_np = fuzzy_system.set_input_P_energy(0.5, 0.5)
+                p_t_np = fuzzy_system.set_input_P_time(0.5, 0.5)
+                p_e_p = fuzzy_system.set_input_P_prod(0.5, 0.5, 0.5)
+                try:
+                    combined_system.set_input_P_combined(p_e_np, p_t_np, p_e_p)
+                except KeyError:
+                    pass  # No combined rule fires, the system is evaluated anyway
+
+        for name, model in self.models.items():
+            self.predict(name, [{field: 0.0 for field in model.inputNames}])
+
+        self.warm = True
+        return time.perf_counter() - started
+
+    @contextmanager
+    def _fuzzy(self):
+        systems = self._fuzzy_systems.get()
+        try:
+            yield systems
+        finally:
+            self._fuzzy_systems.put(systems)
+
+    def health(self):
+        return {
+            'status': 'ok',
+            'warm': self.warm,
+            'uptime': time.time() - self.started,
+            'machines': sorted(self.templates),
+            'templates': len(self.library),
+            'models': sorted(self.models),
+            'workers': self.workers,
+        }
+
+    def analyze(self, machine, values, start=0, method='euclidean', op_counts=None):
+        """
+        Finds the job cycles of one machine in a window of power samples and calculates the EnPIs of the window.
+
+        :param machine: Machine (column) whose templates are matched.
+        :param values: Active power samples in W at 1 Hz, missing samples as None/NaN.
+        :param start: Position of the first sample in the recording, added to all reported positions.
+        :param method: 'euclidean' or 'dtw', see MotifFinder.find_motifs.
+        :param op_counts: Optional. Parts per job, e.g. {"OP_40_parts": 1}.
+        :return: Dictionary with the motifs and the machine and job EnPIs of the window.
+        """
+        if machine not in self.templates:
+            raise ValueError(f"No templates for machine '{machine}'.")
+        df = pd.DataFrame({machine: np.asarray(values, dtype=float)})
+        finder = MotifFinder(df, engine=self.engine)
+        finder.add_templates(TemplateLibrary(self.templates[machine]))
+
+        motif_results = finder.find_motifs(method=method)
+        results = calculate_EnPI_results(finder.create_jobs_dataframe(motif_results), motif_results,
+                                         op_counts or {})
+        return {
+            'machine': machine,
+            'motifs': [{'start': int(start + motif_start), 'length': int(length), 'job': job}
+                       for motif_start, length, _, job in motif_results[machine]],
+            'machine_enpis': _table_records(results.machines)[machine],
+            'job_enpis': _table_records(results.jobs),
+        }
+
+    def score(self, machines=None, jobs=None, combined=None):
+        """
+        Evaluates the fuzzy rule bases for normalized EnPIs, as the knowledge base notebook does.
+
+        :param machines: Optional. Dictionary mapping machines to {'NPEF', 'NPTF', 'UTR'} (normalized).
+        :param jobs: Optional. Dictionary mapping jobs to {'average_energy', 'count', 'energy_variance'} (normalized).
+        :param combined: Optional. List of [machine, job] pairs for the combined priority.
+        :return: Dictionary mapping each machine and job to its priorities, and the combined priorities.
+        """
+        machines = machines or {}
+        jobs = jobs or {}
+        priorities = {}
+        with self._fuzzy() as (fuzzy_system, combined_system):
+            for machine, enpis in machines.items():
+                priorities[machine] = {
+                    'P_e_np': float(fuzzy_system.set_input_P_energy(enpis['NPEF'], enpis['NPTF'])),
+                    'P_t_np': float(fuzzy_system.set_input_P_time(enpis['NPTF'], enpis['UTR'])),
+                }
+            for job, enpis in jobs.items():
+                priorities[job] = {'P_e_p': float(fuzzy_system.set_input_P_prod(
+                    enpis['average_energy'], enpis['count'], enpis['energy_variance']))}
+
+            combined_priorities = []
+            for machine, job in combined or []:
+                try:
+                    value = float(combined_system.set_input_P_combined(
+                        priorities[machine]['P_e_np'], priorities[machine]['P_t_np'], priorities[job]['P_e_p']))
+                except KeyError as error:
+                    if machine not in priorities or job not in priorities:
+                        raise ValueError(f"Score the machine and the job before combining them: {error}")
+                    value = None  # No combined rule fires for these priorities
+                combined_priorities.append({'machine': machine, 'job': job, 'P_combined': value})
+        return {'priorities': priorities, 'combined': combined_priorities}
+
+    def predict(self, model, records):
+        """
+        Scores records with a loaded PMML model.
+
+        :param model: Model name, i.e. the PMML file name without extension.
+        :param records: List of dictionaries mapping the model input fields to values.
+        :return: List of dictionaries with the model outputs.
+        """
+        if model not in self.models:
+            raise ValueError(f"Unknown model '{model}', loaded models: {sorted(self.models)}.")
+        with self._model_locks[model]:
+            predictions = self.models[model].predict(pd.DataFrame(records))
+        return json.loads(predictions.to_json(orient='records'))
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    # Set by serve
+    service = None
+    verbose = False
+
+    routes = {
+        '/analyze': lambda service, request: service.analyze(**request),
+        '/score': lambda service, request: service.score(**request),
+        '/predict': lambda service, request: service.predict(**request),
+    }
+
+    def _send(self, status, body):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._send(200, self.service.health())
+        else:
+            self._send(404, {'error': f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        route = self.routes.get(self.path)
+        if route is None:
+            self._send(404, {'error': f"Unknown path {self.path}"})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            started = time.perf_counter()
+            response = route(self.service, request)
+            self._send(200, {'result': response, 'seconds': time.perf_counter() - started})
+        except (ValueError, KeyError, TypeError) as error:
+            self._send(400, {'error': f"{type(error).__name__}: {error}"})
+        except Exception as error:
+            self._send(500, {'error': f"{type(error).__name__}: {error}"})
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def log_message(self, format, *args):
+        if self.verbose:
+            super().log_message(format, *args)
+
+
+class _ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        socketserver.UnixStreamServer.server_bind(self)
+        self.server_name, self.server_port = 'localhost', 0
+
+
+def serve(service, host='127.0.0.1', port=8765, socket_path=None, verbose=False):
+    """
+    Answers requests with the resident service until interrupted. Every request runs in its own thread.
+
+    :param service: ScoringService, preferably warmed up.
+    :param host: Host of the HTTP API, local only by default.
+    :param port: Port of the HTTP API.
+    :param socket_path: Optional. Serve on this Unix socket instead of a TCP port.
+    :param verbose: If True, every request is logged.
+    """
+    handler = type('RequestHandler', (_RequestHandler,), {'service': service, 'verbose': verbose})
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = _ThreadingUnixHTTPServer(socket_path, handler)
+        print(f"Serving on unix socket {socket_path}")
+    else:
+        server = ThreadingHTTPServer((host, port), handler)
+        print(f"Serving on http://{host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Resident expert system scoring service.")
+    parser.add_argument('--templates', help="Template library (.npz) saved with TemplateLibrary.save.")
+    parser.add_argument('--models', default=default_models_path, help="Directory with PMML models.")
+    parser.add_argument('--no-models', action='store_true', help="Do not load the PMML models (no JVM).")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--socket', help="Serve on this Unix socket instead of a TCP port.")
+    parser.add_argument('--workers', type=int, default=4, help="Number of concurrent scoring requests.")
+    parser.add_argument('--window-length', type=int, default=86400,
+                        help="Typical number of samples per analyzed window, used for the warm-up.")
+    parser.add_argument('--calibration', help="JSON file to load the matching calibration from and save it to.")
+    parser.add_argument('--no-jit-cache', action='store_true', help="Do not cache the compiled stumpy kernels.")
+    parser.add_argument('--verbose', action='store_true', help="Log every request.")
+    args = parser.parse_args()
+
+    if not args.no_jit_cache:
+        enable_jit_cache()
+    engine = MatchingEngine(calibration=args.calibration if args.calibration and os.path.exists(args.calibration)
+                            else None)
+    service = ScoringService(args.templates, None if args.no_models else args.models, args.workers, engine)
+    print(f"Warm-up finished in {service.warm_up(args.window_length):.1f} s")
+    if args.calibration:
+        engine.save_calibration(args.calibration)
+    serve(service, args.host, args.port, args.socket, args.verbose)
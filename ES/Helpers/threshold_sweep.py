@@ -0,0 +1,199 @@
+import sys
+import os
+
+import numpy as np
+import pandas as pd
+from numba import njit
+
+# Add the Inference_Engine directory to the system path
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Inference_Engine'))
+
+from EnPIs import EnPI_results_from_statistics, motif_energies, motif_statistics
+
+
+@njit(cache=True)
+def _resolve_thresholds(starts, lengths, accepted, n_samples):
+    # Overlap resolution of MotifFinder.resolve_overlaps for every row of accepted (thresholds x entries). The
+    # entries are sorted by decreasing energy, so an accepted entry is kept if no kept entry covers its samples
+    n_thresholds, n_entries = accepted.shape
+    kept = np.zeros((n_thresholds, n_entries), dtype=np.bool_)
+    used = np.zeros(n_samples, dtype=np.bool_)
+    for t in range(n_thresholds):
+        for i in range(n_entries):
+            if not accepted[t, i]:
+                continue
+            start = starts[i]
+            end = start + lengths[i]
+            free = True
+            for k in range(start, end):
+                if used[k]:
+                    free = False
+                    break
+            if free:
+                kept[t, i] = True
+                used[start:end] = True
+        # Only the samples of the kept entries were marked, clear them for the next threshold
+        for i in range(n_entries):
+            if kept[t, i]:
+                used[starts[i]:starts[i] + lengths[i]] = False
+    return kept
+
+
+class ThresholdSweepResults:
+    def __init__(self, thresholds, counts, motifs, enpis):
+        """
+        Results of a threshold sweep.
+
+        :param thresholds: Evaluated thresholds in the given order.
+        :param counts: DataFrame indexed by threshold with the number of detected cycles per job.
+        :param motifs: Dictionary mapping each threshold to the motif results as returned by find_motifs.
+        :param enpis: Dictionary mapping each threshold to its EnPIResults, empty if the EnPIs were not requested.
+        """
+        self.thresholds = thresholds
+        self.counts = counts
+        self.motifs = motifs
+        self.enpis = enpis
+
+    def machine_metric(self, metric):
+        """
+        One machine EnPI over all thresholds, e.g. sweep.machine_metric('NPEF').
+
+        :return: DataFrame indexed by threshold with one column per machine.
+        """
+        return pd.DataFrame({threshold: self.enpis[threshold].machines[metric] for threshold in self.thresholds}).T
+
+    def job_metric(self, metric):
+        """
+        One job EnPI over all thresholds, e.g. sweep.job_metric('average_energy').
+
+        :return: DataFrame indexed by threshold with one column per job.
+        """
+        return pd.DataFrame({threshold: self.enpis[threshold].jobs[metric] for threshold in self.thresholds}).T
+
+
+class ThresholdSweep:
+    def __init__(self, finder, method='euclidean', warping_window=0.1, columns=None):
+        """
+        Evaluates many values of the pattern thresholds (input_threshold) on one recording. The threshold only
+        enters the mean/std filter after matching, so all patterns are matched and their candidate statistics
+        computed once here; every threshold afterwards only selects candidates and resolves the overlaps.
+
+        :param finder: MotifFinder with the registered patterns or templates.
+        :param method: 'euclidean' or 'dtw', see MotifFinder.find_motifs.
+        :param warping_window: Only for 'dtw'. Width of the warping band as a fraction of the pattern length.
+        :param columns: Optional. Only sweep the patterns of these columns, e.g. the machine being calibrated.
+        """
+        self.finder = finder
+        self.candidates = finder.match_candidates(method=method, warping_window=warping_window, columns=columns)
+        self.columns = list(dict.fromkeys(candidate['column'] for candidate in self.candidates))
+        self.jobs = list(dict.fromkeys(candidate['job'] for candidate in self.candidates))
+
+        # All candidates of a column in the order of resolve_overlaps: by decreasing energy, candidates of equal
+        # energy in the order of find_motifs. Their energies in kWh for the EnPIs are computed once here.
+        job_codes = {job: code for code, job in enumerate(self.jobs)}
+        self.entries = {}
+        for column in self.columns:
+            indices = [index for index, candidate in enumerate(self.candidates) if candidate['column'] == column]
+            candidates = [self.candidates[index] for index in indices]
+            starts = np.concatenate([candidate['starts'] for candidate in candidates]).astype(np.int64)
+            lengths = np.concatenate([np.full(len(candidate['starts']), candidate['length'], dtype=np.int64)
+                                      for candidate in candidates])
+            order = np.argsort(-np.concatenate([candidate['energies'] for candidate in candidates]), kind='stable')
+            cumulative_energy = np.concatenate(([0.0], np.nancumsum(finder.df[column].to_numpy(dtype=float))))
+            entries = {
+                'starts': starts[order],
+                'lengths': lengths[order],
+                'critical': np.concatenate([candidate['critical'] for candidate in candidates])[order],
+                'candidate': np.repeat(indices, [len(candidate['starts']) for candidate in candidates])[order],
+                'job': np.repeat([job_codes[candidate['job']] for candidate in candidates],
+                                 [len(candidate['starts']) for candidate in candidates])[order],
+                'cumulative_energy': cumulative_energy,
+            }
+            entries['energies'] = motif_energies(cumulative_energy, entries['starts'], entries['lengths'])
+            self.entries[column] = entries
+
+    def _thresholds_of(self, threshold):
+        # One threshold per candidate pattern: a number for all patterns, or a dictionary by job or by
+        # (column, pattern index); patterns not in the dictionary keep their registered threshold
+        if not isinstance(threshold, dict):
+            return [float(threshold)] * len(self.candidates)
+        return [float(threshold.get((candidate['column'], candidate['pattern']),
+                                    threshold.get(candidate['job'], candidate['threshold'])))
+                for candidate in self.candidates]
+
+    def _kept(self, thresholds):
+        # Kept entries of every column for every threshold, as a thresholds x entries boolean array
+        pattern_thresholds = np.array([self._thresholds_of(threshold) for threshold in thresholds],
+                                      dtype=float).reshape(len(thresholds), len(self.candidates))
+        kept = {}
+        for column, entries in self.entries.items():
+            accepted = entries['critical'] <= pattern_thresholds[:, entries['candidate']]
+            n_samples = int((entries['starts'] + entries['lengths']).max(initial=0))
+            kept[column] = _resolve_thresholds(entries['starts'], entries['lengths'], accepted, n_samples)
+        return kept
+
+    def _motif_results(self, kept, row):
+        color_map = self.finder.color_map
+        motif_results = {}
+        for column, entries in self.entries.items():
+            selected = kept[column][row]
+            jobs = [self.jobs[code] for code in entries['job'][selected].tolist()]
+            motif_results[column] = [(start, length, color_map[job], job) for start, length, job in
+                                     zip(entries['starts'][selected].tolist(), entries['lengths'][selected].tolist(),
+                                         jobs)]
+        return motif_results
+
+    def motifs(self, threshold):
+        """
+        Motif results for one threshold, equal to the results of find_motifs with this threshold.
+
+        :param threshold: Threshold of all patterns, or a dictionary mapping jobs or (column, pattern index)
+                          tuples to thresholds.
+        :return: Dictionary mapping each column to a list of (start, length, color index, job) tuples.
+        """
+        return self._motif_results(self._kept([threshold]), 0)
+
+    def run(self, thresholds, op_counts=None, enpis=True):
+        """
+        Evaluates a grid of thresholds. The candidates of all thresholds are resolved in one compiled pass, and
+        the counts and EnPIs are read from the selected entries, without building the job dataframes of
+        create_jobs_dataframe per threshold. The results equal a loop of find_motifs, create_jobs_dataframe and
+        calculate_EnPI_results over the thresholds, see benchmarks/bench_threshold_sweep.py.
+
+        :param thresholds: Iterable of thresholds, e.g. np.arange(0.2, 0.95, 0.05). Each entry is a number for all
+                           patterns or a dictionary as accepted by motifs. Results of dictionary entries are
+                           keyed by their position in thresholds.
+        :param op_counts: Optional. Parts per job, e.g. {"OP_40_parts": 1}, for the EnPIs.
+        :param enpis: If True, the EnPIs are calculated for every threshold.
+        :return: ThresholdSweepResults.
+        """
+        thresholds = list(thresholds)
+        keys = [threshold if not isinstance(threshold, dict) else index for index, threshold in enumerate(thresholds)]
+        metrics = self.finder.metrics
+        with metrics.stage('sweep', thresholds=len(keys)):
+            kept = self._kept(thresholds)
+            motifs = {key: self._motif_results(kept, row) for row, key in enumerate(keys)}
+
+        counts = np.zeros((len(keys), len(self.jobs)), dtype=np.int64)
+        for column, entries in self.entries.items():
+            for row in range(len(keys)):
+                counts[row] += np.bincount(entries['job'][kept[column][row]], minlength=len(self.jobs))
+
+        enpi_results = {}
+        if enpis:
+            with metrics.stage('enpi', thresholds=len(keys)):
+                for row, key in enumerate(keys):
+                    column_statistics = {}
+                    for column, entries in self.entries.items():
+                        selected = kept[column][row]
+                        cumulative_energy = entries['cumulative_energy']
+                        column_statistics[column] = motif_statistics(
+                            len(cumulative_energy) - 1, cumulative_energy, entries['starts'][selected],
+                            entries['lengths'][selected], entries['energies'][selected],
+                            [self.jobs[code] for code in entries['job'][selected].tolist()])
+                    enpi_results[key] = EnPI_results_from_statistics(column_statistics, op_counts or {})
+        metrics.flush()
+
+        counts = pd.DataFrame(counts, index=keys, columns=self.jobs)
+        counts.index.name = 'threshold'
+        return ThresholdSweepResults(keys, counts, motifs, enpi_results)
@@ -12,182 +12,273 @@ import stumpy
 
 
 
-def calculate_EnPIs(job_dataframes, motif_results, op_counts):
-    # Initialize EnPIs dictionary
-    EnPIs = {}
-
-    # Initialize other dictionaries
-    EnPIs_time = {}
-    EnPIs_energy = {}
-    job_counts = {}
-    job_duration = {}
-    job_energy = {}
-    productive_time = {}
-    productive_energy = {}
-    unproductive_time = {}
-    unproductive_energy = {}
-    unproductive_time_min = {}  # Dictionary to store minimum unproductive time
-    unproductive_time_max = {}  # Dictionary to store maximum unproductive time
-    UTR = {}  # Dictionary to store the Unproductive Time Ratio
-    average_energy_per_job = {}  # Dictionary to store the average energy per job
-    average_part_energy_per_job = {}  # Dictionary to store the average part energy per OP XY cycle
-    NPTF = {}
-    NPEF = {}
-    energetic_variance = {}  # Dictionary to store the energetic variance for each job
+# Normalize specified EnPIs between 0.01 and 0.99
+def normalize_array(values):
+    values = np.asarray(values, dtype=float)
+    valid = ~np.isnan(values)  # Missing EnPIs (NaN) are left out of the scaling
+    if not valid.any():
+        return values.copy()
+    min_val = values[valid].min()
+    max_val = values[valid].max()
+
+    # Scale the normalized values to the range [0.01, 0.99]
+    if max_val > min_val:
+        return 0.01 + (0.99 - 0.01) * ((values - min_val) / (max_val - min_val))
+    return np.where(valid, 0.01, np.nan)
+
+
+def normalize_values(values_dict):
+    values = np.fromiter(values_dict.values(), dtype=float, count=len(values_dict))
+    return dict(zip(values_dict.keys(), normalize_array(values).tolist()))
+
+
+def _column_pass(column, desc_df, motifs):
+    # Per-column statistics; only touches the motifs found on this column
+    values = desc_df[column].to_numpy(dtype=float)
+    n_samples = len(values)
+
+    # Cumulative energy allows every motif energy to be read with two lookups
+    cumulative_energy = np.concatenate(([0.0], np.nancumsum(values)))
+
+    starts = np.array([motif[0] for motif in motifs], dtype=np.int64)
+    lengths = np.array([motif[1] for motif in motifs], dtype=np.int64)
+    descriptions = [motif[3] for motif in motifs]
+    return motif_statistics(n_samples, cumulative_energy, starts, lengths,
+                            motif_energies(cumulative_energy, starts, lengths), descriptions)
+
+
+def motif_energies(cumulative_energy, starts, lengths):
+    """
+    Energy of every motif in kWh.
+
+    :param cumulative_energy: Cumulative sum of the power samples of the column in W, with a leading 0.
+    :param starts: Motif starts as an integer array.
+    :param lengths: Motif lengths as an integer array.
+    :return: Array of motif energies.
+    """
+    n_samples = len(cumulative_energy) - 1
+    return (cumulative_energy[np.clip(starts + lengths, 0, n_samples)]
+            - cumulative_energy[np.clip(starts, 0, n_samples)]) / (3600 * 1000)
+
+
+def motif_statistics(n_samples, cumulative_energy, starts, lengths, energies_kWh, descriptions):
+    """
+    Statistics of the motifs of one column, which EnPI_results_from_statistics combines into the EnPIs. Callers
+    that evaluate many motif selections of the same column, like the threshold sweep, compute the cumulative
+    energy and the motif energies once and pass the selected entries here.
+
+    :param n_samples: Number of samples of the column.
+    :param cumulative_energy: Cumulative sum of the power samples of the column in W, with a leading 0.
+    :param starts: Motif starts in the order of the motif results.
+    :param lengths: Motif lengths.
+    :param energies_kWh: Motif energies, see motif_energies.
+    :param descriptions: Job of every motif.
+    :return: Dictionary of column statistics.
+    """
+    ends = starts + lengths
+
+    # Unproductive periods between consecutive motifs and after the last one
+    previous_ends = np.concatenate(([0], ends[:-1]))
+    gaps = starts - previous_ends
+    unproductive_durations = gaps[gaps > 0] / 3600  # Convert seconds to hours
+    last_end = ends[-1] if len(ends) else 0
+    if last_end < n_samples:
+        unproductive_durations = np.append(unproductive_durations, (n_samples - last_end) / 3600)
+
+    # Group the motifs by job, keeping the order in which the jobs first appear
+    codes, jobs = pd.factorize(pd.Series(descriptions, dtype=object))
+    order = np.argsort(codes, kind='stable')
+    counts = np.bincount(codes, minlength=len(jobs))
+    per_job_energies = np.split(energies_kWh[order], np.cumsum(counts)[:-1])
+
+    return {
+        'total_time': n_samples / 3600,  # Assume each row represents one second
+        'total_energy': cumulative_energy[-1] / (3600 * 1000),
+        'productive_time': lengths.sum() / 3600,
+        'productive_energy': energies_kWh.sum(),
+        'unproductive_durations': unproductive_durations,
+        'jobs': list(jobs),
+        'job_counts': counts,
+        'job_duration': np.bincount(codes, weights=lengths / 3600, minlength=len(jobs)),
+        'job_energy': np.bincount(codes, weights=energies_kWh, minlength=len(jobs)),
+        'job_energies': [energies.tolist() for energies in per_job_energies],
+    }
+
+
+# Column schema of the machine x metric and job x metric tables
+MACHINE_METRICS = ['total_time', 'total_energy', 'productive_time', 'productive_energy',
+                   'unproductive_time', 'unproductive_energy', 'unproductive_time_min',
+                   'unproductive_time_max', 'UTR', 'NPTF', 'NPEF']
+JOB_METRICS = ['count', 'duration', 'energy', 'average_energy', 'parts', 'average_part_energy',
+               'energy_variance']
+
+# EnPIs that are normalized between 0.01 and 0.99 over all machines or all jobs
+NORMALIZED_MACHINE_METRICS = ['NPEF', 'NPTF', 'unproductive_time_min', 'unproductive_time_max', 'UTR']
+NORMALIZED_JOB_METRICS = ['average_energy', 'count', 'energy_variance']
+
+# Legacy dictionary keys as (table, metric, key template), in the order of the legacy dictionary
+LEGACY_KEYS = [
+    ('machines', 'total_time', "Total time {} in hours"),
+    ('machines', 'total_energy', "Total energy {} in kWh"),
+    ('jobs', 'count', "Number of {}"),
+    ('jobs', 'duration', "Time of {} in hours"),
+    ('jobs', 'energy', "Energy of {} in kWh"),
+    ('machines', 'productive_time', "Productive time for {}"),
+    ('machines', 'productive_energy', "Productive energy for {}"),
+    ('machines', 'unproductive_time', "Unproductive time for {}"),
+    ('machines', 'unproductive_energy', "Unproductive energy for {}"),
+    ('machines', 'unproductive_time_min', "Minimum unproductive time for {}"),
+    ('machines', 'unproductive_time_max', "Maximum unproductive time for {}"),
+    ('machines', 'UTR', "UTR for {}"),
+    ('jobs', 'average_energy', "Average energy per {} cycle in kWh"),
+    ('machines', 'NPTF', "NPTF for {}"),
+    ('machines', 'NPEF', "NPEF for {}"),
+    ('jobs', 'average_part_energy', "Average part energy per {} cycle in kWh"),
+    ('jobs', 'energy_variance', "Energy variance for {}"),
+]
+LEGACY_NORMALIZED_KEYS = [
+    ('machines', 'NPEF', "NPEF for {}"),
+    ('machines', 'NPTF', "NPTF for {}"),
+    ('jobs', 'average_energy', "Average energy per {} cycle in kWh"),
+    ('jobs', 'count', "Number of {}"),
+    ('jobs', 'energy_variance', "Energy variance for {}"),
+    ('machines', 'unproductive_time_min', "Minimum unproductive time for {}"),
+    ('machines', 'unproductive_time_max', "Maximum unproductive time for {}"),
+    ('machines', 'UTR', "UTR for {}"),
+]
+
+
+class EnPIResults:
+    def __init__(self, machines, jobs, job_energies):
+        """
+        Holds the EnPIs of one analysis as machine x metric and job x metric tables.
+
+        :param machines: DataFrame indexed by machine with the columns in MACHINE_METRICS.
+        :param jobs: DataFrame indexed by job with the columns in JOB_METRICS.
+        :param job_energies: Dictionary mapping each job to the list of its cycle energies in kWh.
+        """
+        self.machines = machines
+        self.jobs = jobs
+        self.job_energies = job_energies
+
+        # Normalized EnPIs share the index of the tables they are derived from
+        self.normalized_machines = pd.DataFrame(
+            {metric: normalize_array(machines[metric]) for metric in NORMALIZED_MACHINE_METRICS},
+            index=machines.index)
+        self.normalized_jobs = pd.DataFrame(
+            {metric: normalize_array(jobs[metric]) for metric in NORMALIZED_JOB_METRICS},
+            index=jobs.index)
+
+    def _legacy_view(self, keys, normalized=False):
+        tables = {
+            'machines': self.normalized_machines if normalized else self.machines,
+            'jobs': self.normalized_jobs if normalized else self.jobs,
+        }
+        view = {}
+        for table_name, metric, template in keys:
+            table = tables[table_name]
+            for name, value in zip(table.index, table[metric].tolist()):
+                # Undefined EnPIs (NaN) were never part of the legacy dictionary
+                if value == value:
+                    view[template.format(name)] = value
+        return view
+
+    def to_dict(self):
+        """
+        Derives the legacy flat dictionaries from the tables.
+
+        :return: Tuple (EnPIs, normalized_EnPIs) as returned by calculate_EnPIs.
+        """
+        EnPIs = self._legacy_view(LEGACY_KEYS)
+        normalized_EnPIs = self._legacy_view(LEGACY_NORMALIZED_KEYS, normalized=True)
+        EnPIs['Job Energies'] = self.job_energies
+        EnPIs['Normalized EnPIs'] = normalized_EnPIs
+        return EnPIs, normalized_EnPIs
+
+
+def calculate_EnPI_results(job_dataframes, motif_results, op_counts):
+    # Per-column pass: statistics of the motifs of this column only
+    column_statistics = {column: _column_pass(column, desc_df, motif_results.get(column, []))
+                         for column, desc_df in job_dataframes.items()}
+    return EnPI_results_from_statistics(column_statistics, op_counts)
+
+
+def EnPI_results_from_statistics(column_statistics, op_counts):
+    """
+    EnPIs of the line from the statistics of its columns.
+
+    :param column_statistics: Dictionary mapping each column to its motif_statistics.
+    :param op_counts: Parts per job, e.g. {"OP_40_parts": 1}.
+    :return: EnPIResults.
+    """
+    machine_rows = {}
+    job_rows = {}
 
     # Initialize a dictionary to store energies for each job
     job_energies = {}
 
-    for column, desc_df in job_dataframes.items():
-        # Calculate total time and energy for the column
-        total_time = len(desc_df) / 3600  # Assume each row represents one second
-        time_key = f"Total time {column} in hours"
-        EnPIs_time[time_key] = total_time
-
-        total_energy_watts_seconds = desc_df[column].sum()
-        total_energy_kWh = total_energy_watts_seconds / (3600 * 1000)
-        energy_key = f"Total energy {column} in kWh"
-        EnPIs_energy[energy_key] = total_energy_kWh
-
-        # Initialize productive metrics for the column
-        productive_time_key = f"Productive time for {column}"
-        productive_energy_key = f"Productive energy for {column}"
-        productive_time[productive_time_key] = 0
-        productive_energy[productive_energy_key] = 0
-
-        # List to hold unproductive periods
-        unproductive_durations = []
-
-        # Calculate metrics for each job motif found
-        previous_end = 0
-        for motif_info in motif_results.get(column, []):
-            start, length, _, description = motif_info
-            end = start + length
-
-            # Calculate unproductive period before the current motif
-            if previous_end < start:
-                unproductive_duration = (start - previous_end) / 3600  # Convert seconds to hours
-                unproductive_durations.append(unproductive_duration)
-
-            # Job counts and durations
-            job_key = f"Number of {description}"
-            job_duration_key = f"Time of {description} in hours"
-            job_energy_key = f"Energy of {description} in kWh"
-
-            job_counts[job_key] = job_counts.get(job_key, 0) + 1
-            duration_hours = length / 3600
-            job_duration[job_duration_key] = job_duration.get(job_duration_key, 0) + duration_hours
-
-            # Calculate and accumulate energy
-            energy_period = desc_df[column].iloc[start:end].sum()
-            energy_period_kWh = energy_period / (3600 * 1000)
-            job_energy[job_energy_key] = job_energy.get(job_energy_key, 0) + energy_period_kWh
-
-            # Store energy for each job
-            if description not in job_energies:
-                job_energies[description] = []
-            job_energies[description].append(energy_period_kWh)
-
-            # Accumulate productive time and energy for the column within the loop
-            productive_time[productive_time_key] += duration_hours
-            productive_energy[productive_energy_key] += energy_period_kWh
-
-            previous_end = end
-
-        # Calculate unproductive period after the last motif
-        if previous_end < len(desc_df):
-            unproductive_duration = (len(desc_df) - previous_end) / 3600  # Convert seconds to hours
-            unproductive_durations.append(unproductive_duration)
-
-        # Calculate unproductive time and energy outside the loop
-        unproductive_time_key = f"Unproductive time for {column}"
-        unproductive_energy_key = f"Unproductive energy for {column}"
-        unproductive_time[unproductive_time_key] = total_time - productive_time[productive_time_key]
-        unproductive_energy[unproductive_energy_key] = total_energy_kWh - productive_energy[productive_energy_key]
+    # Machine level EnPIs and the job totals of every column
+    for column, stats in column_statistics.items():
+        total_time = stats['total_time']
+        total_energy = stats['total_energy']
+
+        # Merge the job totals of this column into the line-wide job totals
+        for description, count, duration_hours, energy_kWh, energies in zip(
+                stats['jobs'], stats['job_counts'], stats['job_duration'],
+                stats['job_energy'], stats['job_energies']):
+            row = job_rows.setdefault(description, {'count': 0, 'duration': 0, 'energy': 0})
+            row['count'] += int(count)
+            row['duration'] += duration_hours
+            row['energy'] += energy_kWh
+            job_energies.setdefault(description, []).extend(energies)
+
+        unproductive_time = total_time - stats['productive_time']
+        unproductive_energy = total_energy - stats['productive_energy']
 
         # Calculate minimum and maximum unproductive time
-        unproductive_time_min_key = f"Minimum unproductive time for {column}"
-        unproductive_time_max_key = f"Maximum unproductive time for {column}"
-
-        if unproductive_durations:
-            unproductive_time_min[unproductive_time_min_key] = min(unproductive_durations)
-            unproductive_time_max[unproductive_time_max_key] = max(unproductive_durations)
-        else:
-            unproductive_time_min[unproductive_time_min_key] = 0
-            unproductive_time_max[unproductive_time_max_key] = 0
-
-        # Calculate UTR (Unproductive Time Ratio)
-        UTR_key = f"UTR for {column}"
-        if unproductive_time_max[unproductive_time_max_key] > 0:
-            UTR[UTR_key] = unproductive_time_min[unproductive_time_min_key] / unproductive_time_max[unproductive_time_max_key]
-        else:
-            UTR[UTR_key] = 0
-
-        # Calculate NPTF
-        NPTF_key = f"NPTF for {column}"
-        NPTF[NPTF_key] = unproductive_time[unproductive_time_key] / total_time
-
-        # Calculate NPEF
-        NPEF_key = f"NPEF for {column}"
-        NPEF[NPEF_key] = unproductive_energy[unproductive_energy_key] / total_energy_kWh
-
-        # Calculate average energy per job cycle for each job type
-        for job_key, count in job_counts.items():
-            if "Number of " in job_key:
-                description = job_key.replace("Number of ", "")
-                energy_key = f"Energy of {description} in kWh"
-                if job_energy.get(energy_key, 0) > 0 and count > 0:
-                    avg_energy_key = f"Average energy per {description} cycle in kWh"
-                    average_energy_per_job[avg_energy_key] = job_energy[energy_key] / count
-
-    # Calculate energetic variance for each job type
-    for description, energies in job_energies.items():
-        if len(energies) > 1:  # More than one energy reading needed to calculate variance
-            variance_key = f"Energy variance for {description}"
-            energetic_variance[variance_key] = np.var(energies)
-        else:
-            energetic_variance[f"Energy variance for {description}"] = 0  # Undefined or zero variance
+        unproductive_durations = stats['unproductive_durations']
+        min_duration = unproductive_durations.min() if len(unproductive_durations) else 0
+        max_duration = unproductive_durations.max() if len(unproductive_durations) else 0
+
+        machine_rows[column] = {
+            'total_time': total_time,
+            'total_energy': total_energy,
+            'productive_time': stats['productive_time'],
+            'productive_energy': stats['productive_energy'],
+            'unproductive_time': unproductive_time,
+            'unproductive_energy': unproductive_energy,
+            'unproductive_time_min': min_duration,
+            'unproductive_time_max': max_duration,
+            'UTR': min_duration / max_duration if max_duration > 0 else 0,  # Unproductive Time Ratio
+            'NPTF': unproductive_time / total_time,
+            'NPEF': unproductive_energy / total_energy,
+        }
 
+    # Number of simultaneously machined parts per job, e.g. "OP_40_parts" -> "OP 40"
+    parts = {}
     for op_type, count in op_counts.items():
         op_number = ''.join(filter(str.isdigit, op_type))  # Extract only numeric part from the op_type
-        avg_energy_key = f'Average energy per OP {op_number} cycle in kWh'
-        if avg_energy_key in average_energy_per_job and count > 0:
-            avg_part_energy_key = f"Average part energy per OP {op_number} cycle in kWh"
-            average_part_energy_per_job[avg_part_energy_key] = average_energy_per_job[avg_energy_key] / count
-
-    # Combine all results into one dictionary
-    EnPIs = {**EnPIs_time, **EnPIs_energy, **job_counts, **job_duration, **job_energy,
-             **productive_time, **productive_energy, **unproductive_time, **unproductive_energy,
-             **unproductive_time_min, **unproductive_time_max, **UTR,
-             **average_energy_per_job, **NPTF, **NPEF, **average_part_energy_per_job, **energetic_variance
-            }
-
-    # Normalize specified EnPIs between 0.01 and 0.99
-    def normalize_values(values_dict):
-        min_val = min(values_dict.values())
-        max_val = max(values_dict.values())
-        
-        # Scale the normalized values to the range [0.01, 0.99]
-        return {
-            key: 0.01 + (0.99 - 0.01) * ((value - min_val) / (max_val - min_val)) if max_val > min_val else 0.01
-            for key, value in values_dict.items()
-        }
-    
-    # Normalize specific EnPIs
-    normalized_EnPIs = {}
-    normalized_EnPIs.update(normalize_values(NPEF))
-    normalized_EnPIs.update(normalize_values(NPTF))
-    normalized_EnPIs.update(normalize_values(average_energy_per_job))
-    normalized_EnPIs.update(normalize_values(job_counts))
-    normalized_EnPIs.update(normalize_values(energetic_variance))
-    normalized_EnPIs.update(normalize_values(unproductive_time_min))
-    normalized_EnPIs.update(normalize_values(unproductive_time_max))
-    normalized_EnPIs.update(normalize_values(UTR))
-
-    # Return job energies separately
-    EnPIs['Job Energies'] = job_energies
-
-    # Add normalized EnPIs to the results
-    EnPIs['Normalized EnPIs'] = normalized_EnPIs
-
-    return EnPIs, normalized_EnPIs
\ No newline at end of file
+        parts[f"OP {op_number}"] = count
+
+    # Global finalisation pass: job level EnPIs over all columns, computed once
+    for description, row in job_rows.items():
+        energies = job_energies[description]
+        has_energy = row['energy'] > 0 and row['count'] > 0
+        row['average_energy'] = row['energy'] / row['count'] if has_energy else np.nan
+        row['parts'] = parts.get(description, np.nan)
+        row['average_part_energy'] = (row['average_energy'] / row['parts']
+                                      if row['parts'] > 0 else np.nan)
+        # More than one energy reading needed to calculate variance
+        row['energy_variance'] = np.var(energies) if len(energies) > 1 else 0
+
+    machines = pd.DataFrame.from_dict(machine_rows, orient='index', columns=MACHINE_METRICS, dtype=float)
+    machines.index.name = 'Machine'
+    jobs = pd.DataFrame.from_dict(job_rows, orient='index', columns=JOB_METRICS, dtype=float)
+    jobs['count'] = jobs['count'].astype(np.int64)
+    jobs.index.name = 'Job'
+
+    return EnPIResults(machines, jobs, job_energies)
+
+
+def calculate_EnPIs(job_dataframes, motif_results, op_counts):
+    return calculate_EnPI_results(job_dataframes, motif_results, op_counts).to_dict()
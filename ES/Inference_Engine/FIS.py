@@ -1,21 +1,202 @@
 import numpy as np
 import skfuzzy as fuzz
 from skfuzzy import control as ctrl
+from skfuzzy.control.term import Term, TermAggregate
+
+
+def membership(points, x):
+    """
+    Exact value of a trimf/trapmf membership function, like skfuzzy on an infinitely fine universe.
+
+    :param points: Corner points [a, b, c, d] of the trapezoid; triangles have b == c.
+    :param x: Crisp value or array.
+    """
+    a, b, c, d = np.asarray(points, dtype=float)
+    x = np.asarray(x, dtype=float)
+    # Vertical edges (a == b or c == d) of shoulders are steps
+    rising = np.where(b > a, (x - a) / np.where(b > a, b - a, 1.0), x >= a)
+    falling = np.where(d > c, (d - x) / np.where(d > c, d - c, 1.0), x <= d)
+    return np.clip(np.minimum(rising, falling), 0.0, 1.0)
+
+
+def clipped_centroid(points, levels, lower, upper):
+    """
+    Centroid of the union (max) of trapezoids clipped at their levels, in closed form. The aggregated set is
+    piecewise linear; it only changes its slope at the corner points and where two of the edge or level lines
+    cross, so it is integrated exactly between these breakpoints.
+
+    :param points: Array (n, 4) with the corner points of the consequent terms.
+    :param levels: Array (n,) with the activation of every term.
+    :param lower: Lower bound of the output universe.
+    :param upper: Upper bound of the output universe.
+    :return: Centroid, or None if no term is activated.
+    """
+    active = levels > 0
+    points = points[active]
+    levels = levels[active]
+    if not len(levels):
+        return None
+    a, b, c, d = points.T
+
+    # Lines y = slope * x + intercept of all rising edges, falling edges and clip levels
+    rising = b > a
+    falling = d > c
+    slopes = np.concatenate((1 / (b - a)[rising], -1 / (d - c)[falling], np.zeros(len(levels))))
+    intercepts = np.concatenate((-a[rising] / (b - a)[rising], d[falling] / (d - c)[falling], levels))
+    slope_differences = slopes[:, None] - slopes[None, :]
+    crossings = (intercepts[None, :] - intercepts[:, None])[slope_differences != 0] / \
+        slope_differences[slope_differences != 0]
+    breakpoints = np.concatenate(([lower, upper], points.ravel(), crossings))
+    breakpoints = np.unique(breakpoints[(breakpoints >= lower) & (breakpoints <= upper)])
+
+    # The aggregated set is linear between two breakpoints. It is sampled at the thirds of every piece, which
+    # also gets the pieces next to the jumps of shoulders (a == b or c == d) right.
+    x0 = breakpoints[:-1]
+    widths = np.diff(breakpoints)
+    samples = x0[:, None] + widths[:, None] * np.array([1 / 3, 2 / 3])
+    aggregated = np.max(np.minimum(membership(points.T[:, :, None, None], samples[None]),
+                                   levels[:, None, None]), axis=0)
+    mean = aggregated.mean(axis=1)
+    slope = (aggregated[:, 1] - aggregated[:, 0]) * 3 / widths
+    area = (widths * mean).sum()
+    if area <= 0:
+        return None
+    # Integral of x * mu over a linear piece around its midpoint m: width * mu(m) * m + slope * width^3 / 12
+    moment = (widths * mean * (x0 + widths / 2) + slope * widths ** 3 / 12).sum()
+    return moment / area
+
+
+class ExactInference:
+    def __init__(self, rules, membership_points):
+        """
+        Exact Mamdani inference of a skfuzzy rule base with trimf/trapmf terms: AND (min) of the antecedents,
+        OR (max) of rules with the same consequent, min implication, max aggregation and centroid
+        defuzzification, as in skfuzzy but without sampling the universes. The result equals skfuzzy on an
+        infinitely fine universe, at a small constant cost per evaluation.
+
+        :param rules: skfuzzy rules with antecedents built from terms and &.
+        :param membership_points: Dictionary mapping each variable label to a dictionary of the corner points
+                                  [a, b, c, d] of its terms.
+        """
+        self.bounds = {}
+        input_terms = []
+        output_terms = []
+        antecedents = []
+        consequents = []
+        weights = []
+        for rule in rules:
+            self._check_antecedent(rule.antecedent)
+            for term in rule.antecedent_terms + [weighted_term.term for weighted_term in rule.consequent]:
+                universe = term.parent.universe
+                self.bounds[term.parent.label] = (float(universe.min()), float(universe.max()))
+            rule_terms = [(term.parent.label, term.label) for term in rule.antecedent_terms]
+            for term in rule_terms:
+                if term not in input_terms:
+                    input_terms.append(term)
+            for weighted_term in rule.consequent:
+                output_term = (weighted_term.term.parent.label, weighted_term.term.label)
+                if output_term not in output_terms:
+                    output_terms.append(output_term)
+                antecedents.append([input_terms.index(term) for term in rule_terms])
+                consequents.append(output_terms.index(output_term))
+                weights.append(weighted_term.weight)
+
+        # Arrays for one vectorized pass per evaluation: rules with fewer antecedents are padded with a
+        # degree of 1, the neutral element of min
+        self.inputs = list(dict.fromkeys(variable for variable, _ in input_terms))
+        self.outputs = list(dict.fromkeys(variable for variable, _ in output_terms))
+        self.input_variables = np.array([self.inputs.index(variable) for variable, _ in input_terms])
+        self.input_points = np.array([membership_points[variable][label] for variable, label in input_terms]).T
+        self.lower = np.array([self.bounds[variable][0] for variable in self.inputs])
+        self.upper = np.array([self.bounds[variable][1] for variable in self.inputs])
+        width = max(len(rule_terms) for rule_terms in antecedents)
+        self.antecedents = np.array([rule_terms + [len(input_terms)] * (width - len(rule_terms))
+                                     for rule_terms in antecedents])
+        self.consequents = np.array(consequents)
+        self.weights = np.array(weights, dtype=float)
+        self.output_terms = [np.array([index for index, (variable, _) in enumerate(output_terms)
+                                       if variable == output]) for output in self.outputs]
+        self.output_points = np.array([membership_points[variable][label] for variable, label in output_terms])
+
+    @staticmethod
+    def _check_antecedent(antecedent):
+        if isinstance(antecedent, TermAggregate):
+            if antecedent.kind != 'and':
+                raise ValueError("Exact inference only supports antecedents combined with &.")
+            ExactInference._check_antecedent(antecedent.term1)
+            ExactInference._check_antecedent(antecedent.term2)
+        elif not isinstance(antecedent, Term):
+            raise ValueError("Unexpected antecedent type.")
+
+    def compute(self, inputs):
+        """
+        :param inputs: Dictionary mapping the input labels to crisp values. Values outside the universe are
+                       clipped to it, as skfuzzy does.
+        :return: Dictionary mapping the output labels to the crisp outputs. Outputs without any fired rule are
+                 missing, like in skfuzzy.
+        """
+        values = np.clip([float(inputs[variable]) for variable in self.inputs], self.lower, self.upper)
+        degrees = np.append(membership(self.input_points, values[self.input_variables]), 1.0)
+        strengths = degrees[self.antecedents].min(axis=1) * self.weights
+        activations = np.zeros(len(self.output_points))
+        np.maximum.at(activations, self.consequents, strengths)
+
+        results = {}
+        for output, terms in zip(self.outputs, self.output_terms):
+            centroid = clipped_centroid(self.output_points[terms], activations[terms], *self.bounds[output])
+            if centroid is not None:
+                results[output] = centroid
+        return results
+
+
+class PiecewiseLinearSystem:
+    # Common part of the rule bases: terms defined by their corner points and the choice of the inference path
+
+    def _set_membership(self, variable, label, points):
+        # Three points define a trimf, four a trapmf. The corner points are kept for the exact inference.
+        if len(points) == 3:
+            variable[label] = fuzz.trimf(variable.universe, points)
+            points = [points[0], points[1], points[1], points[2]]
+        else:
+            variable[label] = fuzz.trapmf(variable.universe, points)
+        self.membership_points.setdefault(variable.label, {})[label] = [float(point) for point in points]
+
+    def _compute(self, simulation, exact_inference, inputs, output):
+        if self.exact:
+            # KeyError if no rule fires, like skfuzzy
+            return exact_inference.compute(inputs)[output]
+        for label, value in inputs.items():
+            simulation.input[label] = value
+        simulation.compute()
+        return simulation.output[output]
+
+
+class FuzzyControlSystem(PiecewiseLinearSystem):
+    def __init__(self, exact=False, universe=None):
+        """
+        Rule bases of the non-productive energy, non-productive time and productive energy priorities.
+
+        :param exact: If True, the priorities are computed with ExactInference instead of the skfuzzy simulation,
+                      i.e. without the sampling error of the universe.
+        :param universe: Optional. Universe of all variables for the skfuzzy simulation, e.g. a finer one.
+                         Defaults to np.arange(0, 1.1, 0.1).
+        """
+        self.exact = exact
+        universe = np.arange(0, 1.1, 0.1) if universe is None else universe
+        self.membership_points = {}
 
-class FuzzyControlSystem:
-    def __init__(self):
         # Define input variables
-        self.NPEF = ctrl.Antecedent(np.arange(0, 1.1, 0.1), 'Non productive energy factor')
-        self.NPTF = ctrl.Antecedent(np.arange(0, 1.1, 0.1), 'Non productive time factor')
-        self.AEJ = ctrl.Antecedent(np.arange(0, 1.1, 0.1), 'Average energy per job')
-        self.n_i = ctrl.Antecedent(np.arange(0, 1.1, 0.1), 'Number of jobs')
-        self.s2_i = ctrl.Antecedent(np.arange(0, 1.1, 0.1), 'Energetic variance of a job')
-        self.UTR = ctrl.Antecedent(np.arange(0, 1.1, 0.1), 'Unproductive Time Ratio')
+        self.NPEF = ctrl.Antecedent(universe, 'Non productive energy factor')
+        self.NPTF = ctrl.Antecedent(universe, 'Non productive time factor')
+        self.AEJ = ctrl.Antecedent(universe, 'Average energy per job')
+        self.n_i = ctrl.Antecedent(universe, 'Number of jobs')
+        self.s2_i = ctrl.Antecedent(universe, 'Energetic variance of a job')
+        self.UTR = ctrl.Antecedent(universe, 'Unproductive Time Ratio')
 
         # Define output variables for each rule base
-        self.P_energy = ctrl.Consequent(np.arange(0, 1.1, 0.1), 'Priority non-productive energy')
-        self.P_time = ctrl.Consequent(np.arange(0, 1.1, 0.1), 'Priority non-productive time')
-        self.P_prod = ctrl.Consequent(np.arange(0, 1.1, 0.1), 'Priority productive energy')
+        self.P_energy = ctrl.Consequent(universe, 'Priority non-productive energy')
+        self.P_time = ctrl.Consequent(universe, 'Priority non-productive time')
+        self.P_prod = ctrl.Consequent(universe, 'Priority productive energy')
 
         # Generate membership functions and rules
         self._generate_membership_functions()
@@ -24,37 +205,37 @@ class FuzzyControlSystem:
 
     def _generate_membership_functions(self):
         # Membership functions for NPEF, NPTF, AEJ, n_i, s2_i, UTR
-        self.NPEF['low'] = fuzz.trapmf(self.NPEF.universe, [0, 0, 0.30, 0.4])
-        self.NPEF['medium'] = fuzz.trimf(self.NPEF.universe, [0.2, 0.5, 0.8])
-        self.NPEF['high'] = fuzz.trapmf(self.NPEF.universe, [0.7, 0.9, 1, 1])
+        self._set_membership(self.NPEF, 'low', [0, 0, 0.30, 0.4])
+        self._set_membership(self.NPEF, 'medium', [0.2, 0.5, 0.8])
+        self._set_membership(self.NPEF, 'high', [0.7, 0.9, 1, 1])
 
-        self.NPTF['low'] = fuzz.trapmf(self.NPTF.universe, [0, 0.05, 0.10, 0.15])
-        self.NPTF['medium'] = fuzz.trimf(self.NPTF.universe, [0.2, 0.5, 0.8])
-        self.NPTF['high'] = fuzz.trapmf(self.NPTF.universe, [0.7, 0.9, 1, 1])
+        self._set_membership(self.NPTF, 'low', [0, 0.05, 0.10, 0.15])
+        self._set_membership(self.NPTF, 'medium', [0.2, 0.5, 0.8])
+        self._set_membership(self.NPTF, 'high', [0.7, 0.9, 1, 1])
 
-        self.AEJ['low'] = fuzz.trapmf(self.AEJ.universe, [0, 0, 0.30, 0.4])
-        self.AEJ['medium'] = fuzz.trimf(self.AEJ.universe, [0.2, 0.5, 0.8])
-        self.AEJ['high'] = fuzz.trapmf(self.AEJ.universe, [0.7, 0.9, 1, 1])
+        self._set_membership(self.AEJ, 'low', [0, 0, 0.30, 0.4])
+        self._set_membership(self.AEJ, 'medium', [0.2, 0.5, 0.8])
+        self._set_membership(self.AEJ, 'high', [0.7, 0.9, 1, 1])
 
-        self.n_i['low'] = fuzz.trapmf(self.n_i.universe, [0, 0, 0.30, 0.4])
-        self.n_i['medium'] = fuzz.trimf(self.n_i.universe, [0.2, 0.5, 0.8])
-        self.n_i['high'] = fuzz.trapmf(self.n_i.universe, [0.7, 0.9, 1, 1])
+        self._set_membership(self.n_i, 'low', [0, 0, 0.30, 0.4])
+        self._set_membership(self.n_i, 'medium', [0.2, 0.5, 0.8])
+        self._set_membership(self.n_i, 'high', [0.7, 0.9, 1, 1])
 
-        self.s2_i['low'] = fuzz.trapmf(self.s2_i.universe, [0, 0, 0.30, 0.4])
-        self.s2_i['medium'] = fuzz.trimf(self.s2_i.universe, [0.2, 0.5, 0.8])
-        self.s2_i['high'] = fuzz.trapmf(self.s2_i.universe, [0.7, 0.9, 1, 1])
+        self._set_membership(self.s2_i, 'low', [0, 0, 0.30, 0.4])
+        self._set_membership(self.s2_i, 'medium', [0.2, 0.5, 0.8])
+        self._set_membership(self.s2_i, 'high', [0.7, 0.9, 1, 1])
 
-        self.UTR['low'] = fuzz.trapmf(self.s2_i.universe, [0, 0, 0.30, 0.4])
-        self.UTR['medium'] = fuzz.trimf(self.s2_i.universe, [0.2, 0.5, 0.8])
-        self.UTR['high'] = fuzz.trapmf(self.s2_i.universe, [0.7, 0.9, 1, 1])
+        self._set_membership(self.UTR, 'low', [0, 0, 0.30, 0.4])
+        self._set_membership(self.UTR, 'medium', [0.2, 0.5, 0.8])
+        self._set_membership(self.UTR, 'high', [0.7, 0.9, 1, 1])
 
         # Membership functions for outputs
         for var in [self.P_energy, self.P_time, self.P_prod]:
-            var['very low'] = fuzz.trapmf(var.universe, [0, 0, 0.1, 0.2])
-            var['low'] = fuzz.trimf(var.universe, [0.1, 0.3, 0.5])
-            var['medium'] = fuzz.trimf(var.universe, [0.3, 0.5, 0.7])
-            var['high'] = fuzz.trimf(var.universe, [0.5, 0.7, 0.9])
-            var['very high'] = fuzz.trapmf(var.universe, [0.8, 0.9, 1, 1])
+            self._set_membership(var, 'very low', [0, 0, 0.1, 0.2])
+            self._set_membership(var, 'low', [0.1, 0.3, 0.5])
+            self._set_membership(var, 'medium', [0.3, 0.5, 0.7])
+            self._set_membership(var, 'high', [0.5, 0.7, 0.9])
+            self._set_membership(var, 'very high', [0.8, 0.9, 1, 1])
 
     def _define_rules(self):
         # Rule base 1: Minimization of non-productive energy
@@ -131,34 +312,43 @@ class FuzzyControlSystem:
         self.P_time_simulation = ctrl.ControlSystemSimulation(self.P_time_ctrl)
         self.P_prod_simulation = ctrl.ControlSystemSimulation(self.P_prod_ctrl)
 
+        # Exact inference of the same rule bases
+        self.P_energy_exact = ExactInference(self.rules[:9], self.membership_points)
+        self.P_time_exact = ExactInference(self.rules[9:18], self.membership_points)
+        self.P_prod_exact = ExactInference(self.rules[18:], self.membership_points)
+
     def set_input_P_energy(self, npef_value, nptf_value):
-        self.P_energy_simulation.input['Non productive energy factor'] = npef_value
-        self.P_energy_simulation.input['Non productive time factor'] = nptf_value
-        self.P_energy_simulation.compute()
-        return self.P_energy_simulation.output['Priority non-productive energy']
+        return self._compute(self.P_energy_simulation, self.P_energy_exact,
+                             {'Non productive energy factor': npef_value, 'Non productive time factor': nptf_value},
+                             'Priority non-productive energy')
 
     def set_input_P_time(self, nptf_value, UTR_value):
-        self.P_time_simulation.input['Unproductive Time Ratio'] = UTR_value
-        self.P_time_simulation.input['Non productive time factor'] = nptf_value
-        self.P_time_simulation.compute()
-        return self.P_time_simulation.output['Priority non-productive time']
+        return self._compute(self.P_time_simulation, self.P_time_exact,
+                             {'Unproductive Time Ratio': UTR_value, 'Non productive time factor': nptf_value},
+                             'Priority non-productive time')
 
     def set_input_P_prod(self, aej_value, n_i_value, s2_i_value):
-        self.P_prod_simulation.input['Average energy per job'] = aej_value
-        self.P_prod_simulation.input['Number of jobs'] = n_i_value
-        self.P_prod_simulation.input['Energetic variance of a job'] = s2_i_value
-        self.P_prod_simulation.compute()
-        return self.P_prod_simulation.output['Priority productive energy']
-
-class FuzzyCombinedSystem:
-    def __init__(self):
+        return self._compute(self.P_prod_simulation, self.P_prod_exact,
+                             {'Average energy per job': aej_value, 'Number of jobs': n_i_value,
+                              'Energetic variance of a job': s2_i_value},
+                             'Priority productive energy')
+
+class FuzzyCombinedSystem(PiecewiseLinearSystem):
+    def __init__(self, exact=False, universe=None):
+        """
+        Rule base combining the three priorities, see FuzzyControlSystem for the parameters.
+        """
+        self.exact = exact
+        universe = np.arange(0, 1.1, 0.1) if universe is None else universe
+        self.membership_points = {}
+
         # Define input variables for the combined system
-        self.P_e_np = ctrl.Antecedent(np.arange(0, 1.1, 0.1), 'Priority non-productive energy')
-        self.P_t_np = ctrl.Antecedent(np.arange(0, 1.1, 0.1), 'Priority non-productive time')
-        self.P_e_p = ctrl.Antecedent(np.arange(0, 1.1, 0.1), 'Priority productive energy')
+        self.P_e_np = ctrl.Antecedent(universe, 'Priority non-productive energy')
+        self.P_t_np = ctrl.Antecedent(universe, 'Priority non-productive time')
+        self.P_e_p = ctrl.Antecedent(universe, 'Priority productive energy')
 
         # Define the output variable for the combined system
-        self.P_combined = ctrl.Consequent(np.arange(0, 1.1, 0.1), 'Priority combined energy')
+        self.P_combined = ctrl.Consequent(universe, 'Priority combined energy')
 
         # Generate membership functions and rules for the combined system
         self._generate_membership_functions()
@@ -168,18 +358,18 @@ class FuzzyCombinedSystem:
     def _generate_membership_functions(self):
         # Membership functions for P_e_np, P_t_np, P_e_p
         for var in [self.P_e_np, self.P_t_np, self.P_e_p]:
-            var['very low'] = fuzz.trapmf(var.universe, [0, 0, 0.1, 0.2])
-            var['low'] = fuzz.trimf(var.universe, [0.1, 0.3, 0.5])
-            var['medium'] = fuzz.trimf(var.universe, [0.3, 0.5, 0.7])
-            var['high'] = fuzz.trimf(var.universe, [0.5, 0.7, 0.9])
-            var['very high'] = fuzz.trapmf(var.universe, [0.8, 0.9, 1, 1])
+            self._set_membership(var, 'very low', [0, 0, 0.1, 0.2])
+            self._set_membership(var, 'low', [0.1, 0.3, 0.5])
+            self._set_membership(var, 'medium', [0.3, 0.5, 0.7])
+            self._set_membership(var, 'high', [0.5, 0.7, 0.9])
+            self._set_membership(var, 'very high', [0.8, 0.9, 1, 1])
 
         # Membership functions for P_combined
-        self.P_combined['very low'] = fuzz.trapmf(self.P_combined.universe, [0, 0, 0.1, 0.2])
-        self.P_combined['low'] = fuzz.trimf(self.P_combined.universe, [0.1, 0.3, 0.5])
-        self.P_combined['medium'] = fuzz.trimf(self.P_combined.universe, [0.3, 0.5, 0.7])
-        self.P_combined['high'] = fuzz.trimf(self.P_combined.universe, [0.5, 0.7, 0.9])
-        self.P_combined['very high'] = fuzz.trapmf(self.P_combined.universe, [0.8, 0.9, 1, 1])
+        self._set_membership(self.P_combined, 'very low', [0, 0, 0.1, 0.2])
+        self._set_membership(self.P_combined, 'low', [0.1, 0.3, 0.5])
+        self._set_membership(self.P_combined, 'medium', [0.3, 0.5, 0.7])
+        self._set_membership(self.P_combined, 'high', [0.5, 0.7, 0.9])
+        self._set_membership(self.P_combined, 'very high', [0.8, 0.9, 1, 1])
 
     def _define_combined_rules(self):
         # Define the rules for the combined system based on the outputs of the previous systems
@@ -204,11 +394,11 @@ class FuzzyCombinedSystem:
         # Create the control system for the combined rule base
         self.P_combined_ctrl = ctrl.ControlSystem(self.combined_rules)
         self.P_combined_simulation = ctrl.ControlSystemSimulation(self.P_combined_ctrl)
+        self.P_combined_exact = ExactInference(self.combined_rules, self.membership_points)
 
     def set_input_P_combined(self, p_e_np, p_t_np, p_e_p):
         # Set inputs for the combined rule base
-        self.P_combined_simulation.input['Priority non-productive energy'] = p_e_np
-        self.P_combined_simulation.input['Priority non-productive time'] = p_t_np
-        self.P_combined_simulation.input['Priority productive energy'] = p_e_p
-        self.P_combined_simulation.compute()
-        return self.P_combined_simulation.output['Priority combined energy']
\ No newline at end of file
+        return self._compute(self.P_combined_simulation, self.P_combined_exact,
+                             {'Priority non-productive energy': p_e_np, 'Priority non-productive time': p_t_np,
+                              'Priority productive energy': p_e_p},
+                             'Priority combined energy')
\ No newline at end of file
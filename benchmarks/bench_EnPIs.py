@@ -0,0 +1,65 @@
+import sys
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+# Add the Inference_Engine directory to the system path
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ES', 'Inference_Engine'))
+
+from EnPIs import calculate_EnPIs
+from synthetic import generate_power_traces
+
+
+def synthetic_job_results(n_machines, n_job_types, n_samples=20000, cycles_per_job=4, seed=0):
+    """
+    Builds job dataframes and motif results for a synthetic production line, from the traces of
+    synthetic.generate_power_traces with the ground truth cycles as detected motifs.
+
+    :param n_machines: Number of machine columns.
+    :param n_job_types: Number of job types per machine.
+    :param n_samples: Number of 1 Hz samples per machine.
+    :param cycles_per_job: Average number of cycles per job type, sets the cycle lengths.
+    :return: Tuple (job_dataframes, motif_results, op_counts) as used by calculate_EnPIs.
+    """
+    rng = np.random.default_rng(seed)
+    slot = n_samples // (n_job_types * cycles_per_job)
+    line = {}
+    for m in range(n_machines):
+        jobs = {}
+        for k in range(n_job_types):
+            base_power = float(rng.uniform(500, 3000))
+            jobs[f"OP {m * n_job_types + k}"] = (int(rng.integers(slot // 2, slot)), base_power,
+                                                 base_power + float(rng.uniform(500, 2000)))
+        line[f"Machine {m}"] = {"idle": float(rng.uniform(100, 500)), "jobs": jobs}
+    df, ground_truth, _ = generate_power_traces(n_samples, line=line, idle_range=(max(slot // 8, 1), max(slot // 4, 2)),
+                                                job_share=0.8, seed=seed)
+
+    job_dataframes = {}
+    motif_results = {}
+    op_counts = {}
+    for column, truth in ground_truth.items():
+        job_dataframes[column] = pd.DataFrame({column: df[column], 'Job': None})
+        job_numbers = {job: n for n, job in enumerate(line[column]["jobs"])}
+        motif_results[column] = [(start, length, job_numbers[job], job) for start, length, job in truth]
+        for job in line[column]["jobs"]:
+            op_counts[f"{job.replace(' ', '_')}_parts"] = 1
+    return job_dataframes, motif_results, op_counts
+
+
+def bench_calculate_EnPIs(sizes=((10, 50), (25, 50), (50, 50), (100, 50)), repeat=3):
+    for n_machines, n_job_types in sizes:
+        job_dataframes, motif_results, op_counts = synthetic_job_results(n_machines, n_job_types)
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            calculate_EnPIs(job_dataframes, motif_results, op_counts)
+            timings.append(time.perf_counter() - start)
+        best = min(timings)
+        print(f"calculate_EnPIs {n_machines:4d} machines x {n_job_types:3d} job types: "
+              f"{best:8.4f} s ({best / n_machines * 1000:.2f} ms per machine)")
+
+
+if __name__ == "__main__":
+    bench_calculate_EnPIs()
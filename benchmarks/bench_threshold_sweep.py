@@ -0,0 +1,97 @@
+import sys
+import os
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+# Add the Helpers and Inference_Engine directories to the system path
+benchmarks_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(benchmarks_path, '..', 'ES', 'Helpers'))
+sys.path.append(os.path.join(benchmarks_path, '..', 'ES', 'Inference_Engine'))
+
+from algorithms import MotifFinder
+from threshold_sweep import ThresholdSweep
+from EnPIs import calculate_EnPI_results
+from synthetic import generate_power_traces
+
+
+def serial_sweep(sweep, thresholds, op_counts):
+    """
+    Reference for ThresholdSweep.run: selects the candidates of every threshold, resolves their overlaps with
+    MotifFinder.resolve_overlaps and calculates the EnPIs from the job dataframes, one threshold after the other.
+
+    :param sweep: ThresholdSweep with the matched candidates.
+    :param thresholds: Thresholds of all patterns.
+    :param op_counts: Parts per job for the EnPIs.
+    :return: Tuple (motifs, counts, enpis) with the motif results, the cycle counts per job and the EnPIResults,
+             each as a dictionary by threshold.
+    """
+    finder = sweep.finder
+    motifs = {}
+    counts = {}
+    enpis = {}
+    for threshold in thresholds:
+        motif_results = {column: [] for column in sweep.columns}
+        for candidate in sweep.candidates:
+            accepted = candidate['critical'] <= threshold
+            job = candidate['job']
+            motif_results[candidate['column']].extend(
+                (start, candidate['length'], finder.color_map[job], job, energy) for start, energy in
+                zip(candidate['starts'][accepted].tolist(), candidate['energies'][accepted].tolist()))
+        motif_results = finder.resolve_overlaps(motif_results)
+        motifs[threshold] = motif_results
+        job_counts = dict.fromkeys(sweep.jobs, 0)
+        for column_motifs in motif_results.values():
+            for _, _, _, job in column_motifs:
+                job_counts[job] += 1
+        counts[threshold] = job_counts
+        enpis[threshold] = calculate_EnPI_results(finder.create_jobs_dataframe(motif_results), motif_results,
+                                                  op_counts)
+    return motifs, counts, enpis
+
+
+def bench_threshold_sweep(sizes, n_machines, n_thresholds, repeat=3):
+    thresholds = np.round(np.linspace(0.05, 0.95, n_thresholds), 4).tolist()
+    print(f"{'samples':>12s} {'thresholds':>10s} {'serial s':>10s} {'sweep s':>10s} {'speedup':>8s} {'equal':>6s}")
+    for n_samples in sizes:
+        df, _, patterns = generate_power_traces(n_samples, n_machines=n_machines)
+        finder = MotifFinder(df)
+        op_counts = {}
+        for pattern in patterns:
+            finder.add_pattern(*pattern)
+            op_counts[f"{pattern[4].replace(' ', '_')}_parts"] = 1
+        sweep = ThresholdSweep(finder)
+        sweep.run(thresholds[:1], op_counts)  # Compiles the overlap resolution
+
+        serial_seconds = []
+        sweep_seconds = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            motifs, counts, enpis = serial_sweep(sweep, thresholds, op_counts)
+            serial_seconds.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            results = sweep.run(thresholds, op_counts)
+            sweep_seconds.append(time.perf_counter() - start)
+
+        equal = (results.motifs == motifs
+                 and results.counts.equals(pd.DataFrame.from_dict(counts, orient='index', columns=sweep.jobs,
+                                                                  dtype=np.int64).rename_axis('threshold'))
+                 and all(results.enpis[t].machines.equals(enpis[t].machines)
+                         and results.enpis[t].jobs.equals(enpis[t].jobs) for t in thresholds))
+        serial_best, sweep_best = min(serial_seconds), min(sweep_seconds)
+        print(f"{n_samples:12d} {len(thresholds):10d} {serial_best:10.3f} {sweep_best:10.3f} "
+              f"{serial_best / sweep_best:8.1f} {str(equal):>6s}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compares ThresholdSweep.run with a serial loop of "
+                                                 "resolve_overlaps, create_jobs_dataframe and calculate_EnPI_results.")
+    parser.add_argument('--sizes', type=float, nargs='+', default=[1e4, 1e5, 1e6], help="Samples per machine.")
+    parser.add_argument('--machines', type=int, default=5, help="Number of machine columns.")
+    parser.add_argument('--thresholds', type=int, default=50, help="Number of thresholds between 0.05 and 0.95.")
+    parser.add_argument('--repeat', type=int, default=3, help="Repetitions, the best time is reported.")
+    args = parser.parse_args()
+
+    bench_threshold_sweep([int(size) for size in args.sizes], args.machines, args.thresholds, args.repeat)
@@ -0,0 +1,162 @@
+import sys
+import os
+import time
+import argparse
+import tracemalloc
+
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')  # Plot without a display
+import matplotlib.pyplot as plt
+
+# Add the Helpers and Inference_Engine directories to the system path
+benchmarks_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(benchmarks_path, '..', 'ES', 'Helpers'))
+sys.path.append(os.path.join(benchmarks_path, '..', 'ES', 'Inference_Engine'))
+
+from algorithms import MotifFinder
+from metrics import Metrics, JsonLinesSink, PrometheusTextSink, disabled_metrics
+from matching import MatchingEngine, default_engine
+from EnPIs import calculate_EnPIs
+from FIS import FuzzyControlSystem, FuzzyCombinedSystem
+from visualizer import JobPlotter, JobPlotterColored
+from line_analysis import LineAnalysis
+from synthetic import generate_power_traces, overlapping_candidates
+
+
+def measure(function, memory=False):
+    """
+    Runs function once and returns (result, seconds, peak MiB). The peak memory is only traced
+    when memory is True, because tracemalloc slows down the measured code.
+    """
+    # Tracing may already run for the metrics (--metrics --memory), then it is left running
+    tracing = tracemalloc.is_tracing()
+    if memory:
+        if not tracing:
+            tracemalloc.start()
+        start_memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+    start = time.perf_counter()
+    result = function()
+    seconds = time.perf_counter() - start
+    peak = None
+    if memory:
+        peak = max(tracemalloc.get_traced_memory()[1] - start_memory, 0) / 2 ** 20
+        if not tracing:
+            tracemalloc.stop()
+    return result, seconds, peak
+
+
+def fuzzy_inference(n_evaluations, exact=False):
+    # Builds the rule bases and evaluates them like the knowledge base notebook does per machine and job
+    fuzzy_system = FuzzyControlSystem(exact=exact)
+    combined_system = FuzzyCombinedSystem(exact=exact)
+    rng = np.random.default_rng(0)
+    for values in rng.uniform(0.01, 0.99, (n_evaluations, 6)):
+        try:
+            p_e_np = fuzzy_system.set_input_P_energy(values[0], values[1])
+            p_t_np = fuzzy_system.set_input_P_time(values[1], values[2])
+            p_e_p = fuzzy_system.set_input_P_prod(values[3], values[4], values[5])
+            combined_system.set_input_P_combined(p_e_np, p_t_np, p_e_p)
+        except KeyError:
+            pass  # No rule fires for these inputs
+
+
+def n_evaluations(motif_results):
+    # One evaluation per machine and job
+    return len(motif_results) + len({job for motifs in motif_results.values() for _, _, _, job in motifs})
+
+
+def timed(metrics, stage, function, *args):
+    with metrics.stage(stage):
+        return function(*args)
+
+
+def line_analysis(df, motif_results):
+    analysis = LineAnalysis(motif_results, df=df)
+    return analysis.station_table(), analysis.line_table(), analysis.concurrent_peaks()
+
+
+def plot(plotter_class, df, motif_results):
+    plotter_class(df, motif_results).plot()
+    plt.close('all')
+
+
+def run(sizes, n_machines, stages, memory, max_plot_samples, dtype, stretch, metrics=disabled_metrics,
+        engine=default_engine):
+    op_counts = {}
+    print(f"{'stage':24s} {'samples':>12s} {'seconds':>10s} {'peak MiB':>10s}")
+    for n_samples in sizes:
+        with metrics.stage('load', samples=n_samples):
+            df, ground_truth, patterns = generate_power_traces(n_samples, n_machines=n_machines, dtype=dtype,
+                                                               stretch=stretch)
+        finder = MotifFinder(df, metrics=metrics, engine=engine)
+        for column, start, end, threshold, job in patterns:
+            finder.add_pattern(column, start, end, threshold, job)
+            op_counts[f"{job.replace(' ', '_')}_parts"] = 1
+
+        motif_results = None
+        job_dataframes = None
+        benchmarks = {
+            'find_motifs': lambda: finder.find_motifs(),
+            'resolve_overlaps': lambda: finder.resolve_overlaps(overlapping_candidates(ground_truth)),
+            'create_jobs_dataframe': lambda: finder.create_jobs_dataframe(),
+            'calculate_EnPIs': lambda: timed(metrics, 'enpi', calculate_EnPIs, job_dataframes, motif_results,
+                                             op_counts),
+            'FIS': lambda: timed(metrics, 'fis', fuzzy_inference, n_evaluations(motif_results)),
+            'FIS_exact': lambda: timed(metrics, 'fis_exact', fuzzy_inference, n_evaluations(motif_results), True),
+            'line_analysis': lambda: timed(metrics, 'line_analysis', line_analysis, df, motif_results),
+            'JobPlotter': lambda: plot(JobPlotter, df, motif_results),
+            'JobPlotterColored': lambda: plot(JobPlotterColored, df, motif_results),
+        }
+
+        for stage in stages:
+            if stage.startswith('JobPlotter') and n_samples > max_plot_samples:
+                continue
+            if stage in ('calculate_EnPIs', 'FIS', 'FIS_exact', 'line_analysis', 'JobPlotter', 'JobPlotterColored') \
+                    and motif_results is None:
+                motif_results = finder.find_motifs()
+            if stage == 'calculate_EnPIs' and job_dataframes is None:
+                job_dataframes = finder.create_jobs_dataframe()
+
+            result, seconds, _ = measure(benchmarks[stage])
+            peak = measure(benchmarks[stage], memory=True)[2] if memory else None
+            if stage == 'find_motifs':
+                motif_results = result
+            elif stage == 'create_jobs_dataframe':
+                job_dataframes = result
+
+            peak_text = f"{peak:10.1f}" if peak is not None else f"{'-':>10s}"
+            print(f"{stage:24s} {n_samples:12d} {seconds:10.3f} {peak_text}")
+
+
+STAGES = ['find_motifs', 'resolve_overlaps', 'create_jobs_dataframe', 'calculate_EnPIs', 'FIS', 'FIS_exact',
+          'line_analysis', 'JobPlotter', 'JobPlotterColored']
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Times the expert system pipeline on synthetic power traces.")
+    parser.add_argument('--sizes', type=float, nargs='+', default=[1e4, 1e5, 1e6],
+                        help="Samples per machine, up to 1e8.")
+    parser.add_argument('--machines', type=int, default=5, help="Number of machine columns.")
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES)
+    parser.add_argument('--memory', action='store_true', help="Also measure the peak memory of every stage.")
+    parser.add_argument('--max-plot-samples', type=float, default=1e6,
+                        help="Skip the plotting stages above this size.")
+    parser.add_argument('--float32', action='store_true', help="Generate float32 traces to halve the memory.")
+    parser.add_argument('--stretch', type=float, default=0.0,
+                        help="Maximum relative change of the cycle durations, e.g. 0.05.")
+    parser.add_argument('--backend', choices=['auto', 'stumpy', 'mass', 'naive'], default='auto',
+                        help="Matching backend of find_motifs; 'auto' picks the fastest one per pattern length.")
+    parser.add_argument('--metrics', help="Write stage timings and match funnel counters to this JSON lines "
+                                          "file, or to a Prometheus text file if the name ends with .prom.")
+    args = parser.parse_args()
+
+    metrics = disabled_metrics
+    if args.metrics:
+        sink = PrometheusTextSink(args.metrics) if args.metrics.endswith('.prom') else JsonLinesSink(args.metrics)
+        metrics = Metrics(sink, memory=args.memory)
+
+    with metrics:
+        run([int(size) for size in args.sizes], args.machines, args.stages, args.memory,
+            args.max_plot_samples, np.float32 if args.float32 else np.float64, args.stretch, metrics,
+            MatchingEngine(backend=args.backend))
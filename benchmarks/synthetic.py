@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+
+
+# Job cycles of the ETA Factory line: duration in s, idle, base and peak power in W
+DEFAULT_LINE = {
+    "EMAG VLC100 Y": {"idle": 2800, "jobs": {"OP 10": (320, 6000, 14000), "OP 11": (100, 5000, 9000)}},
+    "MAFAC JAVA": {"idle": 220, "jobs": {"OP 20": (800, 4000, 11000)}},
+    "IVA RH 655": {"idle": 190, "jobs": {"OP 30": (3600, 9000, 16000)}},
+    "EMAG VLC100 GT": {"idle": 2150, "jobs": {"OP 40": (70, 7400, 12000), "OP 41": (160, 8700, 11800)}},
+    "MAFAC KEA": {"idle": 110, "jobs": {"OP 50": (750, 3000, 9000)}},
+}
+
+
+def job_cycle(duration, base_power, peak_power, seed=0):
+    """
+    Builds a deterministic power profile of one job cycle: a ramp up, a plateau with
+    machining peaks and a ramp down.
+
+    :param duration: Cycle length in samples (1 Hz).
+    :param base_power: Power of the plateau in W.
+    :param peak_power: Power of the machining peaks in W.
+    :param seed: Seed of the peak positions, so that different jobs get different shapes.
+    :return: 1D array with the power profile.
+    """
+    rng = np.random.default_rng(seed)
+    t = np.linspace(0, 1, duration)
+    ramp = np.clip(np.minimum(t, 1 - t) * 10, 0, 1)
+    peaks = np.zeros(duration)
+    for center in rng.uniform(0.15, 0.85, 4):
+        peaks += np.exp(-((t - center) / 0.03) ** 2)
+    return ramp * (base_power + (peak_power - base_power) * np.minimum(peaks, 1))
+
+
+def generate_power_traces(n_samples, line=None, n_machines=None, idle_range=(30, 600), job_share=0.6,
+                          stretch=0.0, noise=0.01, dtype=np.float64, seed=0):
+    """
+    Generates multi-machine 1 Hz active power traces with known job cycles.
+
+    :param n_samples: Number of samples per machine (up to 1e8; use dtype=np.float32 to halve the memory).
+    :param line: Optional. Machine definitions like DEFAULT_LINE.
+    :param n_machines: Optional. Number of machine columns; the line is repeated to reach it.
+    :param idle_range: Minimum and maximum length of an idle period in samples.
+    :param job_share: Probability that the next segment is a job cycle instead of an idle period.
+    :param stretch: Maximum relative change of the cycle duration (e.g. 0.05 for +-5 %).
+    :param noise: Standard deviation of the multiplicative measurement noise.
+    :param dtype: Data type of the generated columns.
+    :param seed: Random seed.
+    :return: Tuple (df, ground_truth, patterns). ground_truth maps each column to a list of
+             (start, length, job) tuples; patterns is a list of add_pattern arguments
+             (column, start, end, threshold, job) taken from the first cycle of every job.
+    """
+    line = line or DEFAULT_LINE
+    rng = np.random.default_rng(seed)
+    names = list(line)
+    n_machines = n_machines or len(names)
+
+    data = {}
+    ground_truth = {}
+    patterns = []
+    for m in range(n_machines):
+        name = names[m % len(names)]
+        column = name if m < len(names) else f"{name} {m // len(names) + 1}"
+        definition = line[name]
+        jobs = list(definition["jobs"].items())
+        cycles = {job: job_cycle(*parameters, seed=n) for n, (job, parameters) in enumerate(jobs)}
+
+        segments = []
+        truth = []
+        position = 0
+        while position < n_samples:
+            if rng.random() < job_share:
+                job = jobs[rng.integers(len(jobs))][0]
+                cycle = cycles[job]
+                if stretch:
+                    length = max(4, int(round(len(cycle) * (1 + rng.uniform(-stretch, stretch)))))
+                    cycle = np.interp(np.linspace(0, len(cycle) - 1, length), np.arange(len(cycle)), cycle)
+                segment = definition["idle"] + cycle
+                if position + len(segment) <= n_samples:
+                    truth.append((position, len(segment), job))
+            else:
+                segment = np.full(int(rng.integers(*idle_range)), float(definition["idle"]))
+            segments.append(segment.astype(dtype))
+            position += len(segment)
+
+        values = np.concatenate(segments)[:n_samples]
+        # Multiplicative noise, added in chunks to bound the temporary memory
+        for start in range(0, n_samples, 10_000_000):
+            chunk = values[start:start + 10_000_000]
+            chunk *= (1 + noise * rng.standard_normal(len(chunk))).astype(dtype)
+
+        data[column] = values
+        ground_truth[column] = truth
+        for job in cycles:
+            first = next((t for t in truth if t[2] == job), None)
+            if first is not None:
+                patterns.append((column, first[0], first[0] + first[1], 0.3, job))
+
+    return pd.DataFrame(data), ground_truth, patterns
+
+
+def overlapping_candidates(ground_truth, duplicates=3, max_shift=20, seed=0):
+    """
+    Builds raw (not yet overlap-resolved) motif results around the ground truth, as find_motifs
+    produces them when several templates hit the same cycle.
+
+    :return: Dictionary mapping each column to (start, length, color index, job, energy) tuples.
+    """
+    rng = np.random.default_rng(seed)
+    results = {}
+    for column, truth in ground_truth.items():
+        results[column] = []
+        for start, length, job in truth:
+            for _ in range(duplicates + 1):
+                shift = int(rng.integers(-max_shift, max_shift + 1))
+                results[column].append((max(0, start + shift), length, 0, job, float(rng.random())))
+    return results
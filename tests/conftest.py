@@ -0,0 +1,39 @@
+import sys
+import os
+
+import pandas as pd
+import pytest
+
+# Add the Helpers, Inference_Engine and benchmarks directories to the system path, like the notebooks do
+tests_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(tests_path, '..', 'ES', 'Helpers'))
+sys.path.append(os.path.join(tests_path, '..', 'ES', 'Inference_Engine'))
+sys.path.append(os.path.join(tests_path, '..', 'benchmarks'))
+
+SAMPLE_DATA = os.path.join(tests_path, '..', 'ES', 'Knowledge_Base', 'Sample_Data', 'sample_data.csv')
+
+# Patterns registered in the knowledge base notebook, without its duplicated OP 41 entry:
+# (column, input_start, input_end, input_threshold, job)
+NOTEBOOK_PATTERNS = [
+    ("EMAG VLC100 Y", 3640, 3963, 0.2, "OP 10"),
+    ("EMAG VLC100 Y", 11690, 11792, 0.2, "OP 11"),
+    ("MAFAC JAVA", 3996, 4801, 0.6, "OP 20"),
+    ("IVA RH 655", 1112, 4701, 0.6, "OP 30"),
+    ("EMAG VLC100 GT", 919, 982, 0.3, "OP 40"),
+    ("EMAG VLC100 GT", 4002, 4071, 0.8, "OP 40"),
+    ("EMAG VLC100 GT", 997, 1064, 0.5, "OP 40"),
+    ("EMAG VLC100 GT", 1155, 1228, 0.6, "OP 40"),
+    ("EMAG VLC100 GT", 623, 699, 0.4, "OP 40"),
+    ("EMAG VLC100 GT", 8868, 9025, 0.3, "OP 41"),
+    ("EMAG VLC100 GT", 9213, 9374, 0.3, "OP 41"),
+    ("EMAG VLC100 GT", 9734, 9895, 0.3, "OP 41"),
+    ("EMAG VLC100 GT", 9908, 10070, 0.3, "OP 41"),
+    ("MAFAC KEA", 380, 1134, 0.9, "OP 50"),
+    ("MAFAC KEA", 1300, 2040, 0.2, "OP 50"),
+    ("MAFAC KEA", 3429, 4180, 0.9, "OP 50"),
+]
+
+
+@pytest.fixture(scope='session')
+def sample_data():
+    return pd.read_csv(SAMPLE_DATA, sep=';', header=0, decimal=",")
@@ -0,0 +1,71 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from case_knowledge import CaseKnowledgeStore, default_case_knowledge_csv
+
+
+@pytest.fixture
+def store(tmp_path):
+    with CaseKnowledgeStore(str(tmp_path / 'cases.sqlite')) as store:
+        yield store
+
+
+def test_csv_round_trip_keeps_numbers_text_and_precision(store, tmp_path):
+    csv_path = tmp_path / 'cases.csv'
+    csv_path.write_text("Timestamp,Variable,Value,Unit\n"
+                        "2024-12-11 12:00,Temperature,75,°C\n"
+                        "2024-12-11 12:00,Recommendation,Reduce idle time,\n"
+                        "2024-12-11 12:00:00.5,Temperature,76,°C\n", encoding='utf-8')
+    assert store.ingest_csv(str(csv_path)) == 3
+
+    cases = store.query()
+    assert cases['Timestamp'].tolist() == [pd.Timestamp('2024-12-11 12:00'), pd.Timestamp('2024-12-11 12:00'),
+                                           pd.Timestamp('2024-12-11 12:00:00.5')]
+    assert cases['Value'].tolist() == ['Reduce idle time', 75.0, 76.0]
+    assert store.query('Temperature', start='2024-12-11 12:00:00.1')['Value'].tolist() == [76.0]
+
+
+def test_collisions_raise_unless_replaced(store):
+    store.add_case('2024-12-12 08:00:00.25', {'Temperature': 70})
+    with pytest.raises(ValueError):
+        store.add_case('2024-12-12 08:00:00.25', {'Temperature': 71})
+    store.add_case('2024-12-12 08:00:00.26', {'Temperature': 72})
+    store.add_case('2024-12-12 08:00:00.25', {'Temperature': 71}, replace=True)
+    assert store.query('Temperature')['Value'].tolist() == [71.0, 72.0]
+    with pytest.raises(ValueError):
+        store.add_case(pd.Timestamp('2024-12-12 08:00') + pd.Timedelta(1, 'ns'), {'Temperature': 1})
+
+
+def test_similar_cases_return_the_recommendations(store):
+    store.add_case('2024-12-12 08:00', {'NPEF': 0.2, 'NPTF': 0.3, 'Recommendation': 'Switch off at night'})
+    store.add_case('2024-12-13 08:00', {'NPEF': 0.8, 'NPTF': 0.7, 'Recommendation': 'Shorten idle periods'})
+    store.add_case('2024-12-14 08:00', {'NPEF': 0.5, 'NPTF': 0.5})
+    assert store.build_similarity_index(['NPEF', 'NPTF']) == 3
+
+    similar = store.similar_cases({'NPEF': 0.75, 'NPTF': 0.75}, k=2)
+    assert similar['Timestamp'].tolist() == [pd.Timestamp('2024-12-13 08:00'), pd.Timestamp('2024-12-14 08:00')]
+    assert similar['Recommendation'].iloc[0] == 'Shorten idle periods'
+    assert similar['Distance'].is_monotonic_increasing
+
+
+def test_stores_of_the_first_schema_are_migrated(tmp_path):
+    path = str(tmp_path / 'old.sqlite')
+    connection = sqlite3.connect(path)
+    connection.executescript("""
+        CREATE TABLE case_knowledge (variable TEXT NOT NULL, timestamp TEXT NOT NULL, value REAL, unit TEXT,
+                                     PRIMARY KEY (variable, timestamp)) WITHOUT ROWID;
+        INSERT INTO case_knowledge VALUES ('Temperature', '2024-01-01 00:00:00', 1.0, '°C');
+    """)
+    connection.close()
+    with CaseKnowledgeStore(path) as store:
+        store.add_case('2024-01-01 00:00:01', {'Recommendation': 'Check'})
+        assert store.query(start='2024-01-01', end='2024-01-01')['Value'].tolist() == [1.0]
+        with pytest.raises(ValueError):
+            store.add_case('2024-01-01', {'Temperature': 2.0})
+
+
+def test_the_shipped_case_knowledge_file_ingests(store):
+    n_rows = store.ingest_csv(default_case_knowledge_csv)
+    assert n_rows == len(store.query()) > 0
@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+
+from column_access import column_values, nan_free_segments, ColumnSegments
+from matching import MassBackend, NaiveBackend, PreparedSeries
+
+
+def test_column_values_is_a_view_of_float64_columns():
+    df = pd.DataFrame({'a': np.arange(10, dtype=np.float64), 'b': np.arange(10, dtype=np.int64)})
+    values = column_values(df, 'a')
+    assert np.shares_memory(values, df['a'].to_numpy())
+    assert values.flags['C_CONTIGUOUS']
+    assert column_values(df, 'b').dtype == np.float64
+
+
+def test_nan_free_segments():
+    values = np.array([np.nan, 1, 2, np.nan, np.nan, 3, np.inf, 4, 5, 6])
+    assert nan_free_segments(values) == [(1, 3), (5, 6), (7, 10)]
+    assert nan_free_segments(values, min_length=2) == [(1, 3), (7, 10)]
+    assert nan_free_segments(np.full(3, np.nan)) == []
+    assert nan_free_segments(np.ones(3)) == [(0, 3)]
+
+
+def test_distance_profile_keeps_the_positions_of_the_column():
+    rng = np.random.default_rng(0)
+    values = np.cumsum(rng.standard_normal(3000))
+    values[[500, 501, 1700]] = np.nan
+    values[2990:] = np.nan
+    segments = ColumnSegments(pd.DataFrame({'a': values}), 'a')
+    assert segments.segments == [(0, 500), (502, 1700), (1701, 2990)]
+    assert len(segments) == 3000 and segments.longest_segment() == 1289
+
+    m = 50
+    pattern = values[1000:1000 + m]
+    profile = segments.distance_profile(pattern, MassBackend())
+    assert len(profile) == len(values) - m + 1
+
+    # Windows with a missing sample are inf, all other distances equal those within their segment
+    windows = np.lib.stride_tricks.sliding_window_view(values, m)
+    assert (np.isinf(profile) == np.isnan(windows).any(axis=1)).all()
+    for start, end in segments.segments:
+        expected = NaiveBackend().distance_profile(pattern, PreparedSeries(values[start:end]))
+        np.testing.assert_allclose(np.square(profile[start:end - m + 1]), np.square(expected), atol=1e-6)
+    assert np.argmin(profile) == 1000
@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from dataset_catalog import DatasetCatalog, canonical_column, read_recording
+
+
+def test_canonical_column():
+    assert canonical_column('Kea') == 'MAFAC KEA'
+    assert canonical_column('  emag   GT ') == 'EMAG VLC100 GT'
+    assert canonical_column('Unknown') == 'Unknown'
+    assert canonical_column('Press 1', aliases={'PRESS': ['Press 1']}) == 'PRESS'
+
+
+def test_round_trip_across_days(tmp_path):
+    rng = np.random.default_rng(0)
+    # 30 hours starting in the evening, i.e. three daily partitions per machine
+    df = pd.DataFrame({'Kea': rng.uniform(0, 1000, 30 * 3600), 'EMAG GT': rng.uniform(0, 1000, 30 * 3600)})
+    df.loc[100:199, 'EMAG GT'] = np.nan
+    start = pd.Timestamp('2024-04-23 20:00')
+    with DatasetCatalog(str(tmp_path / 'catalog')) as catalog:
+        written = catalog.ingest(df, start)
+        assert sorted(set(day for _, day in written)) == ['2024-04-23', '2024-04-24', '2024-04-25']
+        assert catalog.machines() == ['EMAG VLC100 GT', 'MAFAC KEA']
+        assert catalog.time_range() == (start, start + pd.Timedelta(hours=30))
+
+        stored = catalog.read(['Kea', 'EMAG GT'])
+        assert stored.attrs['start'] == start
+        np.testing.assert_array_equal(stored.to_numpy(), df.to_numpy())
+
+        # A range across the day boundary, read from two partitions
+        window = catalog.read('KEA', start='2024-04-23 23:59:00', end='2024-04-24 00:01:00', time_index=True)
+        np.testing.assert_array_equal(window['MAFAC KEA'].to_numpy(), df['Kea'].to_numpy()[4 * 3600 - 60:4 * 3600 + 60])
+        assert window.index[0] == pd.Timestamp('2024-04-23 23:59:00')
+        last = catalog.read('Kea', last='1h')
+        np.testing.assert_array_equal(last['MAFAC KEA'].to_numpy(), df['Kea'].to_numpy()[-3600:])
+
+        partitions = catalog.partitions('Kea', start='2024-04-24 12:00', end='2024-04-25')
+        assert partitions['day'].tolist() == ['2024-04-24']
+
+
+def test_ingest_merges_with_stored_samples(tmp_path):
+    start = pd.Timestamp('2024-04-23 06:00')
+    with DatasetCatalog(str(tmp_path / 'catalog')) as catalog:
+        catalog.ingest(pd.DataFrame({'Java': np.arange(100.0)}), start)
+        # Later samples extend the partition, missing samples do not overwrite stored ones
+        update = np.full(100, np.nan)
+        update[50:] = -1.0
+        catalog.ingest(pd.DataFrame({'MAFAC JAVA': update}), start + pd.Timedelta(seconds=50))
+        values = catalog.read('Java')['MAFAC JAVA'].to_numpy()
+    np.testing.assert_array_equal(values, np.concatenate((np.arange(100.0), np.full(50, -1.0))))
+
+
+def test_csv_round_trip(tmp_path):
+    csv_path = tmp_path / 'recording.csv'
+    csv_path.write_text("EMAG Y;Kea\n1,5;2\n2,5;\n3,5;4\n", encoding='utf-8')
+    recording = read_recording(str(csv_path))
+    assert list(recording.columns) == ['EMAG VLC100 Y', 'MAFAC KEA']
+    with DatasetCatalog(str(tmp_path / 'catalog')) as catalog:
+        catalog.ingest_csv(str(csv_path), '2024-04-23')
+        stored = catalog.read()
+    pd.testing.assert_frame_equal(stored[recording.columns], recording, check_names=False)
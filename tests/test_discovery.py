@@ -0,0 +1,54 @@
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+import stumpy
+
+from algorithms import MotifFinder
+
+
+def repeated_cycles(n, seed=0):
+    # Idle periods of random length between two kinds of cycles
+    rng = np.random.default_rng(seed)
+    cycles = [np.r_[np.linspace(0, 800, 20), np.full(40, 800.0), np.linspace(800, 0, 20)],
+              np.r_[np.full(30, 300.0), np.full(30, 1200.0), np.full(30, 300.0)]]
+    parts = []
+    while sum(len(part) for part in parts) < n:
+        parts.append(np.full(rng.integers(20, 60), 0.0))
+        parts.append(cycles[rng.integers(2)])
+    return 2000 + np.concatenate(parts)[:n] + rng.normal(0, 5, n)
+
+
+def test_shifted_windows_of_one_region_are_proposed_once():
+    finder = MotifFinder(pd.DataFrame({'M': repeated_cycles(6000)}))
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        candidates = finder.discover_patterns('M', [40, 60, 80], k=3)
+    assert candidates
+    for n, candidate in enumerate(candidates):
+        for other in candidates[:n]:
+            # No candidate window overlaps an occurrence of a better candidate
+            assert all(candidate['input_end'] <= start or start + other['length'] <= candidate['input_start']
+                       for start in other['occurrences'])
+
+
+def test_time_budget_includes_the_setup_on_long_series():
+    # Compile the scrump kernels first, the one-time compilation is not part of the budget
+    stumpy.scrump(np.random.default_rng(0).random(2000), 50, percentage=0.1, pre_scrump=False).update()
+    finder = MotifFinder(pd.DataFrame({'M': repeated_cycles(400000)}))
+    for budget in [1.0, 3.0]:
+        started = time.perf_counter()
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            candidates = finder.discover_patterns('M', [60, 300, 800], time_budget=budget)
+        assert time.perf_counter() - started < budget + 1.0
+        assert candidates
+        assert all(candidate['subsampling'] >= 1 for candidate in candidates)
+
+
+def test_rolling_std_is_accurate_for_large_offsets():
+    rng = np.random.default_rng(0)
+    series = 1e7 + rng.normal(0, 1, 5000)
+    expected = np.lib.stride_tricks.sliding_window_view(series - 1e7, 50).std(axis=1)
+    np.testing.assert_allclose(MotifFinder._rolling_std(series, 50), expected, atol=1e-5)
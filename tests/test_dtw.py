@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+from algorithms import MotifFinder, dtw_match, _dtw_warp, _warping_band
+from matching import z_normalize
+from conftest import NOTEBOOK_PATTERNS
+
+
+def reference_dtw(query, window, r):
+    # Unpruned band-constrained DTW distance of two z-normalized sequences
+    m = len(query)
+    cost = np.full((m + 1, m + 1), np.inf)
+    cost[0, 0] = 0.0
+    for j in range(m):
+        for k in range(max(0, j - r), min(m, j + r + 1)):
+            cost[j + 1, k + 1] = (query[j] - window[k]) ** 2 + min(cost[j, k], cost[j, k + 1], cost[j + 1, k])
+    return np.sqrt(cost[m, m])
+
+
+def test_pruning_keeps_all_matches_below_the_threshold():
+    rng = np.random.default_rng(0)
+    series = np.cumsum(rng.standard_normal(600))
+    pattern = series[100:140] + 0.1 * rng.standard_normal(40)
+    m, r = len(pattern), _warping_band(0.1, m=40)
+    query = z_normalize(pattern)
+    distances = np.array([reference_dtw(query, z_normalize(series[i:i + m]), r)
+                          for i in range(len(series) - m + 1)])
+    threshold = np.quantile(distances, 0.05)
+
+    statistics = {}
+    matches = dtw_match(pattern, series, warping_window=0.1, max_distance=threshold, statistics=statistics)
+    for distance, index in matches:
+        assert distance == pytest.approx(distances[index])
+    # Every window within the threshold is a match or inside the exclusion zone of a better match
+    zone = int(np.ceil(m / 4)) + r
+    for i in np.flatnonzero(distances <= threshold):
+        assert any(abs(i - index) <= zone and distance <= distances[i] + 1e-9 for distance, index in matches)
+    assert statistics['windows'] == len(distances)
+    assert sum(statistics[key] for key in ['lb_kim_pruned', 'lb_keogh_pruned', 'lb_keogh_reversed_pruned',
+                                           'dtw_abandoned', 'dtw_computed']) == len(distances)
+
+
+def test_stretched_cycle_matches_under_dtw():
+    t = np.linspace(0, 1, 100)
+    pattern = np.sin(2 * np.pi * t) + t
+    stretched = np.interp(np.linspace(0, 1, 100), np.linspace(0, 1, 100) ** 1.1, pattern)
+    series = np.concatenate([np.zeros(50), pattern, np.zeros(50), stretched, np.zeros(50)])
+    series += np.random.default_rng(1).normal(0, 0.01, len(series))
+    matches = dtw_match(pattern, series, warping_window=0.1)
+    starts = sorted(int(index) for _, index in matches[:2])
+    assert starts[0] == pytest.approx(50, abs=2)
+    assert starts[1] == pytest.approx(200, abs=2)
+
+
+def test_warp_aligns_a_shifted_window_with_the_pattern():
+    pattern = 500 + 400 * np.sin(np.linspace(0, 4 * np.pi, 80, endpoint=False))
+    identical = _dtw_warp(z_normalize(pattern), pattern[None, :], 8)
+    np.testing.assert_allclose(identical[0], pattern)
+
+    # Two periods shifted by 3 samples: apart from the fixed first and last samples, the warped
+    # window coincides with the pattern
+    shifted = np.roll(pattern, 3)
+    warped = _dtw_warp(z_normalize(pattern), shifted[None, :], 8)[0]
+    np.testing.assert_allclose(warped[1:-3], pattern[1:-3], atol=1e-9)
+    assert np.abs(shifted[1:-3] - pattern[1:-3]).max() > 100
+
+
+@pytest.mark.parametrize('pattern', NOTEBOOK_PATTERNS, ids=lambda p: f"{p[0]} {p[4]} {p[1]}")
+def test_dtw_detects_at_least_as_many_cycles_as_euclidean(sample_data, pattern):
+    detected = {}
+    for method in ['euclidean', 'dtw']:
+        finder = MotifFinder(sample_data)
+        finder.add_pattern(*pattern)
+        detected[method] = len(finder.find_motifs(method=method)[pattern[0]])
+    assert detected['dtw'] >= detected['euclidean'] > 0
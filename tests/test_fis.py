@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+import skfuzzy as fuzz
+
+from FIS import FuzzyControlSystem, FuzzyCombinedSystem, clipped_centroid, membership
+
+FINE_UNIVERSE = np.linspace(0, 1, 10001)
+
+
+def rule_bases(system, combined_system):
+    # (output label, evaluation, number of inputs) of all four rule bases
+    return [
+        ('Priority non-productive energy', system.set_input_P_energy, 2),
+        ('Priority non-productive time', system.set_input_P_time, 2),
+        ('Priority productive energy', system.set_input_P_prod, 3),
+        ('Priority combined energy', combined_system.set_input_P_combined, 3),
+    ]
+
+
+@pytest.fixture(scope='module')
+def systems():
+    return {
+        'exact': (FuzzyControlSystem(exact=True), FuzzyCombinedSystem(exact=True)),
+        'fine': (FuzzyControlSystem(universe=FINE_UNIVERSE), FuzzyCombinedSystem(universe=FINE_UNIVERSE)),
+    }
+
+
+@pytest.mark.parametrize('output', ['Priority non-productive energy', 'Priority non-productive time',
+                                    'Priority productive energy', 'Priority combined energy'])
+def test_clipped_centroid_equals_skfuzzy_defuzz_on_a_fine_universe(systems, output):
+    system, combined_system = systems['exact']
+    points = {**system.membership_points, **combined_system.membership_points}[output]
+    corner_points = np.array(list(points.values()))
+    rng = np.random.default_rng(0)
+    for levels in rng.uniform(0, 1, (50, len(corner_points))) * (rng.uniform(0, 1, (50, len(corner_points))) < 0.6):
+        if not levels.any():
+            continue
+        aggregated = np.max(np.minimum(membership(corner_points.T[:, :, None], FINE_UNIVERSE[None]),
+                                       levels[:, None]), axis=0)
+        expected = fuzz.defuzz(FINE_UNIVERSE, aggregated, 'centroid')
+        assert clipped_centroid(corner_points, levels, 0.0, 1.0) == pytest.approx(expected, abs=1e-6)
+
+
+def test_exact_inference_equals_skfuzzy_on_a_fine_universe(systems):
+    rng = np.random.default_rng(1)
+    exact = rule_bases(*systems['exact'])
+    fine = rule_bases(*systems['fine'])
+    fired = 0
+    for (output, exact_evaluation, n_inputs), (_, fine_evaluation, _) in zip(exact, fine):
+        for values in rng.uniform(0, 1, (10, n_inputs)):
+            try:
+                expected = fine_evaluation(*values)
+            except KeyError:
+                # No rule fires, the exact path raises as well
+                with pytest.raises(KeyError):
+                    exact_evaluation(*values)
+                continue
+            assert exact_evaluation(*values) == pytest.approx(expected, abs=1e-6), output
+            fired += 1
+    assert fired > 20
+
+
+def test_membership_of_shoulders_and_triangles():
+    np.testing.assert_allclose(membership([0, 0, 0.3, 0.4], [0, 0.3, 0.35, 0.4, 0.5]), [1, 1, 0.5, 0, 0])
+    np.testing.assert_allclose(membership([0.2, 0.5, 0.5, 0.8], [0.2, 0.35, 0.5, 0.65, 0.8]), [0, 0.5, 1, 0.5, 0])
+    np.testing.assert_allclose(membership([0.7, 0.9, 1, 1], [0.8, 1]), [0.5, 1])
@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from job_features import FEATURES, job_window_features, flag_deviations, score_job_windows, example_model_path
+
+
+@pytest.fixture
+def recording():
+    rng = np.random.default_rng(0)
+    values = rng.uniform(100, 2000, 5000)
+    values[3000] = np.nan  # Missing samples count as zero energy, as in calculate_EnPIs
+    motif_results = {
+        'A': [(start, 100, 0, 'OP 10') for start in range(0, 2000, 200)] + [(2950, 101, 1, 'OP 20')],
+        'B': [],
+    }
+    return pd.DataFrame({'A': values, 'B': values[::-1]}), motif_results
+
+
+def test_features_equal_the_window_statistics(recording):
+    df, motif_results = recording
+    features = job_window_features(df, motif_results, chunk_elements=300)  # Several chunks per length
+    assert list(features.columns) == ['column', 'job', 'start', 'length', *FEATURES]
+    assert len(features) == len(motif_results['A'])
+
+    for row in features.itertuples():
+        window = df['A'].iloc[row.start:row.start + row.length]
+        pre_check = window.iloc[:int(row.length / 4)]
+        assert row.duration == row.length / 3600
+        assert row.energy == pytest.approx(np.nansum(window) / 3600 / 1000, rel=1e-12)
+        np.testing.assert_allclose([row.mean, row.std, row.peak, row.pre_check_mean, row.pre_check_std],
+                                   [window.mean(skipna=False), window.std(skipna=False), window.max(skipna=False),
+                                    pre_check.mean(), pre_check.std()], rtol=1e-12)
+
+
+def test_flag_deviations():
+    features = pd.DataFrame({'job': ['OP 10'] * 8 + ['OP 20'] * 4,
+                             'energy': [1.0, 1.01, 0.99, 1.02, 0.98, 1.0, 1.01, 2.0, 5.0, 5.1, 4.9, 5.0]})
+    flagged = flag_deviations(features)
+    assert flagged['flagged'].tolist() == [False] * 7 + [True] + [False] * 4
+    assert flagged['expected_energy'].tolist()[:8] == [1.005] * 8
+
+    by_tolerance = flag_deviations(features, expected_energy=np.full(len(features), 1.0), tolerance=0.5)
+    assert by_tolerance['flagged'].tolist() == [False] * 7 + [True] * 5
+
+
+def test_score_job_windows_without_a_model(recording):
+    df, motif_results = recording
+    scored = score_job_windows(df, motif_results)
+    assert not scored['flagged'].any()
+    assert score_job_windows(df, {'B': []}).empty
+
+
+def test_score_job_windows_with_the_pmml_model(recording):
+    pytest.importorskip('pypmml')
+    df, motif_results = recording
+    scored = score_job_windows(df, motif_results, model=example_model_path,
+                               inputs={'Pump pressure in bar': 'mean'})
+    assert np.isfinite(scored['expected_energy']).all()
@@ -0,0 +1,108 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from line_analysis import (LineAnalysis, from_motifs, union, intersection, difference, complement, total_length,
+                           to_frame)
+
+N_SAMPLES = 2000
+
+
+def random_motifs(rng, n_motifs, max_length=120, overlapping=True):
+    starts = np.sort(rng.integers(0, N_SAMPLES - max_length, n_motifs))
+    lengths = rng.integers(1, max_length, n_motifs)
+    if not overlapping:
+        # Motifs of one station after find_motifs never overlap
+        lengths = np.minimum(lengths, np.diff(starts, append=N_SAMPLES))
+        keep = lengths > 0
+        starts, lengths = starts[keep], lengths[keep]
+    return [(int(start), int(length), 0, 'OP') for start, length in zip(starts, lengths)]
+
+
+def mask_of(intervals):
+    mask = np.zeros(N_SAMPLES, dtype=bool)
+    for start, end in zip(*intervals):
+        mask[start:end] = True
+    return mask
+
+
+def intervals_of(mask):
+    # Runs of True as intervals, the reference for the sweeps
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def assert_intervals_equal(intervals, expected):
+    np.testing.assert_array_equal(intervals[0], expected[0])
+    np.testing.assert_array_equal(intervals[1], expected[1])
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_interval_algebra_equals_masks(seed):
+    rng = np.random.default_rng(seed)
+    a, b, c = (from_motifs(random_motifs(rng, int(rng.integers(0, 40)))) for _ in range(3))
+    mask_a, mask_b, mask_c = mask_of(a), mask_of(b), mask_of(c)
+
+    # from_motifs merges overlapping and touching motifs
+    assert_intervals_equal(a, intervals_of(mask_a))
+    assert_intervals_equal(union(a, b, c), intervals_of(mask_a | mask_b | mask_c))
+    assert_intervals_equal(intersection(a, b, c), intervals_of(mask_a & mask_b & mask_c))
+    assert_intervals_equal(difference(a, b), intervals_of(mask_a & ~mask_b))
+    assert_intervals_equal(complement(a, 0, N_SAMPLES), intervals_of(~mask_a))
+    assert total_length(union(a, b)) == (mask_a | mask_b).sum()
+    assert to_frame(a)['duration'].sum() == mask_a.sum()
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_line_indicators_equal_masks(seed):
+    rng = np.random.default_rng(seed)
+    stations = ['A', 'B', 'C']
+    motif_results = {station: random_motifs(rng, 25, overlapping=False) for station in stations}
+    analysis = LineAnalysis(motif_results, stations=stations, n_samples=N_SAMPLES)
+    busy = {station: mask_of(from_motifs(motifs)) for station, motifs in motif_results.items()}
+
+    starved = {'A': np.zeros(N_SAMPLES, bool), 'B': ~busy['B'] & busy['A'], 'C': ~busy['C'] & busy['B']}
+    blocked = {'A': ~busy['A'] & busy['B'], 'B': ~busy['B'] & busy['C'] & ~busy['A'], 'C': np.zeros(N_SAMPLES, bool)}
+    table = analysis.station_table()
+    for station in stations:
+        assert_intervals_equal(analysis.starved(station), intervals_of(starved[station]))
+        assert_intervals_equal(analysis.blocked(station), intervals_of(blocked[station]))
+        assert table.loc[station, 'busy_time'] == pytest.approx(busy[station].sum() / 3600)
+        assert table.loc[station, 'other_idle_time'] == pytest.approx(
+            (~busy[station] & ~starved[station] & ~blocked[station]).sum() / 3600)
+
+    all_idle = ~(busy['A'] | busy['B'] | busy['C'])
+    line = analysis.line_table()
+    assert line['all_idle_time'] == pytest.approx(all_idle.sum() / 3600)
+    assert line['all_busy_time'] == pytest.approx((busy['A'] & busy['B'] & busy['C']).sum() / 3600)
+    idle_starts, idle_ends = intervals_of(all_idle)
+    assert line['all_idle_periods'] == len(idle_starts)
+    assert line['longest_all_idle_period'] == pytest.approx((idle_ends - idle_starts).max(initial=0) / 3600)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_concurrent_load_equals_masks(seed):
+    rng = np.random.default_rng(seed)
+    stations = ['A', 'B', 'C']
+    motif_results = {station: random_motifs(rng, 25, overlapping=False) for station in stations}
+    power = {station: rng.uniform(100, 1000, N_SAMPLES) for station in stations}
+    analysis = LineAnalysis(motif_results, stations=stations, df=pd.DataFrame(power))
+
+    running = np.zeros(N_SAMPLES, dtype=np.int64)
+    line_power = np.zeros(N_SAMPLES)
+    for station, motifs in motif_results.items():
+        for start, length, _, _ in motifs:
+            running[start:start + length] += 1
+            line_power[start:start + length] += power[station][start:start + length].mean()
+
+    positions, stations_running, estimated_power = analysis.concurrent_load()
+    for position, next_position, count, level in zip(positions[:-1], positions[1:], stations_running,
+                                                     estimated_power):
+        assert (running[position:next_position] == count).all()
+        np.testing.assert_allclose(line_power[position:next_position], level, atol=1e-6)
+
+    peaks = analysis.concurrent_peaks(min_stations=2)
+    peak_starts, peak_ends = intervals_of(running >= 2)
+    np.testing.assert_array_equal(peaks['start'], peak_starts)
+    np.testing.assert_array_equal(peaks['end'], peak_ends)
+    assert peaks['stations'].tolist() == [running[start:end].max() for start, end in zip(peak_starts, peak_ends)]
@@ -0,0 +1,102 @@
+import numpy as np
+import pytest
+import stumpy
+
+from algorithms import MotifFinder
+from matching import (MatchingEngine, PreparedSeries, StumpyBackend, MassBackend, NaiveBackend, fast_fft_length,
+                      find_matches)
+from synthetic import generate_power_traces
+
+BACKENDS = [StumpyBackend(), MassBackend(), NaiveBackend()]
+
+
+def idle_and_cycles(seed, n_samples=5000):
+    # Random walk with flat idle periods, whose windows are constant
+    rng = np.random.default_rng(seed)
+    values = np.cumsum(rng.standard_normal(n_samples)) + 1000
+    values[1000:1400] = 800.0
+    values[3000:3100] = 800.0
+    return values
+
+
+@pytest.mark.parametrize('seed', range(3))
+@pytest.mark.parametrize('m', [16, 70, 333])
+def test_backends_compute_the_same_distance_profile(seed, m):
+    values = idle_and_cycles(seed)
+    series = PreparedSeries(values)
+    pattern = values[2000:2000 + m] * 1.5 + 3
+    reference = NaiveBackend().distance_profile(pattern, series)
+    for backend in BACKENDS:
+        # Squared distances: near an exact match the square root amplifies the rounding errors
+        np.testing.assert_allclose(np.square(backend.distance_profile(pattern, series)), np.square(reference),
+                                   atol=1e-6)
+
+    # A constant pattern matches the constant windows exactly, and nothing else
+    constant = np.full(m, 5.0)
+    reference = NaiveBackend().distance_profile(constant, series)
+    for backend in BACKENDS:
+        np.testing.assert_allclose(backend.distance_profile(constant, series), reference)
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_matches_equal_stumpy_match(seed):
+    values = idle_and_cycles(seed)
+    pattern = values[2000:2100]
+    expected = stumpy.match(pattern, values)
+    for backend in BACKENDS:
+        matches = backend.match(pattern, PreparedSeries(values))
+        assert matches[:, 1].tolist() == expected[:, 1].tolist()
+        np.testing.assert_allclose(np.square(matches[:, 0].astype(float)), np.square(expected[:, 0].astype(float)),
+                                   atol=1e-6)
+
+
+def test_find_matches_keeps_the_exclusion_zone():
+    profile = np.array([0.0, 0.1, 0.2, 5.0, 5.0, 0.3, 5.0, 5.0, 5.0, np.inf])
+    matches = find_matches(profile, 8, max_distance=1.0)
+    assert matches[:, 1].tolist() == [0, 5]
+    assert find_matches(profile, 8, max_distance=1.0, max_matches=1)[:, 1].tolist() == [0]
+    assert find_matches(np.full(5, np.inf), 8).shape == (0, 2)
+
+
+def test_fast_fft_length_is_the_smallest_even_5_smooth_length():
+    def smooth(k):
+        for prime in (2, 3, 5):
+            while k % prime == 0:
+                k //= prime
+        return k == 1
+
+    for n in range(1, 3000):
+        expected = next(k for k in range(max(n, 2), 4 * n + 2) if k % 2 == 0 and smooth(k))
+        assert fast_fft_length(n) == expected
+
+
+def test_find_motifs_is_independent_of_the_backend():
+    df, _, patterns = generate_power_traces(30000, n_machines=3)
+    results = {}
+    for backend in ('stumpy', 'mass', 'naive', 'auto'):
+        finder = MotifFinder(df, engine=MatchingEngine(backend=backend))
+        for pattern in patterns:
+            finder.add_pattern(*pattern)
+        results[backend] = finder.find_motifs()
+    assert sum(len(motifs) for motifs in results['naive'].values()) > 0
+    for backend in ('stumpy', 'mass', 'auto'):
+        assert results[backend] == results['naive']
+
+
+def test_calibration_round_trip(tmp_path):
+    engine = MatchingEngine(repeats=1)
+    timings = engine.calibrate([64, 256], [4096])
+    assert set(timings) == {(64, 4096), (256, 4096)}
+    assert all(set(backends) <= {'mass', 'stumpy'} for backends in timings.values())
+
+    path = str(tmp_path / 'calibration.json')
+    engine.save_calibration(path)
+    loaded = MatchingEngine(calibration=path)
+    assert loaded.calibration == engine.calibration
+    loaded.on_the_fly = False
+    # Far from every calibrated combination, the nearest one is used instead of calibrating again
+    assert loaded.select(64, 1 << 20).name == engine.calibration[(6, 12)]
+    assert loaded.calibration == engine.calibration
+
+    with pytest.raises(ValueError):
+        MatchingEngine(backend='fft')
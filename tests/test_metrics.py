@@ -0,0 +1,89 @@
+import json
+import tracemalloc
+
+import numpy as np
+import pytest
+
+from algorithms import MotifFinder
+from metrics import Metrics, InMemorySink, JsonLinesSink, PrometheusTextSink, disabled_metrics
+from synthetic import generate_power_traces
+
+
+def test_stages_and_counters_reach_the_sink():
+    sink = InMemorySink()
+    metrics = Metrics(sink)
+    with metrics.stage('match', column='A'):
+        metrics.count('motif_candidates', 3, column='A')
+    with pytest.raises(ZeroDivisionError):
+        with metrics.stage('filter'):
+            1 / 0
+
+    counter, match, failed = sink.records
+    assert counter['type'] == 'counter' and counter['value'] == 3 and counter['labels'] == {'column': 'A'}
+    assert match['type'] == 'stage' and match['name'] == 'match' and match['seconds'] >= 0
+    assert match['peak_memory_bytes'] is None
+    assert failed['name'] == 'filter'  # Stages that raise are recorded too
+
+
+def test_nested_stages_report_the_peak_of_their_children():
+    was_tracing = tracemalloc.is_tracing()
+    sink = InMemorySink()
+    metrics = Metrics(sink, memory=True)
+    try:
+        with metrics.stage('outer'):
+            with metrics.stage('inner'):
+                block = np.ones(1 << 20)  # 8 MiB
+                del block
+    finally:
+        if not was_tracing:
+            tracemalloc.stop()
+    inner, outer = sink.records
+    assert inner['peak_memory_bytes'] >= 8 << 20
+    assert outer['peak_memory_bytes'] >= inner['peak_memory_bytes']
+
+
+def test_disabled_metrics_emit_nothing():
+    assert not disabled_metrics.enabled
+    with disabled_metrics.stage('match'):
+        disabled_metrics.count('motif_candidates', 3)
+    disabled_metrics.flush()
+
+
+def test_file_sinks(tmp_path):
+    json_path = str(tmp_path / 'metrics.jsonl')
+    prom_path = str(tmp_path / 'metrics.prom')
+    for sink in (JsonLinesSink(json_path), PrometheusTextSink(prom_path)):
+        with Metrics(sink) as metrics:
+            for _ in range(2):
+                with metrics.stage('match', column='EMAG "Y"'):
+                    metrics.count('motif_candidates', 5, column='EMAG "Y"')
+
+    records = [json.loads(line) for line in open(json_path, encoding='utf-8')]
+    assert [record['type'] for record in records] == ['counter', 'stage'] * 2
+
+    lines = open(prom_path, encoding='utf-8').read().splitlines()
+    assert 'es4ee_motif_candidates_total{column="EMAG \\"Y\\""} 10' in lines
+    assert 'es4ee_stage_calls_total{column="EMAG \\"Y\\"",stage="match"} 2' in lines
+
+
+def test_find_motifs_funnel_adds_up():
+    df, _, patterns = generate_power_traces(20000, n_machines=2)
+    sink = InMemorySink()
+    finder = MotifFinder(df, metrics=Metrics(sink))
+    for pattern in patterns:
+        finder.add_pattern(*pattern)
+    motif_results = finder.find_motifs()
+
+    counters = {}
+    for record in sink.records:
+        if record['type'] == 'counter':
+            key = (record['name'], record['labels']['column'])
+            counters[key] = counters.get(key, 0) + record['value']
+    stages = {record['name'] for record in sink.records if record['type'] == 'stage'}
+    assert {'load', 'match', 'filter', 'overlap_resolution'} <= stages
+
+    for column, motifs in motif_results.items():
+        assert counters[('motif_candidates', column)] == (counters[('motif_rejected_pre_check', column)]
+                                                          + counters[('motif_rejected_mean_std', column)]
+                                                          + counters[('motif_accepted', column)])
+        assert counters[('motif_accepted', column)] - counters[('motif_dropped_overlap', column)] == len(motifs)
@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+
+from algorithms import Template, TemplateLibrary
+from replay import ReplayServer, ReplayHarness, replay_node_ids
+from synthetic import generate_power_traces
+
+
+def test_replay_node_ids():
+    node_ids = replay_node_ids(['EMAG Y', 'Kea'], machines=2, configured=['ns=4;s=Line.EMAG', 'ns=4;s=Line.Kea',
+                                                                       'ns=4;s=Line.EMAG2'])
+    assert node_ids == [['ns=4;s=Line.EMAG', 'ns=4;s=Line.Kea'],
+                        ['ns=4;s=Line.EMAG2', 'ns=4;s=Replay.Machine2.Kea']]
+    assert replay_node_ids(['A'], configured=[]) == [['ns=1;s=Replay.Machine1.A']]
+
+
+def test_subscriptions_receive_every_sample_in_order():
+    df = pd.DataFrame({'A': np.arange(1000.0), 'B': -np.arange(1000.0)})
+    server = ReplayServer(df, machines=2, speedup=20000, publishing_interval=0.005)
+    node_ids = server.browse()
+    assert len(node_ids) == 4
+    subscription = server.subscribe(node_ids)
+    small = server.subscribe(node_ids[:1], queue_size=10)
+    server.start()
+    server.join()
+
+    messages = subscription.collect()
+    assert [first for first, _, _ in messages] == np.cumsum([0] + [len(values) for _, values, _ in messages])[:-1].tolist()
+    values = np.concatenate([values for _, values, _ in messages])
+    # The second machine replays the recording shifted by half its length
+    shifted = np.roll(np.arange(1000.0), -500)
+    np.testing.assert_array_equal(values, np.column_stack((np.arange(1000.0), -np.arange(1000.0),
+                                                           shifted, -shifted)))
+    assert server.read(node_ids[0]) == 999.0
+
+    # A full queue discards the oldest samples
+    kept = small.collect()
+    assert sum(len(values) for _, values, _ in kept) == 10
+    assert small.dropped == 990
+    assert kept[-1][1][-1, 0] == 999.0
+    assert subscription.collect() == [] and subscription.closed
+
+
+def test_harness_ingests_and_detects_all_samples():
+    df, _, patterns = generate_power_traces(6000, n_machines=2)
+    library = TemplateLibrary([Template(column, job, threshold, df[column].to_numpy()[start:end])
+                               for column, start, end, threshold, job in patterns])
+    harness = ReplayHarness(df, library, machines=2, speedup=50000, window_length=3600, analysis_step=1000,
+                            publishing_interval=0.01)
+    results = harness.run()
+    assert results['published_samples'] == results['ingested_samples'] == 2 * 2 * len(df)
+    assert results['dropped_samples'] == 0 and results['excluded_latencies'] == 0
+    assert results['detected_cycles'] > 0
+    assert 0 <= results['latency_p50'] <= results['latency_p95'] <= results['latency_max']
+    for received in harness.received:
+        assert received.all()
@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from EnPIs import calculate_EnPI_results
+from results_store import ResultsStore
+
+MOTIF_RESULTS = {
+    'Machine A': [(10, 20, 0, 'OP 10'), (50, 20, 0, 'OP 10'), (80, 15, 1, 'OP 20')],
+    'Machine B': [(0, 30, 2, 'OP 30')],
+}
+
+
+@pytest.fixture
+def results():
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({'Machine A': rng.uniform(100, 2000, 120), 'Machine B': rng.uniform(100, 2000, 120)})
+    job_dataframes = {column: df[[column]] for column in df.columns}
+    # OP 30 has no part count, so its part energy is undefined
+    return calculate_EnPI_results(job_dataframes, MOTIF_RESULTS, {'OP_10_parts': 1, 'OP_20_parts': 2})
+
+
+def test_run_round_trip(tmp_path, results):
+    priorities = {'Machine A': {'P_e_np': 0.4, 'P_t_np': 0.7}, 'OP 10': {'P_e_p': 0.2}}
+    with ResultsStore(str(tmp_path / 'results.sqlite')) as store:
+        assert store.load_run() is None
+        run_id = store.write_run(results, MOTIF_RESULTS, priorities, metadata={'source': 'test'})
+        run = store.load_run()
+
+    assert run['run_id'] == run_id
+    assert run['metadata'] == {'source': 'test'}
+    assert run['motif_results'] == MOTIF_RESULTS
+    assert run['priorities'] == priorities
+    pd.testing.assert_frame_equal(run['results'].machines, results.machines)
+    pd.testing.assert_frame_equal(run['results'].jobs, results.jobs)
+    assert np.isnan(run['results'].jobs.loc['OP 30', 'average_part_energy'])
+    assert run['results'].job_energies == results.job_energies
+
+
+def test_queries_over_runs(tmp_path, results):
+    with ResultsStore(str(tmp_path / 'results.sqlite')) as store:
+        first = store.write_run(results, MOTIF_RESULTS)
+        second = store.write_run(results)
+        assert store.runs().index.tolist() == [first, second]
+        assert store.runs(since='2000-01-01', until='2000-12-31').empty
+
+        history = store.query_machine('Machine A', metrics=['NPEF', 'UTR'])
+        assert history.index.get_level_values('run_id').tolist() == [first, second]
+        assert list(history.columns) == ['NPEF', 'UTR']
+        assert history['NPEF'].tolist() == [results.machines.loc['Machine A', 'NPEF']] * 2
+        assert store.query_job('OP 10')['count'].tolist() == [2, 2]
+
+        motifs = store.query_motifs(machine='Machine A', start=45, end=81)
+        assert motifs['start'].tolist() == [50, 80]
+        assert store.query_motifs(job='OP 30', run_id=second).empty
+        assert store.load_run(first)['motif_results'] == MOTIF_RESULTS
@@ -0,0 +1,95 @@
+import json
+import threading
+import urllib.request
+import urllib.error
+from http.server import ThreadingHTTPServer
+
+import numpy as np
+import pytest
+
+from algorithms import MotifFinder, Template, TemplateLibrary
+from EnPIs import calculate_EnPI_results
+from FIS import FuzzyControlSystem
+from scoring_service import ScoringService, _RequestHandler
+from synthetic import generate_power_traces
+
+
+@pytest.fixture(scope='module')
+def line():
+    df, _, patterns = generate_power_traces(20000, n_machines=2)
+    library = TemplateLibrary([Template(column, job, threshold, df[column].to_numpy()[start:end])
+                               for column, start, end, threshold, job in patterns])
+    service = ScoringService(library, models_path=None, workers=2)
+    return df, patterns, service
+
+
+def test_analyze_equals_find_motifs(line):
+    df, patterns, service = line
+    machine = patterns[0][0]
+    window = df[machine].to_numpy()[5000:15000]
+    result = service.analyze(machine, window.tolist(), start=5000)
+
+    finder = MotifFinder(df[[machine]].iloc[5000:15000].reset_index(drop=True))
+    finder.add_templates(TemplateLibrary([template for template in service.library if template.column == machine]))
+    motif_results = finder.find_motifs()
+    expected = calculate_EnPI_results(finder.create_jobs_dataframe(motif_results), motif_results, {})
+
+    assert [(motif['start'], motif['length'], motif['job']) for motif in result['motifs']] == \
+           [(5000 + start, length, job) for start, length, _, job in motif_results[machine]]
+    assert result['machine_enpis']['NPEF'] == pytest.approx(expected.machines.loc[machine, 'NPEF'])
+    assert set(result['job_enpis']) == set(expected.jobs.index)
+    with pytest.raises(ValueError):
+        service.analyze('Unknown machine', window.tolist())
+
+
+def test_score_equals_the_fuzzy_systems(line):
+    _, _, service = line
+    scores = service.score(machines={'M': {'NPEF': 0.8, 'NPTF': 0.6, 'UTR': 0.3}},
+                           jobs={'OP 10': {'average_energy': 0.7, 'count': 0.4, 'energy_variance': 0.2}},
+                           combined=[['M', 'OP 10']])
+    fuzzy_system = FuzzyControlSystem()
+    assert scores['priorities']['M']['P_e_np'] == pytest.approx(float(fuzzy_system.set_input_P_energy(0.8, 0.6)))
+    assert scores['priorities']['M']['P_t_np'] == pytest.approx(float(fuzzy_system.set_input_P_time(0.6, 0.3)))
+    assert scores['priorities']['OP 10']['P_e_p'] == pytest.approx(
+        float(fuzzy_system.set_input_P_prod(0.7, 0.4, 0.2)))
+    assert scores['combined'][0]['machine'] == 'M'
+    with pytest.raises(ValueError):
+        service.score(combined=[['M', 'OP 10']])
+    with pytest.raises(ValueError):
+        service.predict('Unknown model', [{}])
+
+
+def test_http_api(line):
+    df, patterns, service = line
+    service.warm_up(series_length=4096)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), type('RequestHandler', (_RequestHandler,), {'service': service}))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://127.0.0.1:{server.server_port}"
+
+    def post(path, body):
+        request = urllib.request.Request(url + path, json.dumps(body).encode('utf-8'),
+                                         {'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status, json.loads(response.read())
+        except urllib.error.HTTPError as error:
+            return error.code, json.loads(error.read())
+
+    try:
+        with urllib.request.urlopen(url + '/health') as response:
+            health = json.loads(response.read())
+        assert health['warm'] and health['templates'] == len(patterns)
+
+        machine = patterns[0][0]
+        values = df[machine].to_numpy()[:8000]
+        status, body = post('/analyze', {'machine': machine, 'values': values.tolist()})
+        assert status == 200
+        assert body['result'] == json.loads(json.dumps(service.analyze(machine, values)))
+
+        assert post('/analyze', {'machine': 'Unknown machine', 'values': []})[0] == 400
+        assert post('/analyze', {'unexpected': 1})[0] == 400
+        assert post('/unknown', {})[0] == 404
+    finally:
+        server.shutdown()
+        server.server_close()
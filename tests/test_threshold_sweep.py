@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from algorithms import MotifFinder
+from threshold_sweep import ThresholdSweep
+from bench_threshold_sweep import serial_sweep
+from synthetic import generate_power_traces
+
+
+@pytest.fixture(scope='module')
+def synthetic_sweep():
+    df, _, patterns = generate_power_traces(20000, n_machines=3)
+    finder = MotifFinder(df)
+    op_counts = {}
+    for pattern in patterns:
+        finder.add_pattern(*pattern)
+        op_counts[f"{pattern[4].replace(' ', '_')}_parts"] = 1
+    return df, patterns, ThresholdSweep(finder), op_counts
+
+
+def test_run_equals_the_serial_loop(synthetic_sweep):
+    _, _, sweep, op_counts = synthetic_sweep
+    thresholds = np.round(np.linspace(0.05, 0.95, 19), 2).tolist()
+    results = sweep.run(thresholds, op_counts)
+    motifs, counts, enpis = serial_sweep(sweep, thresholds, op_counts)
+
+    assert results.motifs == motifs
+    assert results.counts.to_dict(orient='index') == counts
+    for threshold in thresholds:
+        pd.testing.assert_frame_equal(results.enpis[threshold].machines, enpis[threshold].machines)
+        pd.testing.assert_frame_equal(results.enpis[threshold].jobs, enpis[threshold].jobs)
+        assert results.enpis[threshold].job_energies == enpis[threshold].job_energies
+
+
+def test_motifs_equal_find_motifs(synthetic_sweep):
+    df, patterns, sweep, _ = synthetic_sweep
+    assert sweep.motifs({}) == sweep.finder.find_motifs()
+
+    # A threshold per job, the other jobs keep their registered threshold
+    job = patterns[0][4]
+    finder = MotifFinder(df)
+    for column, start, end, threshold, pattern_job in patterns:
+        finder.add_pattern(column, start, end, 0.6 if pattern_job == job else threshold, pattern_job)
+    assert sweep.motifs({job: 0.6}) == finder.find_motifs()
+    assert sweep.run([{job: 0.6}], enpis=False).motifs[0] == finder.find_motifs()